@@ -0,0 +1,120 @@
+"""对比旧的 os.walk + relative_posix 扫描与基于 os.scandir 的记录扫描的耗时和系统调用数。"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.localfile import iter_file_records, iter_files_sorted, relative_posix
+
+MODES = ("legacy", "records")
+
+
+def build_tree(root: Path, files: int, per_directory: int) -> None:
+    """生成 剧集/季/文件 三层结构的测试目录。"""
+    for index in range(files):
+        directory = root / f"show{index // (per_directory * 10):05d}" / f"season{index // per_directory % 10:02d}"
+        if index % per_directory == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"episode{index:07d}.mkv").touch()
+
+
+def scan(mode: str, root: Path) -> int:
+    """按指定方式扫描，返回文件数。"""
+    count = 0
+    if mode == "legacy":
+        for file_path in iter_files_sorted(root):
+            relative_posix(file_path, root)
+            file_path.stat()
+            count += 1
+    else:
+        for _record in iter_file_records(root):
+            count += 1
+    return count
+
+
+def _strace_counts(mode: str, root: Path) -> Optional[Dict[str, int]]:
+    """在 strace -c 下重跑一次扫描，返回各系统调用次数；没有 strace 时返回 None。"""
+    strace = shutil.which("strace")
+    if strace is None:
+        return None
+    with tempfile.NamedTemporaryFile("r", suffix=".strace") as output:
+        subprocess.run(
+            [strace, "-f", "-c", "-o", output.name, sys.executable, __file__, "--mode", mode, "--root", str(root)],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        counts: Dict[str, int] = {}
+        for line in output.read().splitlines():
+            fields = line.split()
+            # 行格式: % time  seconds  usecs/call  calls  [errors]  syscall
+            if len(fields) >= 5 and fields[0][0].isdigit() and fields[-1] != "total":
+                counts[fields[-1]] = int(fields[3])
+        return counts
+
+
+def _baseline_counts() -> Optional[Dict[str, int]]:
+    # 解释器启动本身的系统调用，在对比时扣除
+    empty = Path(tempfile.mkdtemp())
+    try:
+        return _strace_counts("records", empty)
+    finally:
+        empty.rmdir()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="本地扫描基准测试")
+    parser.add_argument("--root", help="已有的测试目录；不指定时在临时目录中生成")
+    parser.add_argument("--files", type=int, default=100_000, help="生成的文件数，默认 100000")
+    parser.add_argument("--per-directory", type=int, default=50, help="每个目录的文件数，默认 50")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        # strace 调用的子进程：只扫描，不输出
+        scan(args.mode, Path(args.root))
+        return 0
+
+    workdir: Optional[Path] = None
+    if args.root:
+        root = Path(args.root).resolve()
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="bench_scan_"))
+        root = workdir / "tree"
+        root.mkdir()
+        print(f"生成测试目录 {root}: {args.files} 个文件 ...")
+        build_tree(root, args.files, args.per_directory)
+
+    try:
+        baseline = _baseline_counts()
+        for mode in MODES:
+            start = time.perf_counter()
+            count = scan(mode, root)
+            elapsed = time.perf_counter() - start
+            line = f"{mode:8s} {count} 个文件，用时 {elapsed:.2f}s"
+            counts = _strace_counts(mode, root)
+            if counts is not None and baseline is not None:
+                total = sum(counts.values()) - sum(baseline.values())
+                detail = ", ".join(
+                    f"{name}={calls - baseline.get(name, 0)}"
+                    for name, calls in sorted(counts.items(), key=lambda item: -item[1])
+                    if calls - baseline.get(name, 0) > count // 100
+                )
+                line += f"，系统调用 {total} 次（{total / max(count, 1):.1f}/文件: {detail}）"
+            print(line)
+        if baseline is None:
+            print("未找到 strace，仅比较耗时。")
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""根据一次递归列出生成远端路径索引，供 remove_local.py 等脚本快速判断文件是否已在远端。"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from src.rclone_client import RcloneClient
+from src.remote_index import RemotePathIndex, write_index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="生成远端路径索引（lsjson -R --fast-list）")
+    parser.add_argument("--remote", help="rclone 远端名称，默认使用 RCLONE_REMOTE")
+    parser.add_argument("--root", default="/", help="需要建立索引的远端根目录，默认整个远端")
+    parser.add_argument("--output", help="索引文件路径，默认 REMOTE_INDEX_DIR/<remote>.idx")
+    args = parser.parse_args(argv)
+
+    try:
+        client = RcloneClient()
+    except ValueError as exc:
+        print(f"初始化失败: {exc}")
+        return 1
+
+    remote = args.remote or client.remote
+    output = args.output or client.index_path(remote)
+    root = "/" + args.root.replace("\\", "/").strip("/")
+
+    print(f"开始列出远端 {remote}:{root} ...")
+    start = time.time()
+    try:
+        count = write_index(output, remote, root, client.iter_remote_files(root, remote=remote))
+    except RuntimeError as exc:
+        print(f"生成索引失败: {exc}")
+        return 1
+
+    index = RemotePathIndex(output)
+    size_mb = index.path.stat().st_size / 1024 / 1024
+    index.close()
+    print(f"索引完成: {count} 个文件，写入 {output}（{size_mb:.1f} MB），用时 {time.time() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,20 +2,29 @@
 
 from __future__ import annotations
 
+import argparse
 import os
 import sys
-from typing import List, Tuple
+from itertools import groupby
+from pathlib import Path, PurePosixPath
+from typing import List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 
 from src.localfile import (
+    FileRecord,
     ensure_directory,
-    iter_files_sorted,
-    relative_posix,
+    iter_file_records,
+    open_hash_cache,
+    prune_empty_parents,
     remove_empty_directories,
     remove_file,
 )
 from src.rclone_client import RcloneClient
+from src.rclone_rc import create_client
+from src.scan_cache import DirectoryCache, open_scan_cache
+from src.uploader import UploadTask
+from src.verify import RemoteVerifier
 
 
 def _split_env_values(raw_value: str) -> List[str]:
@@ -60,6 +69,14 @@ def _normalize_remote_root(remote_root: str) -> str:
     return normalized
 
 
+def _split_remote_root(remote_root: str, default_remote: str) -> Tuple[str, str]:
+    """拆分 ``remote:/path`` 形式的远端根，未指定远端名时使用默认远端。"""
+    head, sep, tail = remote_root.partition(":")
+    if sep and head and "/" not in head and "\\" not in head:
+        return head.strip(), tail
+    return default_remote, remote_root
+
+
 def load_directory_pairs() -> List[Tuple[str, str]]:
     """Return (local_dir, remote_root) pairs based on environment variables."""
     pairs: List[Tuple[str, str]] = []
@@ -94,7 +111,12 @@ def load_directory_pairs() -> List[Tuple[str, str]]:
     return []
 
 
-def main() -> int:
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="校验远端文件后删除本地文件")
+    parser.add_argument("--refresh", action="store_true", help="忽略持久化的远端目录缓存，强制重新列出")
+    parser.add_argument("--full-clean", action="store_true", help="遍历整个目录树清理空目录，而不只是删除过文件的路径")
+    args = parser.parse_args(argv)
+
     load_dotenv()
 
     directory_pairs = load_directory_pairs()
@@ -104,11 +126,82 @@ def main() -> int:
         return 1
 
     try:
-        client = RcloneClient()
-    except ValueError as exc:
+        client = create_client()
+    except (ValueError, RuntimeError) as exc:
         print(f"初始化失败: {exc}")
         return 1
 
+    client.listing_cache.refresh = args.refresh
+    scan_cache = open_scan_cache()
+    # REMOTE_VERIFY=hash 时按目录列出远端摘要并与本地比较；否则只核对文件名与大小
+    verifier = None
+    if os.getenv("REMOTE_VERIFY", "size").strip().lower() == "hash":
+        verifier = RemoteVerifier(client, open_hash_cache(), mode="hash")
+    try:
+        with client:
+            return _remove_uploaded(
+                client, directory_pairs, scan_cache, verifier=verifier, full_clean=args.full_clean
+            )
+    finally:
+        if scan_cache is not None:
+            scan_cache.close()
+        if verifier is not None:
+            for line in verifier.report():
+                print(line)
+            verifier.cache.close()
+
+
+def _check_remote(
+    client: RcloneClient,
+    verifier: RemoteVerifier | None,
+    remote: str,
+    remote_root: str,
+    records: List[FileRecord],
+) -> List[Tuple[FileRecord, str, Optional[str]]]:
+    """
+    核对同一本地目录下的文件，返回 (记录, 远端路径, 保留原因)；保留原因为 None 表示可以删除。
+
+    同一本地目录对应同一远端目录，启用摘要校验时整个目录只列出一次。
+    """
+    checks: List[Tuple[FileRecord, str, Optional[str]]] = []
+    for record in records:
+        if remote_root == "/":
+            remote_path = f"/{record.relative}"
+        else:
+            remote_path = f"{remote_root}/{record.relative}"
+        checks.append((record, remote_path, None))
+    if verifier is not None:
+        tasks = [
+            UploadTask(record.path, remote, remote_path, size=record.size, mtime_ns=record.mtime_ns)
+            for record, remote_path, _ in checks
+        ]
+        directory = str(PurePosixPath(checks[0][1]).parent)
+        errors = verifier.check_directory(remote, directory, tasks)
+        return [
+            (record, remote_path, None if error is None else f"校验未通过，保留本地文件 {record.path}: {error}")
+            for (record, remote_path, _), error in zip(checks, errors)
+        ]
+    results: List[Tuple[FileRecord, str, Optional[str]]] = []
+    for record, remote_path, _ in checks:
+        try:
+            exists = client.remote_file_exists(remote_path, remote=remote, size=record.size)
+        except (OSError, RuntimeError) as exc:
+            results.append((record, remote_path, f"校验失败，保留本地文件 {record.path}: {exc}"))
+            continue
+        reason = None if exists else f"远端未找到文件或大小不一致，保留本地文件: {record.path}"
+        results.append((record, remote_path, reason))
+    return results
+
+
+def _remove_uploaded(
+    client: RcloneClient,
+    directory_pairs: List[Tuple[str, str]],
+    scan_cache: DirectoryCache | None = None,
+    *,
+    verifier: RemoteVerifier | None = None,
+    full_clean: bool = False,
+) -> int:
+    """逐个映射校验远端文件并删除本地副本。"""
     total_processed = 0
     total_removed = 0
     total_cleaned_dirs = 0
@@ -120,45 +213,49 @@ def main() -> int:
             print(f"跳过目录 {source_dir}: {exc}")
             continue
 
+        remote, remote_root = _split_remote_root(remote_root, client.remote)
         normalized_remote_root = _normalize_remote_root(remote_root)
-        print(f"处理目录: {base_path} -> 远端根 {normalized_remote_root}")
+        print(f"处理目录: {base_path} -> 远端根 {remote}:{normalized_remote_root}")
 
         processed = 0
         removed = 0
-
-        for file_path in iter_files_sorted(base_path):
-            relative_remote = relative_posix(file_path, base_path)
-            if normalized_remote_root == "/":
-                remote_path = f"/{relative_remote}"
-            else:
-                remote_path = f"{normalized_remote_root}/{relative_remote}"
-
-            processed += 1
-            total_processed += 1
-            print(f"检查 {file_path} -> {remote_path}")
-            try:
-                exists = client.remote_file_exists(remote_path)
-            except RuntimeError as exc:
-                print(f"校验失败，保留本地文件 {file_path}: {exc}")
-                continue
-
-            if exists:
+        touched_dirs: Set[Path] = set()
+
+        if scan_cache is not None:
+            scan_cache.reset_stats()
+
+        records = iter_file_records(base_path, scan_cache)
+        for _, group in groupby(records, key=lambda record: record.path.parent):
+            for record, remote_path, reason in _check_remote(
+                client, verifier, remote, normalized_remote_root, list(group)
+            ):
+                file_path = record.path
+                processed += 1
+                total_processed += 1
+                print(f"检查 {file_path} -> {remote_path}")
+                if reason is not None:
+                    print(reason)
+                    continue
                 try:
                     remove_file(file_path)
+                    touched_dirs.add(file_path.parent)
                     removed += 1
                     total_removed += 1
                     print(f"远端存在，已删除本地文件: {file_path}")
                 except (FileNotFoundError, IsADirectoryError) as exc:
                     print(f"删除本地文件失败 {file_path}: {exc}")
-            else:
-                print(f"远端未找到文件，保留本地文件: {file_path}")
 
         if processed == 0:
             print(f"目录 {base_path} 中未找到需要处理的文件。")
         else:
             print(f"目录 {base_path} 处理完成，共检查 {processed} 个文件，删除 {removed} 个。")
+        if scan_cache is not None:
+            print(f"扫描缓存: 跳过 {scan_cache.skipped} 个未变化目录，重新读取 {scan_cache.read} 个目录。")
 
-        removed_dirs = remove_empty_directories(base_path)
+        if full_clean:
+            removed_dirs = remove_empty_directories(base_path)
+        else:
+            removed_dirs = prune_empty_parents(touched_dirs, base_path)
         total_cleaned_dirs += removed_dirs
         if removed_dirs:
             print(f"目录 {base_path} 额外清理空目录 {removed_dirs} 个。")
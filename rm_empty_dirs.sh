@@ -8,6 +8,7 @@ if [ "$target_dir" == "/" ] || [ -z "$target_dir" ]; then
 fi
 
 # 删除空目录（递归），但不删除根目录本身
+# run.py / remove_local.py 已在删除文件后沿其路径增量清理空目录，本脚本只作兜底，低频执行（如每周一次）即可
 find "$target_dir" -type d -empty -not -path "$target_dir" -delete
 
 # 记录日志（可选）
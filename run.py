@@ -1,29 +1,85 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
+import signal
 import sys
+import threading
 import time
+import traceback
 from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import replace
 from itertools import chain
 from pathlib import Path
-from typing import List, Tuple, TextIO
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, TextIO
 from fcntl import flock, LOCK_EX, LOCK_NB
 
 from dotenv import load_dotenv
 
+from src.bandwidth import QuotaExceededError, format_size, open_bandwidth_scheduler, open_daily_quota
+from src.downstream import DownstreamRefresh, MountRefresher, OpenlistRefresher, parse_path_map
+from src.emby import EmbyClient, LibraryRefresher, PlaybackThrottle
+from src.hashing import HashAhead
+from src.inotify import OVERFLOW, READY, Change, TreeWatcher
+from src.concurrency import AimdController
+from src.journal import (
+    REMOTE_CONFIRMED_STATES,
+    STATE_DELETED,
+    STATE_FAILED,
+    STATE_UPLOADED,
+    STATE_VERIFIED,
+    UploadJournal,
+)
 from src.localfile import (
+    FileRecord,
     ensure_directory,
-    iter_files_sorted,
-    relative_posix,
+    file_record,
+    iter_file_records,
+    open_hash_cache,
+    prune_empty_parents,
     remove_empty_directories,
     remove_file,
 )
+from src.openlist import OpenlistClient
+from src.pipeline import Pipeline, Stage, parallel_map
 from src.rclone_client import RcloneClient
+from src.rclone_rc import create_client
+from src.retry import (
+    AUTH,
+    BACKPRESSURE_KINDS,
+    KIND_LABELS,
+    PERMANENT,
+    RATE_LIMITED,
+    TRANSIENT,
+    CircuitBreaker,
+    RemoteParkedError,
+    RetryPolicy,
+    call_with_retry,
+    error_kind,
+)
+from src.scan_cache import DirectoryCache, open_scan_cache
+from src.scheduler import UploadScheduler, parse_policies, parse_priorities
+from src.stability import StabilityGate
+from src.uploader import (
+    UploadBatch,
+    UploadJob,
+    UploadOutcome,
+    UploadPool,
+    UploadTask,
+    iter_batches,
+    iter_outcomes,
+    parse_remote_limits,
+)
+from src.verify import VERIFY_MODES, RemoteVerifier
 
 
 LOG_FILE_PATH = Path("logs/run.log")
 ERROR_LOG_PATH = Path("logs/error.log")
 LOCK_FILE_PATH = Path("run.lock")
+JOURNAL_PATH = Path("state/upload_journal.db")
+SWEEP_STAMP_PATH = Path("state/empty_dir_sweep.stamp")
+# 守护模式某一轮出错后，等待这么多秒再重试，避免持续出错时空转刷屏
+_DAEMON_ERROR_PAUSE = 30.0
 
 
 class _TeeStream:
@@ -49,27 +105,31 @@ class _TimestampStream:
     def __init__(self, target: TextIO):
         self._target = target
         self._buffer = ""
+        # 上传工作线程也会输出日志，缓冲区需要加锁
+        self._lock = threading.Lock()
 
     def _timestamp(self) -> str:
         return time.strftime("%Y/%m/%d %H:%M", time.localtime())
 
     def write(self, data: str) -> int:
-        self._buffer += data
-        written = 0
-        while "\n" in self._buffer:
-            line, self._buffer = self._buffer.split("\n", 1)
-            out = f"{self._timestamp()} {line}\n"
-            self._target.write(out)
-            self._target.flush()
-            written += len(data)
-        return written
+        with self._lock:
+            self._buffer += data
+            written = 0
+            while "\n" in self._buffer:
+                line, self._buffer = self._buffer.split("\n", 1)
+                out = f"{self._timestamp()} {line}\n"
+                self._target.write(out)
+                self._target.flush()
+                written += len(data)
+            return written
 
     def flush(self) -> None:
-        if self._buffer:
-            out = f"{self._timestamp()} {self._buffer}"
-            self._target.write(out)
-            self._buffer = ""
-        self._target.flush()
+        with self._lock:
+            if self._buffer:
+                out = f"{self._timestamp()} {self._buffer}"
+                self._target.write(out)
+                self._buffer = ""
+            self._target.flush()
 
 
 def _split_env_values(raw_value: str) -> List[str]:
@@ -161,85 +221,818 @@ def _acquire_lock() -> TextIO:
     return lock_file
 
 
-def _run_upload() -> None:
+def _split_remote_root(remote_root: str, default_remote: str) -> Tuple[str, str]:
+    """拆分 ``remote:/path`` 形式的远端根，未指定远端名时使用默认远端。"""
+    head, sep, tail = remote_root.partition(":")
+    if sep and head and "/" not in head and "\\" not in head:
+        return head.strip(), tail
+    return default_remote, remote_root
+
+
+def _env_int(name: str, default: int, *, minimum: int = 0) -> int:
+    """读取整数型环境变量。"""
+    raw_value = os.getenv(name, "").strip()
+    if not raw_value:
+        return default
+    try:
+        value = int(raw_value)
+    except ValueError as exc:
+        raise ValueError(f"{name} 必须是整数: {raw_value}") from exc
+    if value < minimum:
+        raise ValueError(f"{name} 不能小于 {minimum}。")
+    return value
+
+
+def _load_worker_settings() -> Tuple[int, Dict[str, int]]:
+    """读取上传并发数与按远端的并发上限。"""
+    workers = _env_int("UPLOAD_WORKERS", 1, minimum=1)
+    remote_limits = parse_remote_limits(os.getenv("UPLOAD_REMOTE_LIMITS", ""))
+    return workers, remote_limits
+
+
+class _Mapping:
+    """一条本地目录到远端根目录的映射。"""
+
+    def __init__(self, base_path: Path, remote: str, remote_root: str):
+        self.base_path = base_path
+        self.remote = remote
+        self.remote_root = remote_root
+
+    def remote_path_for(self, relative_remote: str) -> str:
+        if self.remote_root == "/":
+            return f"/{relative_remote}"
+        return f"{self.remote_root}/{relative_remote}"
+
+
+def _resolve_mappings(directory_pairs: List[Tuple[str, str]], default_remote: str) -> List[_Mapping]:
+    """把配置的目录对解析为映射，跳过不存在的本地目录。"""
+    mappings: List[_Mapping] = []
+    for source_dir, remote_root in directory_pairs:
+        try:
+            base_path = ensure_directory(source_dir)
+        except NotADirectoryError as exc:
+            print(f"跳过目录 {source_dir}: {exc}")
+            continue
+        remote, remote_root = _split_remote_root(remote_root, default_remote)
+        mappings.append(_Mapping(base_path, remote, _normalize_remote_root(remote_root)))
+    return mappings
+
+
+def _mapping_for(path: Path, mappings: List[_Mapping]) -> Optional[_Mapping]:
+    """返回包含该路径的映射（最长前缀优先）。"""
+    best: Optional[_Mapping] = None
+    for mapping in mappings:
+        if path.is_relative_to(mapping.base_path):
+            if best is None or len(mapping.base_path.parts) > len(best.base_path.parts):
+                best = mapping
+    return best
+
+
+def _stable_records(
+    entries: Iterable[Tuple[FileRecord, _Mapping]], gate: StabilityGate | None
+) -> Iterator[Tuple[FileRecord, _Mapping]]:
+    """稳定性检查：跳过仍在写入的文件并逐个输出原因。"""
+    for record, mapping in entries:
+        if gate is not None:
+            reason = gate.unstable_reason(record)
+            if reason is not None:
+                print(f"文件尚未写完，本次跳过 {record.path}: {reason}")
+                continue
+        yield record, mapping
+
+
+def _scan_stage(
+    mappings: List[_Mapping], scan_cache: DirectoryCache | None = None, gate: StabilityGate | None = None
+) -> Iterator[Tuple[FileRecord, _Mapping]]:
+    """扫描阶段：按映射顺序遍历本地目录；提供扫描缓存时跳过未变化的目录，提供 ``gate`` 时跳过未写完的文件。"""
+    if gate is not None:
+        gate.begin_cycle()
+    for mapping in mappings:
+        base_path = mapping.base_path
+        if scan_cache is not None:
+            scan_cache.reset_stats()
+        records = _stable_records(((record, mapping) for record in iter_file_records(base_path, scan_cache)), gate)
+        try:
+            first_entry = next(records)
+        except StopIteration:
+            print(f"扫描目录: {base_path} -> 远端根 {mapping.remote}:{mapping.remote_root} (无待上传文件)")
+        else:
+            print(f"扫描目录: {base_path} -> 远端根 {mapping.remote}:{mapping.remote_root}")
+            yield from chain((first_entry,), records)
+        if scan_cache is not None:
+            print(
+                f"扫描缓存: {base_path} 跳过 {scan_cache.skipped} 个未变化目录，"
+                f"重新读取 {scan_cache.read} 个目录"
+            )
+    if gate is not None and gate.skipped:
+        print(f"稳定性检查: {gate.skipped} 个文件仍在写入，留待下次运行上传。")
+
+
+def _prepare_file(entry: Tuple[FileRecord, _Mapping], journal: UploadJournal | None) -> Optional[UploadTask]:
+    """准备阶段：由扫描记录计算远端路径，带上扫描时的文件大小与修改时间，并查询上传日志。"""
+    record, mapping = entry
+    task = UploadTask(
+        record.path,
+        mapping.remote,
+        mapping.remote_path_for(record.relative),
+        mapping.base_path,
+        record.size,
+        record.mtime_ns,
+    )
+    if journal is not None and journal.is_uploaded(task):
+        return replace(task, resumed=True)
+    return task
+
+
+def _record_upload(outcome: UploadOutcome, journal: UploadJournal | None) -> UploadOutcome:
+    """上传结果写入日志；续跑的文件状态不变。"""
+    if journal is not None and not outcome.task.resumed:
+        if outcome.ok:
+            journal.record(outcome.task, STATE_UPLOADED)
+        else:
+            journal.record(outcome.task, STATE_FAILED, error=str(outcome.error))
+    return outcome
+
+
+def _verify_outcome(outcome: UploadOutcome, journal: UploadJournal | None) -> UploadOutcome:
+    """校验阶段：上传期间本地文件若被改动，则不允许删除。"""
+    if not outcome.ok:
+        return outcome
+    task = outcome.task
+    try:
+        stat = task.local_path.stat()
+    except FileNotFoundError:
+        outcome.error = "上传后本地文件已不存在"
+        return outcome
+    if (stat.st_size, stat.st_mtime_ns) != (task.size, task.mtime_ns):
+        outcome.error = "上传期间本地文件发生变化，保留待下次上传"
+        if journal is not None:
+            journal.record(task, STATE_FAILED, error=str(outcome.error))
+    return outcome
+
+
+def _delete_outcome(outcome: UploadOutcome, journal: UploadJournal | None) -> UploadOutcome:
+    """删除阶段：只删除上传并校验成功的文件。"""
+    if outcome.ok:
+        try:
+            remove_file(outcome.task.local_path)
+            outcome.deleted = True
+        except (FileNotFoundError, IsADirectoryError) as exc:
+            outcome.delete_error = str(exc)
+        if journal is not None and outcome.deleted:
+            journal.record(outcome.task, STATE_DELETED)
+    return outcome
+
+
+def _open_journal() -> UploadJournal | None:
+    """按 UPLOAD_JOURNAL 打开上传日志，配置为空字符串时禁用。"""
+    journal_path = os.getenv("UPLOAD_JOURNAL", str(JOURNAL_PATH)).strip()
+    if not journal_path:
+        return None
+    journal = UploadJournal(journal_path)
+    retention_days = _env_int("JOURNAL_RETENTION_DAYS", 30)
+    if retention_days:
+        journal.prune(retention_days * 86400)
+    confirmed = sum(journal.counts().get(state, 0) for state in REMOTE_CONFIRMED_STATES)
+    if confirmed:
+        print(f"上传日志中有 {confirmed} 个文件已确认上传但尚未删除，本地文件未变化时将跳过上传直接删除。")
+    return journal
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="批量上传本地目录到 rclone 远端")
+    parser.add_argument("--refresh", action="store_true", help="忽略持久化的远端目录缓存，强制重新列出")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，基于 inotify 上传新出现的文件")
+    parser.add_argument("--full-clean", action="store_true", help="本次运行对整个目录树做一次空目录全量清理")
+    return parser.parse_args(argv)
+
+
+class _UploadContext:
+    """一次运行中各批次共用的客户端、上传日志与并发配置。"""
+
+    def __init__(
+        self, client: RcloneClient, journal: UploadJournal | None, scan_cache: DirectoryCache | None = None
+    ):
+        self.client = client
+        self.journal = journal
+        self.scan_cache = scan_cache
+        stable_seconds = _env_int("STABLE_SECONDS", 60)
+        self.stability = StabilityGate(stable_seconds, check_open=_env_int("OPEN_FILE_CHECK", 1) > 0)
+        if not self.stability.enabled:
+            self.stability = None
+        # 映射根目录 -> 本次删除过文件的父目录，供空目录增量清理
+        self.touched_dirs: Dict[Path, Set[Path]] = {}
+        workers, remote_limits = _load_worker_settings()
+        self.batch_size = _env_int("RCLONE_BATCH_SIZE", 0)
+        self.queue_size = _env_int("PIPELINE_QUEUE_SIZE", 64, minimum=1)
+        self.delete_workers = _env_int("DELETE_WORKERS", 1, minimum=1)
+
+        small_file_size = _env_int("SMALL_FILE_MAX_MB", 64) * 1024 * 1024
+        small_workers = _env_int("SMALL_FILE_WORKERS", 0)
+        self.adaptive: AimdController | None = None
+        if _env_int("UPLOAD_ADAPTIVE", 0):
+            self.adaptive = AimdController(
+                minimum=_env_int("ADAPTIVE_MIN", 1, minimum=1),
+                initial=_env_int("ADAPTIVE_INITIAL", 2, minimum=1),
+                interval=_env_int("ADAPTIVE_INTERVAL", 30, minimum=1),
+            )
+        self.retry_policy = RetryPolicy(
+            retries=_env_int("UPLOAD_RETRIES", 2),
+            base_delay=_env_int("RETRY_BASE_DELAY", 2),
+            max_delay=_env_int("RETRY_MAX_DELAY", 60, minimum=1),
+        )
+        self.breaker = CircuitBreaker(
+            threshold=_env_int("BREAKER_THRESHOLD", 5, minimum=1),
+            cooldown=_env_int("BREAKER_COOLDOWN", 300),
+        )
+        upload = self._upload_batch if self.batch_size > 1 else self._upload
+        self.pool = UploadPool(
+            upload,
+            workers=workers,
+            remote_limits=remote_limits,
+            small_file_size=small_file_size,
+            small_workers=small_workers,
+            # 批量模式下自适应调整的是单个 rclone 进程的 --transfers
+            adaptive=None if self.batch_size > 1 else self.adaptive,
+        )
+        if self.batch_size > 1:
+            print(f"批量传输模式: 每批最多 {self.batch_size} 个文件，rclone --transfers {client.batch_transfers}")
+        if workers > 1:
+            print(f"并发上传: {workers} 个工作线程")
+        if self.adaptive is not None:
+            ceiling = client.batch_transfers if self.batch_size > 1 else workers
+            print(
+                f"自适应并发: 每个远端在 {self.adaptive.minimum}-{ceiling} 之间调整，"
+                f"每 {self.adaptive.interval:.0f}s 评估一次"
+            )
+        if self.pool.small_workers:
+            print(
+                f"小文件通道: 不超过 {small_file_size // 1024 // 1024} MB 的文件另用 "
+                f"{self.pool.small_workers} 个工作线程上传"
+            )
+
+        policies = parse_policies(os.getenv("UPLOAD_ORDER", ""))
+        self.scheduler: UploadScheduler | None = None
+        if policies:
+            self.scheduler = UploadScheduler(
+                policies,
+                priorities=parse_priorities(os.getenv("UPLOAD_MAPPING_PRIORITY", "")),
+                window=_env_int("UPLOAD_ORDER_WINDOW", 10000, minimum=1),
+            )
+            print(f"上传顺序: {' > '.join(policies)}（前瞻 {self.scheduler.window} 个文件）")
+
+        self.hash_cache = open_hash_cache()
+        self.hash_ahead: HashAhead | None = None
+        hash_algorithms = [
+            name.strip().lower() for name in os.getenv("HASH_AHEAD", "").replace(";", ",").split(",") if name.strip()
+        ]
+        if hash_algorithms:
+            self.hash_ahead = HashAhead(
+                hash_algorithms,
+                cache=self.hash_cache,
+                workers=_env_int("HASH_WORKERS", 2, minimum=1),
+                per_device=_env_int("HASH_PER_DEVICE", 1, minimum=1),
+            )
+            print(
+                f"预先计算摘要: {', '.join(self.hash_ahead.algorithms)}，{self.hash_ahead.workers} 个进程，"
+                f"每块磁盘同时读取 {self.hash_ahead.per_device} 个文件"
+            )
+
+        verify_mode = os.getenv("REMOTE_VERIFY", "size").strip().lower() or "size"
+        if verify_mode not in VERIFY_MODES:
+            raise ValueError(f"REMOTE_VERIFY 只能是 {' / '.join(VERIFY_MODES)}，而不是 {verify_mode}。")
+        self.remote_verifier: RemoteVerifier | None = None
+        if verify_mode != "off":
+            self.remote_verifier = RemoteVerifier(
+                client,
+                self.hash_cache,
+                mode=verify_mode,
+                journal=journal,
+                window=_env_int("VERIFY_WINDOW", 64, minimum=1),
+                max_wait=_env_int("VERIFY_MAX_WAIT", 30),
+            )
+            print(f"远端校验: 删除前按目录核对{'大小与摘要' if verify_mode == 'hash' else '大小'}")
+
+        emby_url = os.getenv("EMBY_URL", "").strip()
+        self.bandwidth = open_bandwidth_scheduler(dynamic=bool(emby_url and _env_int("EMBY_UPLINK_MBPS", 0)))
+        client.bandwidth = self.bandwidth
+        self.quota = open_daily_quota()
+        for remote, quota in self.quota.quotas.items():
+            print(f"每日上传配额: {remote} {format_size(quota)}，今日已用 {format_size(self.quota.used(remote))}")
+        self.emby: EmbyClient | None = None
+        self.playback: PlaybackThrottle | None = None
+        self.library_refresh: LibraryRefresher | None = None
+        refresh_debounce = _env_int("REFRESH_DEBOUNCE", 60)
+        if emby_url:
+            self.emby = EmbyClient(emby_url, os.getenv("EMBY_API_KEY", "").strip())
+            uplink_mbps = _env_int("EMBY_UPLINK_MBPS", 0)
+            if uplink_mbps:
+                self.playback = PlaybackThrottle(
+                    self.emby,
+                    uplink_bps=uplink_mbps * 1_000_000,
+                    bandwidth=self.bandwidth,
+                    pool=self.pool,
+                    interval=_env_int("EMBY_POLL_INTERVAL", 15, minimum=1),
+                    headroom=_env_int("EMBY_HEADROOM_PERCENT", 120, minimum=100) / 100,
+                    pause_below=_env_int("EMBY_PAUSE_BELOW_PERCENT", 10) / 100,
+                    include_lan=_env_int("EMBY_INCLUDE_LAN", 0) > 0,
+                )
+                print(f"Emby 播放限速: 每 {self.playback.interval:.0f}s 检查 {emby_url}，上行带宽 {uplink_mbps} Mbps")
+            path_map = parse_path_map(os.getenv("EMBY_PATH_MAP", ""), "EMBY_PATH_MAP")
+            if path_map:
+                self.library_refresh = LibraryRefresher(self.emby, path_map, debounce=refresh_debounce)
+                print(f"Emby 目录刷新: 上传完成后按 {len(path_map)} 条路径映射刷新对应目录")
+            if self.playback is None and self.library_refresh is None:
+                raise ValueError("设置了 EMBY_URL，但 EMBY_UPLINK_MBPS 与 EMBY_PATH_MAP 均未配置。")
+
+        # Openlist 在前：mount 经由 Openlist 读取时，先让 Openlist 看到新文件，mount 刷新才有意义
+        refreshers: List[OpenlistRefresher | MountRefresher] = []
+        openlist_map = parse_path_map(os.getenv("OPENLIST_PATH_MAP", ""), "OPENLIST_PATH_MAP")
+        if openlist_map:
+            # 与 rclone 上传共享同一个带宽调度器和每日配额
+            refreshers.append(
+                OpenlistRefresher(OpenlistClient(bandwidth=self.bandwidth, quota=self.quota), openlist_map)
+            )
+        mount_url = os.getenv("MOUNT_RC_URL", "").strip()
+        if mount_url:
+            mount_map = parse_path_map(os.getenv("MOUNT_PATH_MAP", ""), "MOUNT_PATH_MAP")
+            if not mount_map:
+                raise ValueError("设置了 MOUNT_RC_URL，但 MOUNT_PATH_MAP 未配置。")
+            refreshers.append(
+                MountRefresher(
+                    mount_url,
+                    mount_map,
+                    user=os.getenv("MOUNT_RC_USER", "").strip(),
+                    password=os.getenv("MOUNT_RC_PASS", "").strip(),
+                    fs=os.getenv("MOUNT_RC_FS", "").strip(),
+                )
+            )
+        self.downstream: DownstreamRefresh | None = None
+        if refreshers:
+            self.downstream = DownstreamRefresh(refreshers, debounce=refresh_debounce)
+            print(f"下游目录缓存刷新: {'、'.join(refresher.name for refresher in refreshers)}")
+
+        self.bandwidth.start()
+        if self.playback is not None:
+            self.playback.start()
+
+    def flush_refreshes(self, *, force: bool = False) -> None:
+        """
+        刷新本次上传涉及的目录：先让 Openlist / mount 的目录缓存失效，再通知 Emby，
+        否则 Emby 扫描时可能仍看到旧的目录列表。``force`` 为 False 时只在静默期过后刷新。
+        """
+        pending = [refresh for refresh in (self.downstream, self.library_refresh) if refresh is not None]
+        if not force and not any(refresh.due() for refresh in pending):
+            return
+        for refresh in pending:
+            refresh.flush()
+
+    def close(self) -> None:
+        if self.playback is not None:
+            self.playback.stop()
+        self.flush_refreshes(force=True)
+        if self.downstream is not None:
+            self.downstream.close()
+        if self.emby is not None:
+            self.emby.close()
+        self.bandwidth.stop()
+        self.quota.close()
+        if self.hash_ahead is not None:
+            self.hash_ahead.close()
+        self.hash_cache.close()
+
+    def _upload(self, task: UploadTask) -> None:
+        if task.resumed:
+            return
+        self.quota.reserve(task.remote, task.size)
+        uploaded = False
+        try:
+            call_with_retry(
+                lambda: self.client.upload_file(str(task.local_path), task.remote_path, remote=task.remote),
+                remote=task.remote,
+                policy=self.retry_policy,
+                breaker=self.breaker,
+                describe=f"上传 {task.local_path}",
+                on_error=lambda kind: self.pool.note_error(task, kind),
+            )
+            uploaded = True
+        finally:
+            self.quota.settle(task.remote, task.size, uploaded)
+
+    def _reserve_quota(
+        self, remote: str, tasks: List[UploadTask], results: Dict[str, Optional[str]]
+    ) -> List[UploadTask]:
+        """为一批文件预留每日配额，返回可以上传的文件；超出配额的直接记为失败。"""
+        admitted: List[UploadTask] = []
+        for task in tasks:
+            try:
+                self.quota.reserve(remote, task.size)
+            except QuotaExceededError as exc:
+                results[str(task.local_path)] = str(exc)
+                continue
+            admitted.append(task)
+        return admitted
+
+    def _upload_many_once(self, remote: str, tasks: List[UploadTask]) -> Dict[str, Optional[str]]:
+        """调用一次 upload_many；整体异常转为每个文件的错误信息，并把结果反馈给自适应并发。"""
+        pairs = [(str(task.local_path), task.remote_path) for task in tasks]
+        ceiling = self.client.batch_transfers
+        transfers = self.adaptive.limit(remote, ceiling) if self.adaptive is not None else None
+        try:
+            uploaded = self.client.upload_many(pairs, remote=remote, transfers=transfers)
+        except (OSError, RuntimeError) as exc:
+            uploaded = {local_path: str(exc) for local_path, _ in pairs}
+        if self.adaptive is not None:
+            failed = [task for task in tasks if uploaded.get(str(task.local_path)) is not None]
+            self.adaptive.record(
+                remote,
+                ceiling,
+                nbytes=sum(max(0, task.size) for task in tasks) - sum(max(0, task.size) for task in failed),
+                failed=sum(1 for task in failed if error_kind(uploaded[str(task.local_path)]) in BACKPRESSURE_KINDS),
+                total=len(tasks),
+                saturated=transfers is not None and len(tasks) >= transfers,
+            )
+        return uploaded
+
+    def _upload_batch(self, batch: UploadBatch) -> Dict[str, Optional[str]]:
+        """批量上传；临时和限流错误的文件退避后重新组成一批重试，熔断的远端直接失败。"""
+        results: Dict[str, Optional[str]] = {
+            str(task.local_path): None for task in batch.tasks if task.resumed
+        }
+        pending = [task for task in batch.tasks if not task.resumed]
+        attempt = 0
+        while pending:
+            try:
+                self.breaker.check(batch.remote)
+            except RemoteParkedError as exc:
+                results.update((str(task.local_path), str(exc)) for task in pending)
+                break
+            pending = self._reserve_quota(batch.remote, pending, results)
+            if not pending:
+                break
+            uploaded = self._upload_many_once(batch.remote, pending)
+            for task in pending:
+                self.quota.settle(batch.remote, task.size, uploaded.get(str(task.local_path), "") is None)
+            retry: List[UploadTask] = []
+            kinds: Set[str] = set()
+            for task in pending:
+                error = uploaded.get(str(task.local_path))
+                if error is None:
+                    results[str(task.local_path)] = None
+                    continue
+                kind = error_kind(error)
+                kinds.add(kind)
+                if self.retry_policy.should_retry(kind, attempt):
+                    retry.append(task)
+                else:
+                    results[str(task.local_path)] = error
+            # 整批失败才算远端故障；部分成功或只有文件本身的问题说明远端可用
+            remote_kinds = kinds - {PERMANENT}
+            if remote_kinds and all(uploaded.get(str(task.local_path)) for task in pending):
+                worst = next(kind for kind in (AUTH, RATE_LIMITED, TRANSIENT) if kind in remote_kinds)
+                self.breaker.record_failure(batch.remote, worst)
+            else:
+                self.breaker.record_success(batch.remote)
+            if not retry:
+                break
+            kind = RATE_LIMITED if RATE_LIMITED in kinds else TRANSIENT
+            delay = self.retry_policy.delay(kind, attempt)
+            attempt += 1
+            print(
+                f"批次 {batch.remote} 中 {len(retry)} 个文件遇到{KIND_LABELS[kind]}错误，"
+                f"{delay:.1f}s 后第 {attempt} 次重试"
+            )
+            time.sleep(delay)
+            pending = retry
+        return results
+
+    def _upload_stage(self, tasks: Iterator[UploadTask]) -> Iterator[UploadOutcome]:
+        jobs: Iterable[UploadJob] = iter_batches(tasks, self.batch_size) if self.batch_size > 1 else tasks
+        for outcome in iter_outcomes(self.pool.run(jobs)):
+            yield _record_upload(outcome, self.journal)
+
+    def _verify_stage(self, outcomes: Iterator[UploadOutcome]) -> Iterator[UploadOutcome]:
+        """校验阶段：先确认上传期间本地文件未被改动，再按目录核对远端副本，都通过后才记为已校验。"""
+        checked = parallel_map(lambda outcome: _verify_outcome(outcome, self.journal))(outcomes)
+        if self.remote_verifier is not None:
+            checked = self.remote_verifier.transform(checked)
+        for outcome in checked:
+            if outcome.ok and self.journal is not None:
+                self.journal.record(outcome.task, STATE_VERIFIED)
+            yield outcome
+
+    def build_pipeline(self, entries: Iterable[Tuple[FileRecord, _Mapping]]) -> Pipeline:
+        journal = self.journal
+        stages = [
+            Stage("scan", lambda _: entries),
+            Stage("prepare", parallel_map(lambda entry: _prepare_file(entry, journal))),
+        ]
+        if self.scheduler is not None:
+            stages.append(Stage("schedule", self.scheduler.order))
+        if self.hash_ahead is not None:
+            # 排序之后计算，按上传顺序提前读取
+            stages.append(Stage("hash", self.hash_ahead.transform))
+        stages += [
+            Stage("upload", self._upload_stage),
+            Stage("verify", self._verify_stage),
+            Stage(
+                "delete",
+                parallel_map(lambda outcome: _delete_outcome(outcome, journal), self.delete_workers),
+            ),
+        ]
+        return Pipeline(stages, queue_size=self.queue_size)
+
+
+def _process_entries(
+    context: _UploadContext, entries: Iterable[Tuple[FileRecord, _Mapping]]
+) -> Tuple[int, int, int]:
+    """让一批文件走完整条流水线并输出有序日志，返回 (上传数, 续跑数, 失败数)。"""
+    file_count = 0
+    resumed_count = 0
+    failed_count = 0
+    pipeline = context.build_pipeline(entries)
+    for outcome in pipeline.run():
+        task = outcome.task
+        target = f"{task.remote}:{task.remote_path}"
+        if not outcome.ok:
+            failed_count += 1
+            print(f"上传失败，保留本地文件 {task.local_path} -> {target}: {outcome.error}", file=sys.stderr)
+            continue
+        if context.downstream is not None:
+            context.downstream.note(task.remote, task.remote_path)
+        if context.library_refresh is not None:
+            context.library_refresh.note(task.remote, task.remote_path)
+
+        if task.resumed:
+            print(f"上传日志显示已上传 {task.local_path} -> {target}，跳过上传")
+            resumed_count += 1
+        else:
+            print(f"完成上传 {task.local_path} -> {target} 用时 {outcome.elapsed:.1f}s")
+            file_count += 1
+        if outcome.deleted:
+            print(f"已删除本地文件 {task.local_path}")
+            context.touched_dirs.setdefault(task.base_path, set()).add(task.local_path.parent)
+        else:
+            print(f"删除本地文件失败 {task.local_path}: {outcome.delete_error}")
+
+    if file_count or failed_count or resumed_count:
+        for line in pipeline.report():
+            print(line)
+    for stage in (context.hash_ahead, context.remote_verifier):
+        if stage is not None:
+            for line in stage.report():
+                print(line)
+            stage.reset_stats()
+    return file_count, resumed_count, failed_count
+
+
+def _full_sweep_due(force: bool) -> bool:
+    """距上次全量清理超过 EMPTY_DIR_SWEEP_HOURS 小时（0 表示只在 --full-clean 时执行）时返回 True。"""
+    if force:
+        return True
+    interval_hours = _env_int("EMPTY_DIR_SWEEP_HOURS", 24)
+    if not interval_hours:
+        return False
+    try:
+        last_sweep = SWEEP_STAMP_PATH.stat().st_mtime
+    except FileNotFoundError:
+        return True
+    return time.time() - last_sweep >= interval_hours * 3600
+
+
+def _clean_directories(context: _UploadContext, mappings: List[_Mapping], *, full_sweep: bool = False) -> int:
+    """
+    清理空目录，返回清理数量。
+
+    默认只从本次删除过文件的目录向上逐级清理到映射根目录；``full_sweep`` 时遍历整个目录树。
+    """
+    cleaned_dirs = 0
+    touched_dirs, context.touched_dirs = context.touched_dirs, {}
+    for mapping in mappings:
+        if full_sweep:
+            removed_count = remove_empty_directories(mapping.base_path)
+        else:
+            directories = touched_dirs.get(mapping.base_path)
+            if not directories:
+                continue
+            removed_count = prune_empty_parents(directories, mapping.base_path)
+        cleaned_dirs += removed_count
+        if removed_count:
+            print(f"目录 {mapping.base_path} 清理空目录 {removed_count} 个。")
+    if full_sweep:
+        SWEEP_STAMP_PATH.parent.mkdir(parents=True, exist_ok=True)
+        SWEEP_STAMP_PATH.touch()
+        print("已完成空目录全量清理。")
+    return cleaned_dirs
+
+
+def _print_summary(file_count: int, resumed_count: int, failed_count: int, cleaned_dirs: int) -> None:
+    if file_count:
+        message = f"批量上传完成，共上传 {file_count} 个文件。"
+        if cleaned_dirs:
+            message += f" 同时清理空目录 {cleaned_dirs} 个。"
+        print(message)
+    else:
+        if cleaned_dirs:
+            print(f"扫描完成，未上传文件，但清理空目录 {cleaned_dirs} 个。")
+        elif not failed_count and not resumed_count:
+            print("扫描完成，未发现需要上传的文件。")
+    if resumed_count:
+        print(f"根据上传日志续跑，{resumed_count} 个文件跳过了重复上传。")
+    if failed_count:
+        print(f"共有 {failed_count} 个文件上传失败，已保留本地文件。", file=sys.stderr)
+
+
+class _PendingFiles:
+    """守护模式下由 inotify 线程增量维护的待上传文件集合。"""
+
+    def __init__(self, mappings: List[_Mapping]):
+        self._mappings = mappings
+        self._lock = threading.Lock()
+        self._files: Dict[Path, _Mapping] = {}
+        self.first_change = 0.0
+        self.last_change = 0.0
+        self.needs_rescan = False
+
+    def apply(self, changes: List[Change]) -> None:
+        with self._lock:
+            for change in changes:
+                if change.kind == OVERFLOW:
+                    self.needs_rescan = True
+                elif change.kind == READY:
+                    mapping = _mapping_for(change.path, self._mappings)
+                    if mapping is not None:
+                        if not self._files:
+                            self.first_change = time.monotonic()
+                        self._files[change.path] = mapping
+                else:
+                    # 删除的可能是文件也可能是整个目录
+                    for path in [path for path in self._files if path.is_relative_to(change.path)]:
+                        del self._files[path]
+            if changes:
+                self.last_change = time.monotonic()
+
+    def take(self, settle: float) -> List[Tuple[Path, _Mapping]]:
+        """
+        距最后一次变化超过 ``settle`` 秒时取出全部待上传文件；
+        目录持续有变化时，最早的文件等待超过 10 倍 ``settle`` 也会取出，避免一直推迟。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not self._files:
+                return []
+            if now - self.last_change < settle and now - self.first_change < settle * 10:
+                return []
+            entries = sorted(self._files.items(), key=lambda item: str(item[0]))
+            self._files.clear()
+            return entries
+
+    def defer(self, path: Path, mapping: _Mapping) -> None:
+        """把暂不能上传的文件放回集合，重新开始计算静默时间。"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._files:
+                self.first_change = now
+            self._files.setdefault(path, mapping)
+            self.last_change = now
+
+    def take_rescan(self) -> bool:
+        with self._lock:
+            needs_rescan, self.needs_rescan = self.needs_rescan, False
+            if needs_rescan:
+                self._files.clear()
+            return needs_rescan
+
+
+def _stat_pending(
+    entries: List[Tuple[Path, _Mapping]], gate: StabilityGate | None, pending: _PendingFiles
+) -> Iterator[Tuple[FileRecord, _Mapping]]:
+    """为 inotify 上报的文件生成扫描记录，跳过已经消失的文件；未写完的文件放回待上传集合稍后重试。"""
+    if gate is not None:
+        gate.begin_cycle()
+    for path, mapping in entries:
+        try:
+            record = file_record(path, mapping.base_path)
+        except FileNotFoundError:
+            continue
+        if gate is not None:
+            reason = gate.unstable_reason(record)
+            if reason is not None:
+                print(f"文件尚未写完，稍后重试 {path}: {reason}")
+                pending.defer(path, mapping)
+                continue
+        yield record, mapping
+
+
+def _watch_loop(watcher: TreeWatcher, pending: _PendingFiles, stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            pending.apply(watcher.poll(1.0))
+        except Exception:  # noqa: BLE001 - 监视线程退出后守护模式就再也收不到新文件
+            # 出错时读到一半的事件已经丢失，让主循环做一次全量核对补上
+            print("inotify 事件处理出错，稍后重试并全量核对:", file=sys.stderr)
+            traceback.print_exc()
+            pending.apply([Change(OVERFLOW, Path("/"))])
+            stop.wait(_DAEMON_ERROR_PAUSE)
+
+
+def _run_daemon(context: _UploadContext, mappings: List[_Mapping], *, full_clean: bool = False) -> None:
+    """守护模式：inotify 增量上传新文件，并按较低频率做全量核对扫描。"""
+    settle = _env_int("DAEMON_SETTLE_SECONDS", 30)
+    reconcile_interval = _env_int("DAEMON_RECONCILE_INTERVAL", 3600, minimum=60)
+    pending = _PendingFiles(mappings)
+    stop = threading.Event()
+    # systemd/kill 发送的 SIGTERM 与 Ctrl+C 一样优雅退出
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with TreeWatcher([mapping.base_path for mapping in mappings]) as watcher:
+        print(
+            f"守护模式启动: 监视 {watcher.watch_count} 个目录，静默 {settle}s 后上传，"
+            f"每 {reconcile_interval}s 全量核对一次。"
+        )
+        thread = threading.Thread(target=_watch_loop, args=(watcher, pending, stop), name="inotify", daemon=True)
+        thread.start()
+        next_reconcile = 0.0
+        try:
+            while True:
+                try:
+                    context.flush_refreshes()
+                    if pending.take_rescan():
+                        print("inotify 事件丢失，提前进行全量核对。")
+                        next_reconcile = 0.0
+                    if time.monotonic() >= next_reconcile:
+                        counts = _process_entries(context, _scan_stage(mappings, context.scan_cache, context.stability))
+                        full_sweep = _full_sweep_due(full_clean)
+                        full_clean = False
+                        _print_summary(*counts, _clean_directories(context, mappings, full_sweep=full_sweep))
+                        next_reconcile = time.monotonic() + reconcile_interval
+                        continue
+                    entries = pending.take(settle)
+                    if entries:
+                        print(f"检测到 {len(entries)} 个新文件，开始上传。")
+                        counts = _process_entries(context, _stat_pending(entries, context.stability, pending))
+                        _print_summary(*counts, _clean_directories(context, mappings))
+                        continue
+                    time.sleep(1.0)
+                except Exception:  # noqa: BLE001 - 守护进程只因退出信号结束
+                    # 本轮取出的文件可能没有处理完，下一轮做一次全量核对补上
+                    print("守护模式本轮处理出错，稍后重新全量核对:", file=sys.stderr)
+                    traceback.print_exc()
+                    next_reconcile = 0.0
+                    time.sleep(_DAEMON_ERROR_PAUSE)
+        except KeyboardInterrupt:
+            print("收到退出信号，守护模式结束。")
+        finally:
+            stop.set()
+            thread.join()
+
+
+def _run_upload(*, refresh: bool = False, daemon: bool = False, full_clean: bool = False) -> None:
     """
     主执行函数
     """
+    client: RcloneClient | None = None
+    journal: UploadJournal | None = None
+    scan_cache: DirectoryCache | None = None
+    context: _UploadContext | None = None
     try:
         load_dotenv()
-        client = RcloneClient()
+        client = create_client()
+        client.listing_cache.refresh = refresh
+        journal = _open_journal()
+        scan_cache = open_scan_cache()
+        context = _UploadContext(client, journal, scan_cache)
 
         directory_pairs = load_directory_pairs()
 
         if directory_pairs:
-            file_count = 0
-            cleaned_dirs = 0
-            for source_dir, remote_root in directory_pairs:
-                try:
-                    base_path = ensure_directory(source_dir)
-                except NotADirectoryError as exc:
-                    print(f"跳过目录 {source_dir}: {exc}")
-                    continue
-
-                normalized_remote_root = _normalize_remote_root(remote_root)
-                files_iter = iter_files_sorted(base_path)
-                try:
-                    first_file = next(files_iter)
-                except StopIteration:
-                    print(f"扫描目录: {base_path} -> 远端根 {normalized_remote_root} (无待上传文件)")
-                    removed_count = remove_empty_directories(base_path)
-                    cleaned_dirs += removed_count
-                    if removed_count:
-                        print(f"目录 {base_path} 清理空目录 {removed_count} 个。")
-                    continue
-
-                print(f"扫描目录: {base_path} -> 远端根 {normalized_remote_root}")
-                for file_path in chain((first_file,), files_iter):
-                    relative_remote = relative_posix(file_path, base_path)
-                    if normalized_remote_root == "/":
-                        remote_path = f"/{relative_remote}"
-                    else:
-                        remote_path = f"{normalized_remote_root}/{relative_remote}"
-
-                    start = time.time()
-                    print(f"开始上传 {file_path} -> {remote_path}")
-                    client.upload_file(str(file_path), remote_path)
-                    elapsed = time.time() - start
-                    print(f"完成上传 {file_path} -> {remote_path} 用时 {elapsed:.1f}s")
-                    file_count += 1
-
-                    try:
-                        remove_file(file_path)
-                        print(f"已删除本地文件 {file_path}")
-                    except (FileNotFoundError, IsADirectoryError) as exc:
-                        print(f"删除本地文件失败 {file_path}: {exc}")
-
-                removed_count = remove_empty_directories(base_path)
-                cleaned_dirs += removed_count
-                if removed_count:
-                    print(f"目录 {base_path} 清理空目录 {removed_count} 个。")
-
-            if file_count:
-                message = f"批量上传完成，共上传 {file_count} 个文件。"
-                if cleaned_dirs:
-                    message += f" 同时清理空目录 {cleaned_dirs} 个。"
-                print(message)
+            mappings = _resolve_mappings(directory_pairs, client.remote)
+            if daemon:
+                _run_daemon(context, mappings, full_clean=full_clean)
             else:
-                if cleaned_dirs:
-                    print(f"扫描完成，未上传文件，但清理空目录 {cleaned_dirs} 个。")
-                else:
-                    print("扫描完成，未发现需要上传的文件。")
+                counts = _process_entries(context, _scan_stage(mappings, context.scan_cache, context.stability))
+                full_sweep = _full_sweep_due(full_clean)
+                _print_summary(*counts, _clean_directories(context, mappings, full_sweep=full_sweep))
         else:
             print("未找到任何有效的本地与远端目录映射，跳过批量上传步骤。")
 
     except ValueError as e:
         print(f"初始化失败: {e}")
-    except (FileNotFoundError, NotADirectoryError, RuntimeError) as exc:
+    except (FileNotFoundError, NotADirectoryError, RuntimeError, OSError) as exc:
         print(f"执行过程中发生错误: {exc}")
         sys.exit(1)
+    finally:
+        if context is not None:
+            context.close()
+        if client is not None:
+            client.close()
+        if journal is not None:
+            journal.close()
+        if scan_cache is not None:
+            scan_cache.close()
 
 
 def main() -> None:
+    args = _parse_args()
     LOG_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
     # 清空正常日志，错误日志持续累积
     LOG_FILE_PATH.open("w").close()
@@ -254,7 +1047,7 @@ def main() -> None:
             stdout_stream = _TimestampStream(_TeeStream(sys.stdout, log_file))
             stderr_stream = _TimestampStream(_TeeStream(sys.stderr, log_file, err_file))
             with redirect_stdout(stdout_stream), redirect_stderr(stderr_stream):
-                _run_upload()
+                _run_upload(refresh=args.refresh, daemon=args.daemon, full_clean=args.full_clean)
     finally:
         if lock_file:
             lock_file.close()
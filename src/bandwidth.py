@@ -0,0 +1,382 @@
+"""按时间段分配上传带宽，并按远端限制每日上传量。"""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.retry import PARKED, UploadError
+
+USAGE_DB_PATH = Path("state/bandwidth_usage.db")
+
+# 与 rclone 的 SizeSuffix 一致：不带单位时按 KiB 计，1K = 1024
+_SIZE_UNITS = {"B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+_SIZE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([BKMGT]?)(?:I?B)?(?:/S)?$", re.IGNORECASE)
+_TIME_PATTERN = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+Timetable = List[Tuple[int, Optional[float]]]
+RateCallback = Callable[[Optional[float]], None]
+
+
+def parse_size(raw_value: str) -> Optional[float]:
+    """解析 ``10M``、``512k``、``1.5G`` 等大小（字节），``off`` 表示不限制，返回 None。"""
+    value = raw_value.strip()
+    if value.lower() in ("off", "0", ""):
+        return None
+    match = _SIZE_PATTERN.match(value)
+    if match is None:
+        raise ValueError(f"无法解析的大小 '{raw_value}'，示例: 512K、10M、1.5G、off")
+    number, unit = match.groups()
+    return float(number) * _SIZE_UNITS[(unit or "K").upper()]
+
+
+def format_rate(rate: Optional[float]) -> str:
+    """把字节/秒格式化为 rclone ``--bwlimit`` 能接受的形式。"""
+    if rate is None:
+        return "off"
+    return f"{max(1, int(rate // 1024))}K"
+
+
+def format_size(size: float) -> str:
+    """把字节数格式化为便于阅读的形式。"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def describe_rate(rate: Optional[float]) -> str:
+    return "不限速" if rate is None else f"{format_size(rate)}/s"
+
+
+def parse_timetable(raw_value: str) -> Timetable:
+    """
+    解析形如 ``00:00,80M;19:00,10M;23:00,80M`` 的带宽时间表，返回按时间排序的 (分钟数, 字节/秒)。
+
+    条目也可以像 rclone 的 ``--bwlimit`` 一样用空格分隔；每个时间点的限速一直生效到下一个时间点，
+    最后一个时间点之后的限速沿用到次日第一个时间点。
+    """
+    timetable: Dict[int, Optional[float]] = {}
+    for entry in re.split(r"[;\s]+", raw_value.strip()):
+        if not entry:
+            continue
+        if "," not in entry:
+            raise ValueError(f"带宽时间表条目 '{entry}' 应为 'HH:MM,速率'。")
+        raw_time, raw_rate = entry.split(",", 1)
+        match = _TIME_PATTERN.match(raw_time.strip())
+        if match is None or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            raise ValueError(f"带宽时间表条目 '{entry}' 的时间无效。")
+        timetable[int(match.group(1)) * 60 + int(match.group(2))] = parse_size(raw_rate)
+    return sorted(timetable.items())
+
+
+def parse_quotas(raw_value: str) -> Dict[str, float]:
+    """解析形如 ``123=500G;456=100G`` 的每日上传配额。"""
+    quotas: Dict[str, float] = {}
+    for entry in raw_value.replace("\n", ";").replace(",", ";").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" not in entry:
+            raise ValueError(f"每日配额配置 '{entry}' 缺少 '='。")
+        remote, raw_size = (part.strip() for part in entry.split("=", 1))
+        size = parse_size(raw_size)
+        if not remote or size is None:
+            raise ValueError(f"每日配额配置 '{entry}' 无效。")
+        quotas[remote] = size
+    return quotas
+
+
+class BandwidthShare:
+    """一次传输（一个 rclone 进程、一个 rcd 任务或一个 HTTP 上传）分到的带宽。"""
+
+    def __init__(self, weight: int, on_change: Optional[RateCallback]) -> None:
+        self.weight = max(1, weight)
+        self.rate: Optional[float] = None
+        self._on_change = on_change
+
+    def _update(self, rate: Optional[float]) -> bool:
+        if rate == self.rate:
+            return False
+        self.rate = rate
+        return self._on_change is not None
+
+
+class BandwidthScheduler:
+    """
+    所有上传共享一个随时间段变化的总带宽。
+
+    每次传输开始或结束、以及进入新的时间段时，总带宽按权重（同一进程内并行的传输数）
+    重新平分给正在进行的传输，并通过各自的回调实时下发。未配置时间表时不限速。
+
+    ``dynamic`` 为 True 时即使没有时间表也会登记每个传输，以便随时通过 :meth:`set_cap`
+    （例如按 Emby 播放情况）在时间表之下进一步压低总带宽，0 表示暂停。
+    """
+
+    def __init__(
+        self, timetable: Timetable, *, dynamic: bool = False, clock: Callable[[], float] = time.time
+    ) -> None:
+        self.timetable = timetable
+        self.dynamic = dynamic
+        self._cap: Optional[float] = None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._shares: Set[BandwidthShare] = set()
+        self._total: Optional[float] = None
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.timetable) or self.dynamic
+
+    def _minute_of_day(self, moment: float) -> float:
+        local = time.localtime(moment)
+        return local.tm_hour * 60 + local.tm_min + local.tm_sec / 60
+
+    def rate_at(self, moment: float) -> Optional[float]:
+        """返回某一时刻的总带宽（字节/秒），None 表示不限制。"""
+        if not self.timetable:
+            return None
+        minute = self._minute_of_day(moment)
+        rate = self.timetable[-1][1]
+        for start, value in self.timetable:
+            if start > minute:
+                break
+            rate = value
+        return rate
+
+    def _current_total(self) -> Optional[float]:
+        rate = self.rate_at(self._clock())
+        if self._cap is None:
+            return rate
+        return self._cap if rate is None else min(rate, self._cap)
+
+    def set_cap(self, cap: Optional[float]) -> None:
+        """在时间表之外再限制总带宽（字节/秒），None 表示取消限制。"""
+        if cap == self._cap:
+            return
+        self._cap = cap
+        self._rebalance()
+
+    def _seconds_to_next_window(self, moment: float) -> float:
+        minute = self._minute_of_day(moment)
+        upcoming = [start for start, _ in self.timetable if start > minute]
+        target = upcoming[0] if upcoming else self.timetable[0][0] + 24 * 60
+        return max(1.0, (target - minute) * 60)
+
+    def start(self) -> None:
+        """启动后台线程，在时间段切换时重新分配带宽。"""
+        if not self.timetable or self._thread is not None:
+            return
+        self._total = self.rate_at(self._clock())
+        print(f"带宽时间表: 当前总带宽 {describe_rate(self._total)}")
+        self._thread = threading.Thread(target=self._run, name="bandwidth", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped:
+            # 最长一分钟检查一次，系统时间被调整时也能及时切换
+            self._wakeup.wait(min(60.0, self._seconds_to_next_window(self._clock())))
+            if self._stopped:
+                break
+            rate = self._current_total()
+            if rate != self._total:
+                print(f"带宽时间表: 进入新时段，总带宽 {describe_rate(self._total)} -> {describe_rate(rate)}")
+            self._rebalance()
+
+    def _rebalance(self) -> None:
+        with self._lock:
+            self._total = self._current_total()
+            weights = sum(share.weight for share in self._shares)
+            changed = [
+                share
+                for share in self._shares
+                if share._update(None if self._total is None else self._total * share.weight / weights)
+            ]
+        for share in changed:
+            try:
+                share._on_change(share.rate)  # type: ignore[misc]
+            except Exception as exc:  # 下发失败只影响这一次调整，进程结束后自然失效
+                print(f"调整传输带宽失败: {exc}")
+
+    @contextmanager
+    def transfer(self, weight: int = 1, on_change: Optional[RateCallback] = None) -> Iterator[BandwidthShare]:
+        """
+        登记一次传输并返回它分到的带宽；``share.rate`` 在进入时即为初始限速。
+
+        ``on_change`` 在之后份额变化时被调用（不持有锁），用于把新的限速下发给 rclone。
+        """
+        share = BandwidthShare(weight, None)
+        with self._lock:
+            self._shares.add(share)
+        self._rebalance()
+        share._on_change = on_change
+        try:
+            yield share
+        finally:
+            with self._lock:
+                self._shares.discard(share)
+            self._rebalance()
+
+
+def open_bandwidth_scheduler(*, dynamic: bool = False) -> BandwidthScheduler:
+    """按 BANDWIDTH_SCHEDULE 创建带宽调度器；未配置时间表且 ``dynamic`` 为 False 时不限速。"""
+    return BandwidthScheduler(parse_timetable(os.getenv("BANDWIDTH_SCHEDULE", "")), dynamic=dynamic)
+
+
+class ThrottledReader:
+    """
+    按 ``share.rate`` 限速读取文件，供不经过 rclone 的 HTTP 流式上传使用。
+
+    限速随份额实时变化；允许一秒的突发，速率变化时重新计时。
+    """
+
+    def __init__(self, stream: BinaryIO, size: int, share: BandwidthShare, *, clock: Callable[[], float] = time.monotonic):
+        self._stream = stream
+        self._remaining = size
+        self._share = share
+        self._clock = clock
+        self._rate = share.rate
+        self._started = clock()
+        self._sent = 0
+
+    def __len__(self) -> int:
+        # requests 用它设置 Content-Length，避免改用分块传输
+        return self._remaining
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        rate = self._share.rate
+        while rate is not None and rate <= 0:
+            # 总带宽被暂停，等待恢复
+            time.sleep(1)
+            rate = self._share.rate
+        if rate != self._rate:
+            self._rate, self._started, self._sent = rate, self._clock(), 0
+        if rate is not None:
+            size = int(rate) if size is None or size < 0 else min(size, max(1, int(rate)))
+        chunk = self._stream.read(size)
+        if rate is not None and chunk:
+            self._sent += len(chunk)
+            ahead = (self._sent - rate) / rate - (self._clock() - self._started)
+            if ahead > 0:
+                time.sleep(ahead)
+        self._remaining -= len(chunk)
+        return chunk
+
+
+class QuotaExceededError(UploadError):
+    """远端今日的上传配额已用完，文件留到次日上传。"""
+
+    def __init__(self, remote: str, used: float, quota: float) -> None:
+        super().__init__(
+            f"远端 {remote} 今日上传配额已用完（已用 {format_size(used)} / 配额 {format_size(quota)}），次日继续",
+            PARKED,
+        )
+        self.remote = remote
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    remote TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    PRIMARY KEY (day, remote)
+);
+"""
+
+
+class DailyQuota:
+    """
+    按远端统计当天（本地时间）已上传的字节数，持久化在 SQLite 中，重启和常驻模式下都连续计算。
+
+    上传前先 :meth:`reserve`，正在上传的文件也计入用量，避免并发上传一起超出配额；
+    结束后 :meth:`settle`，只有成功上传的字节计入当天用量。没有配置配额的远端不受限制。
+    """
+
+    def __init__(self, quotas: Dict[str, float], db_path: str | Path = USAGE_DB_PATH) -> None:
+        self.quotas = dict(quotas)
+        self._lock = threading.Lock()
+        self._reserved: Dict[str, float] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        if self.quotas:
+            path = Path(db_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(path), check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+            self._connection.execute("DELETE FROM usage WHERE day < date('now', 'localtime', '-30 days')")
+            self._connection.commit()
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d")
+
+    def used(self, remote: str) -> float:
+        """返回远端今天已确认上传的字节数。"""
+        if self._connection is None:
+            return 0
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT bytes FROM usage WHERE day = ? AND remote = ?", (self._today(), remote)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def reserve(self, remote: str, size: int) -> None:
+        """为即将上传的文件预留配额，超出时抛出 :class:`QuotaExceededError`。"""
+        quota = self.quotas.get(remote)
+        if quota is None:
+            return
+        used = self.used(remote)
+        with self._lock:
+            reserved = self._reserved.get(remote, 0)
+            if used + reserved + max(0, size) > quota:
+                raise QuotaExceededError(remote, used + reserved, quota)
+            self._reserved[remote] = reserved + max(0, size)
+
+    def settle(self, remote: str, size: int, uploaded: bool) -> None:
+        """释放预留；``uploaded`` 为 True 时把字节数计入当天用量。"""
+        if remote not in self.quotas or self._connection is None:
+            return
+        with self._lock:
+            self._reserved[remote] = max(0, self._reserved.get(remote, 0) - max(0, size))
+            if uploaded:
+                self._connection.execute(
+                    "INSERT INTO usage (day, remote, bytes) VALUES (?, ?, ?) "
+                    "ON CONFLICT (day, remote) DO UPDATE SET bytes = bytes + excluded.bytes",
+                    (self._today(), remote, max(0, size)),
+                )
+                self._connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def open_daily_quota() -> DailyQuota:
+    """按 DAILY_QUOTA / BANDWIDTH_USAGE_DB 打开每日上传配额；未配置配额时不打开数据库。"""
+    usage_path = os.getenv("BANDWIDTH_USAGE_DB", "").strip() or str(USAGE_DB_PATH)
+    return DailyQuota(parse_quotas(os.getenv("DAILY_QUOTA", "")), usage_path)
@@ -0,0 +1,138 @@
+"""按远端自适应调整并发传输数（AIMD）：吞吐上升时加性增加，出错时乘性减少。"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict
+
+
+@dataclass
+class _RemoteWindow:
+    """一个远端在当前统计窗口内的观测值。"""
+
+    limit: int
+    started: float
+    bytes_done: int = 0
+    completed: int = 0
+    failed: int = 0
+    saturated: bool = False
+    last_throughput: float = 0.0
+    last_increased: bool = False
+    holds: int = 0
+
+
+class AimdController:
+    """
+    每个远端维护一个并发上限，每隔 ``interval`` 秒根据这段时间的观测调整一次：
+
+    * 失败比例超过 ``error_threshold``：上限乘以 ``decrease``（至少减 1），不低于 ``minimum``；
+    * 上限被用满且吞吐比上个窗口提升超过 ``gain_threshold``（或首个窗口）：上限加 1；
+    * 刚加过并发、吞吐反而下降超过 ``gain_threshold``：撤回这次增加；
+    * 其他情况保持不变，但用满上限连续保持 ``probe_after`` 个窗口后会再试探性加 1，以适应链路变化。
+
+    上限同时受调用方传入的 ``ceiling``（例如 UPLOAD_REMOTE_LIMITS）约束。每次决策都会输出日志。
+    """
+
+    def __init__(
+        self,
+        *,
+        minimum: int = 1,
+        initial: int = 2,
+        interval: float = 30.0,
+        error_threshold: float = 0.1,
+        gain_threshold: float = 0.05,
+        decrease: float = 0.5,
+        probe_after: int = 4,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.initial = max(self.minimum, initial)
+        self.interval = interval
+        self.error_threshold = error_threshold
+        self.gain_threshold = gain_threshold
+        self.decrease = decrease
+        self.probe_after = probe_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows: Dict[str, _RemoteWindow] = {}
+
+    def _window(self, remote: str, ceiling: int) -> _RemoteWindow:
+        window = self._windows.get(remote)
+        if window is None:
+            window = _RemoteWindow(max(1, min(self.initial, ceiling)), self._clock())
+            self._windows[remote] = window
+        return window
+
+    def limit(self, remote: str, ceiling: int) -> int:
+        """返回远端当前的并发上限。"""
+        with self._lock:
+            return max(1, min(self._window(remote, ceiling).limit, ceiling))
+
+    def record(
+        self, remote: str, ceiling: int, *, nbytes: int, failed: int = 0, total: int = 1, saturated: bool
+    ) -> None:
+        """
+        记录一次上传结束。
+
+        ``total`` 为本次包含的文件数，``failed`` 为其中需要降速的失败数，``nbytes`` 为成功上传的字节数；
+        ``saturated`` 表示结束时该远端的并发已达上限。
+        """
+        with self._lock:
+            window = self._window(remote, ceiling)
+            window.bytes_done += max(0, nbytes)
+            window.completed += total
+            window.failed += failed
+            window.saturated = window.saturated or saturated
+            now = self._clock()
+            if now - window.started >= self.interval:
+                self._adjust(remote, window, ceiling, now)
+
+    def penalize(self, remote: str) -> None:
+        """记录一次随后会被重试的失败；远端尚无统计窗口时忽略。"""
+        with self._lock:
+            window = self._windows.get(remote)
+            if window is not None:
+                window.failed += 1
+                window.completed += 1
+
+    def _adjust(self, remote: str, window: _RemoteWindow, ceiling: int, now: float) -> None:
+        elapsed = max(now - window.started, 1e-6)
+        throughput = window.bytes_done / elapsed
+        error_rate = window.failed / window.completed if window.completed else 0.0
+        previous = min(window.limit, ceiling)
+        last = window.last_throughput
+        if window.failed and error_rate > self.error_threshold:
+            limit = max(self.minimum, min(previous - 1, math.floor(previous * self.decrease)))
+            reason = "错误率过高，乘性减少"
+        elif not window.saturated:
+            limit = previous
+            reason = "并发未用满，保持"
+        elif not last or throughput > last * (1 + self.gain_threshold):
+            limit = min(ceiling, previous + 1)
+            reason = "吞吐提升，加性增加" if limit > previous else "吞吐提升，已达上限"
+        elif window.last_increased and throughput < last * (1 - self.gain_threshold):
+            limit = max(self.minimum, previous - 1)
+            reason = "加并发后吞吐下降，撤回"
+        elif window.holds + 1 >= self.probe_after:
+            limit = min(ceiling, previous + 1)
+            reason = "吞吐持平，试探增加" if limit > previous else "吞吐持平，已达上限"
+        else:
+            limit = previous
+            reason = "吞吐持平，保持"
+        window.last_increased = limit > previous
+        window.holds = window.holds + 1 if limit == previous else 0
+        print(
+            f"并发调整 {remote}: {previous} -> {limit}（{reason}；吞吐 {throughput / 1024 / 1024:.1f} MB/s，"
+            f"失败 {window.failed}/{window.completed}）"
+        )
+        window.limit = limit
+        # 降速后重新建立吞吐基线，之后照常加性增加
+        window.last_throughput = throughput if limit >= previous else 0.0
+        window.started = now
+        window.bytes_done = 0
+        window.completed = 0
+        window.failed = 0
+        window.saturated = False
@@ -0,0 +1,238 @@
+"""上传后让下游的目录缓存（rclone mount 的 VFS、Openlist）只针对本次涉及的目录失效。"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import requests
+
+from src.openlist import OpenlistClient
+
+PathMap = List[Tuple[str, str]]
+# 返回每个目录的错误信息，成功为 None
+RefreshBatch = Callable[[List[str]], Dict[str, Optional[str]]]
+
+# 目录本身还不在下游缓存的上级目录列表中（新建的目录）时的报错
+_MISSING_PATTERN = re.compile(r"not found|does not exist|no such|不存在|未找到", re.IGNORECASE)
+
+
+def parse_path_map(raw_value: str, name: str = "路径映射") -> PathMap:
+    """
+    解析形如 ``123:/tv=>/mnt/media/tv;456:/movies=>/movies`` 的前缀替换，把 rclone 远端路径换成下游看到的路径。
+
+    左侧为 ``远端:路径`` 前缀，按最长前缀匹配。
+    """
+    path_map: PathMap = []
+    for entry in raw_value.replace("\n", ";").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=>" not in entry:
+            raise ValueError(f"{name} '{entry}' 缺少 '=>'。")
+        remote_prefix, target_prefix = (part.strip() for part in entry.split("=>", 1))
+        if ":" not in remote_prefix or not target_prefix:
+            raise ValueError(f"{name} '{entry}' 无效，左侧应为 '远端:路径'。")
+        remote, path = remote_prefix.split(":", 1)
+        path_map.append((f"{remote}:/{path.strip('/')}".rstrip("/"), target_prefix.rstrip("/") or "/"))
+    path_map.sort(key=lambda item: len(item[0]), reverse=True)
+    return path_map
+
+
+def map_path(path_map: PathMap, remote: str, remote_path: str) -> Optional[str]:
+    """按最长前缀把 ``remote:remote_path`` 替换为下游路径，没有匹配的映射时返回 None。"""
+    target = f"{remote}:/{remote_path.strip('/')}".rstrip("/")
+    for prefix, replacement in path_map:
+        if target == prefix or target.startswith(prefix + "/"):
+            suffix = target[len(prefix):].lstrip("/")
+            return str(PurePosixPath(replacement, suffix)) if suffix else replacement
+    return None
+
+
+def _parent(path: str) -> Optional[str]:
+    """上级目录；相对路径（mount）的根目录为空字符串，根目录没有上级。"""
+    if path in ("", "/"):
+        return None
+    parent = str(PurePosixPath(path).parent)
+    return "" if parent == "." else parent
+
+
+def refresh_with_fallback(directories: Iterable[str], refresh: RefreshBatch) -> Tuple[int, Dict[str, str]]:
+    """
+    刷新一组目录；因为是新建目录而报“不存在”的，改为刷新它的上级目录（直到成功或到达根目录）。
+
+    返回 (成功刷新的目录数, 失败的目录 -> 错误信息)。
+    """
+    pending = sorted(set(directories))
+    done: Set[str] = set()
+    failed: Dict[str, str] = {}
+    refreshed = 0
+    while pending:
+        done.update(pending)
+        parents: Set[str] = set()
+        for directory, error in refresh(pending).items():
+            if error is None:
+                refreshed += 1
+                continue
+            parent = _parent(directory)
+            if _MISSING_PATTERN.search(error) and parent is not None:
+                if parent not in done:
+                    parents.add(parent)
+            else:
+                failed[directory] = error
+        pending = sorted(parents)
+    return refreshed, failed
+
+
+class MountRefresher:
+    """
+    调用 rclone mount 的 RC 接口 ``vfs/refresh``，一次请求刷新多个目录（dir、dir2、dir3 ...）。
+
+    目录为相对挂载根目录的路径；挂载了多个 VFS 时用 ``fs`` 指定远端。
+    """
+
+    name = "rclone mount"
+
+    def __init__(
+        self, url: str, path_map: PathMap, *, user: str = "", password: str = "", fs: str = "", batch_size: int = 64
+    ) -> None:
+        self.url = url.rstrip("/")
+        self.path_map = path_map
+        self.fs = fs
+        self.batch_size = max(1, batch_size)
+        self._session = requests.Session()
+        if user:
+            self._session.auth = (user, password)
+
+    def target(self, remote: str, remote_dir: str) -> Optional[str]:
+        """相对挂载根目录的路径；挂载根目录本身为空字符串。"""
+        path = map_path(self.path_map, remote, remote_dir)
+        return None if path is None else path.strip("/")
+
+    def _refresh_batch(self, directories: List[str]) -> Dict[str, Optional[str]]:
+        results: Dict[str, Optional[str]] = {}
+        for start in range(0, len(directories), self.batch_size):
+            chunk = directories[start:start + self.batch_size]
+            params: Dict[str, str] = {"recursive": "false"}
+            if self.fs:
+                params["fs"] = self.fs
+            for index, directory in enumerate(chunk, 1):
+                params["dir" if index == 1 else f"dir{index}"] = directory
+            try:
+                response = self._session.post(f"{self.url}/vfs/refresh", json=params, timeout=300)
+                body = response.json()
+                if response.status_code != 200:
+                    raise RuntimeError(body.get("error") or response.status_code)
+            except (requests.exceptions.RequestException, ValueError, RuntimeError) as exc:
+                results.update((directory, str(exc)) for directory in chunk)
+                continue
+            outcome = body.get("result") or {}
+            for directory in chunk:
+                status = str(outcome.get(directory, "OK"))
+                results[directory] = None if status == "OK" else status
+        return results
+
+    def refresh(self, directories: Sequence[str]) -> Tuple[int, Dict[str, str]]:
+        return refresh_with_fallback(directories, self._refresh_batch)
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class OpenlistRefresher:
+    """对每个目录调用 Openlist 的 ``fs/list``（``refresh: true``），让 Openlist 重新从存储读取目录列表。"""
+
+    name = "Openlist"
+
+    def __init__(self, client: OpenlistClient, path_map: PathMap, *, workers: int = 4) -> None:
+        self.client = client
+        self.path_map = path_map
+        self.workers = max(1, workers)
+
+    def target(self, remote: str, remote_dir: str) -> Optional[str]:
+        return map_path(self.path_map, remote, remote_dir)
+
+    def _refresh_one(self, directory: str) -> Optional[str]:
+        try:
+            # 只需要触发刷新，不需要目录内容
+            self.client.list_directory(directory, per_page=1, refresh=True, reauthenticate=False)
+        except RuntimeError as exc:
+            return str(exc)
+        return None
+
+    def _refresh_batch(self, directories: List[str]) -> Dict[str, Optional[str]]:
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="openlist-refresh") as executor:
+            return dict(zip(directories, executor.map(self._refresh_one, directories)))
+
+    def refresh(self, directories: Sequence[str]) -> Tuple[int, Dict[str, str]]:
+        if not self.client.authenticate():
+            return 0, {directory: "Openlist 认证失败" for directory in directories}
+        return refresh_with_fallback(directories, self._refresh_batch)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+Refresher = Union[MountRefresher, OpenlistRefresher]
+
+
+class DownstreamRefresh:
+    """
+    收集本次上传涉及的远端目录（去重），在批次结束或守护模式静默 ``debounce`` 秒后依次通知各下游刷新。
+
+    下游按给定顺序刷新：mount 经由 Openlist 读取时，应先刷新 Openlist，再刷新 mount 的 VFS。
+    刷新失败的目录按下游分别保留，再静默 ``debounce`` 秒后重试。
+    """
+
+    def __init__(self, refreshers: Sequence[Refresher], *, debounce: float = 60.0) -> None:
+        self.refreshers = list(refreshers)
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._directories: Set[Tuple[str, str]] = set()
+        # 每个下游上次刷新失败、留待重试的目标目录
+        self._failed: List[Set[str]] = [set() for _ in self.refreshers]
+        self._last_noted = 0.0
+
+    def note(self, remote: str, remote_path: str) -> None:
+        """记录一个上传完成的文件，其所在目录需要刷新。"""
+        parent = str(PurePosixPath("/", remote_path.lstrip("/")).parent)
+        with self._lock:
+            self._directories.add((remote, parent))
+            self._last_noted = time.monotonic()
+
+    def due(self) -> bool:
+        with self._lock:
+            pending = bool(self._directories) or any(self._failed)
+            return pending and time.monotonic() - self._last_noted >= self.debounce
+
+    def flush(self) -> None:
+        with self._lock:
+            touched = sorted(self._directories)
+            self._directories.clear()
+            retries, self._failed = self._failed, [set() for _ in self.refreshers]
+        for position, (refresher, retry) in enumerate(zip(self.refreshers, retries)):
+            # mount 的根目录映射为空字符串，同样需要刷新
+            targets = {
+                target
+                for target in (refresher.target(remote, directory) for remote, directory in touched)
+                if target is not None
+            }
+            targets |= retry
+            if not targets:
+                continue
+            refreshed, failed = refresher.refresh(sorted(targets))
+            print(f"已刷新 {refresher.name} 目录缓存: {len(targets)} 个目录（实际刷新 {refreshed} 个）")
+            for directory, error in failed.items():
+                print(f"刷新 {refresher.name} 目录 {directory or '/'} 失败，稍后重试: {error}")
+            if failed:
+                with self._lock:
+                    self._failed[position].update(failed)
+                    self._last_noted = time.monotonic()
+
+    def close(self) -> None:
+        for refresher in self.refreshers:
+            refresher.close()
@@ -0,0 +1,298 @@
+"""
+Emby 集成：根据正在进行的播放（/Sessions）收紧上传带宽与并发，播放结束后逐步恢复；
+上传完成后只通知 Emby 刷新受影响的目录，而不是整库扫描。
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Any, Dict, List, Optional, Set
+
+import requests
+
+from src.bandwidth import BandwidthScheduler, describe_rate
+from src.downstream import PathMap, map_path
+from src.uploader import UploadPool
+
+# 无法从会话中取得码率时按此估算（bit/s）
+DEFAULT_STREAM_BITRATE = 8_000_000
+
+# 局域网地址段；ipaddress 的 is_private 还包含文档示例等地址段，这里只认真正的内网
+_LAN_NETWORKS = tuple(
+    ipaddress.ip_network(network)
+    for network in ("10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "fc00::/7")
+)
+
+
+class EmbyClient:
+    """Emby HTTP API 的最小封装，使用 ``X-Emby-Token`` 认证。"""
+
+    def __init__(self, base_url: str, api_key: str, *, timeout: float = 10.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.headers["X-Emby-Token"] = api_key
+
+    def close(self) -> None:
+        self._session.close()
+
+    def get(self, path: str, **params: Any) -> Any:
+        response = self._session.get(f"{self.base_url}/{path.lstrip('/')}", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path: str, body: Any) -> None:
+        response = self._session.post(f"{self.base_url}/{path.lstrip('/')}", json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+    def sessions(self) -> List[Dict[str, Any]]:
+        """返回所有活动会话。"""
+        return self.get("/Sessions") or []
+
+
+@dataclass(frozen=True)
+class PlaybackLoad:
+    """当前占用上行带宽的播放：转码与直接串流的路数及总码率（bit/s）。"""
+
+    transcodes: int = 0
+    direct_streams: int = 0
+    bitrate: int = 0
+
+    @property
+    def streams(self) -> int:
+        return self.transcodes + self.direct_streams
+
+    def describe(self) -> str:
+        if not self.streams:
+            return "无人播放"
+        return f"转码 {self.transcodes} 路、直接串流 {self.direct_streams} 路，共 {self.bitrate / 1e6:.1f} Mbps"
+
+
+def _is_lan(endpoint: Optional[str]) -> bool:
+    """``RemoteEndPoint`` 可能是 ``1.2.3.4``、``1.2.3.4:port``、IPv6 地址或 ``[v6]:port``。"""
+    if not endpoint:
+        return False
+    host = endpoint.strip()
+    if host.startswith("["):
+        host = host[1:].partition("]")[0]
+    elif host.count(":") == 1:
+        host = host.rsplit(":", 1)[0]
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    if address.is_loopback or address.is_link_local:
+        return True
+    return any(address.version == network.version and address in network for network in _LAN_NETWORKS)
+
+
+def _stream_bitrate(session: Dict[str, Any], transcoding: bool) -> int:
+    if transcoding:
+        bitrate = (session.get("TranscodingInfo") or {}).get("Bitrate")
+        if bitrate:
+            return int(bitrate)
+    item = session.get("NowPlayingItem") or {}
+    bitrate = item.get("Bitrate")
+    if not bitrate:
+        sources = item.get("MediaSources") or []
+        bitrate = sources[0].get("Bitrate") if sources else None
+    if not bitrate:
+        bitrate = sum(int(stream.get("BitRate") or 0) for stream in item.get("MediaStreams") or [])
+    return int(bitrate) or DEFAULT_STREAM_BITRATE
+
+
+def measure_playback(sessions: List[Dict[str, Any]], *, include_lan: bool = False) -> PlaybackLoad:
+    """
+    统计正在播放（未暂停）的会话。
+
+    ``PlayState.PlayMethod`` 为 ``Transcode`` 的按转码输出码率计，其余（DirectStream / DirectPlay）
+    按媒体码率计。局域网内的播放不占用上行带宽，``include_lan`` 为 False 时忽略。
+    """
+    transcodes = direct = bitrate = 0
+    for session in sessions:
+        if not session.get("NowPlayingItem"):
+            continue
+        state = session.get("PlayState") or {}
+        if state.get("IsPaused"):
+            continue
+        if not include_lan and _is_lan(session.get("RemoteEndPoint")):
+            continue
+        transcoding = state.get("PlayMethod") == "Transcode" or bool(session.get("TranscodingInfo"))
+        if transcoding:
+            transcodes += 1
+        else:
+            direct += 1
+        bitrate += _stream_bitrate(session, transcoding)
+    return PlaybackLoad(transcodes, direct, bitrate)
+
+
+class PlaybackThrottle:
+    """
+    定期轮询 Emby 的播放情况，按占用比例收紧上传。
+
+    上传可用的比例为 ``1 - 播放码率 × headroom / 上行带宽``，低于 ``pause_below`` 时暂停上传。
+    总带宽上限设为剩余的上行带宽，各远端并发按同一比例缩小；有新的播放时立即收紧，
+    播放结束后每次轮询最多放宽 ``ramp_step``，避免瞬间占满上行。Emby 无法访问时保持当前状态。
+    """
+
+    def __init__(
+        self,
+        client: EmbyClient,
+        *,
+        uplink_bps: float,
+        bandwidth: Optional[BandwidthScheduler] = None,
+        pool: Optional[UploadPool] = None,
+        interval: float = 15.0,
+        headroom: float = 1.2,
+        pause_below: float = 0.1,
+        ramp_step: float = 0.25,
+        include_lan: bool = False,
+    ) -> None:
+        self.client = client
+        self.uplink_bps = uplink_bps
+        self.bandwidth = bandwidth
+        self.pool = pool
+        self.interval = interval
+        self.headroom = headroom
+        self.pause_below = pause_below
+        self.ramp_step = ramp_step
+        self.include_lan = include_lan
+        self.fraction = 1.0
+        self.load = PlaybackLoad()
+        self._reachable = True
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def target_fraction(self, load: PlaybackLoad) -> float:
+        """返回播放负载下上传可用的上行比例（0 表示暂停）。"""
+        fraction = max(0.0, 1 - load.bitrate * self.headroom / self.uplink_bps)
+        return 0.0 if fraction < self.pause_below else fraction
+
+    def poll(self) -> None:
+        """轮询一次并应用新的限制。"""
+        try:
+            load = measure_playback(self.client.sessions(), include_lan=self.include_lan)
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            if self._reachable:
+                print(f"无法获取 Emby 播放状态，保持当前上传限制: {exc}")
+            self._reachable = False
+            return
+        self._reachable = True
+        target = self.target_fraction(load)
+        # 收紧立即生效，放宽逐步进行
+        fraction = target if target < self.fraction else min(target, self.fraction + self.ramp_step)
+        if fraction == self.fraction and load == self.load:
+            return
+        self.load = load
+        self.apply(fraction)
+
+    def apply(self, fraction: float) -> None:
+        previous, self.fraction = self.fraction, fraction
+        if self.pool is not None:
+            self.pool.set_throttle(fraction)
+        cap = None if fraction >= 1 else self.uplink_bps / 8 * fraction
+        if self.bandwidth is not None:
+            self.bandwidth.set_cap(cap)
+        if fraction == previous:
+            return
+        if fraction == 0:
+            action = "暂停上传"
+        elif fraction >= 1:
+            action = "恢复全速上传"
+        else:
+            action = f"上传限速 {describe_rate(cap)}，并发降至 {fraction:.0%}"
+        print(f"Emby 播放: {self.load.describe()}，{action}")
+
+    def start(self) -> None:
+        self._poll_safely()
+        self._thread = threading.Thread(target=self._run, name="emby-throttle", daemon=True)
+        self._thread.start()
+
+    def _poll_safely(self) -> None:
+        try:
+            self.poll()
+        except Exception:  # noqa: BLE001 - 轮询线程退出后限速会停在最后一次的状态，不再随播放变化
+            print("Emby 播放限速轮询出错，保持当前上传限制:", file=sys.stderr)
+            traceback.print_exc()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._poll_safely()
+
+    def stop(self) -> None:
+        """停止轮询并解除所有限制。"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.pool is not None:
+            self.pool.set_throttle(1.0)
+        if self.bandwidth is not None:
+            self.bandwidth.set_cap(None)
+
+
+class LibraryRefresher:
+    """
+    收集上传文件所在的 Emby 目录，合并后调用 ``/Library/Media/Updated`` 只刷新这些目录。
+
+    同一目录无论上传了多少文件都只刷新一次。批量模式在运行结束时 :meth:`flush`，
+    守护模式在最后一次上传后静默 ``debounce`` 秒（:meth:`due`）再刷新，避免一集一集地触发扫描。
+    """
+
+    def __init__(self, client: EmbyClient, path_map: PathMap, *, debounce: float = 60.0) -> None:
+        self.client = client
+        self.path_map = path_map
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._folders: Set[str] = set()
+        self._last_noted = 0.0
+        self.unmapped = 0
+
+    def library_folder(self, remote: str, remote_path: str) -> Optional[str]:
+        """把远端文件路径映射为 Emby 中其所在目录的路径，没有匹配的映射时返回 None。"""
+        path = map_path(self.path_map, remote, remote_path)
+        return None if path is None else str(PurePosixPath(path).parent)
+
+    def note(self, remote: str, remote_path: str) -> None:
+        """记录一个上传完成的文件。"""
+        folder = self.library_folder(remote, remote_path)
+        with self._lock:
+            if folder is None:
+                self.unmapped += 1
+                return
+            self._folders.add(folder)
+            self._last_noted = time.monotonic()
+
+    def due(self) -> bool:
+        """有待刷新的目录且距最后一次上传已超过 ``debounce`` 秒时返回 True。"""
+        with self._lock:
+            return bool(self._folders) and time.monotonic() - self._last_noted >= self.debounce
+
+    def flush(self) -> int:
+        """通知 Emby 刷新收集到的目录，返回目录数；请求失败时保留，留待下次。"""
+        with self._lock:
+            folders = sorted(self._folders)
+            self._folders.clear()
+            unmapped, self.unmapped = self.unmapped, 0
+        if unmapped:
+            print(f"有 {unmapped} 个上传文件不在 EMBY_PATH_MAP 的映射范围内，未通知 Emby。")
+        if not folders:
+            return 0
+        updates = [{"Path": folder, "UpdateType": "Created"} for folder in folders]
+        try:
+            self.client.post("/Library/Media/Updated", {"Updates": updates})
+        except requests.exceptions.RequestException as exc:
+            print(f"通知 Emby 刷新失败，稍后重试: {exc}")
+            with self._lock:
+                self._folders.update(folders)
+            return 0
+        print(f"已通知 Emby 刷新 {len(folders)} 个目录: {', '.join(folders[:5])}{' 等' if len(folders) > 5 else ''}")
+        return len(folders)
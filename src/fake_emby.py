@@ -0,0 +1,183 @@
+"""
+本地 Emby API 替身：提供上传脚本用到的 ``/Sessions`` 与 ``/Library/Media/Updated`` 接口，
+便于在没有 Emby 服务器时调试播放限速和目录刷新。
+
+播放会话可以在启动时用 ``--stream`` 指定，也可以运行中 POST ``/fake/sessions`` 替换：
+``{"streams": [{"method": "Transcode", "bitrate": 8000000}, {"method": "DirectPlay", "bitrate": 20000000}]}``。
+用法: ``python -m src.fake_emby --port 8096 --api-key test --stream Transcode:8000000``，
+然后设置 ``EMBY_URL=http://127.0.0.1:8096`` 与 ``EMBY_API_KEY=test``。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+def make_session(
+    index: int,
+    *,
+    method: str = "DirectPlay",
+    bitrate: int = 8_000_000,
+    paused: bool = False,
+    remote_endpoint: str = "203.0.113.10",
+) -> Dict[str, Any]:
+    """构造一个与 Emby 返回格式一致的播放会话。"""
+    session: Dict[str, Any] = {
+        "Id": f"session-{index}",
+        "UserName": f"user{index}",
+        "Client": "Emby Web",
+        "RemoteEndPoint": remote_endpoint,
+        "PlayState": {"IsPaused": paused, "PlayMethod": method},
+        "NowPlayingItem": {"Id": str(1000 + index), "Name": f"Episode {index}", "Bitrate": bitrate},
+    }
+    if method == "Transcode":
+        session["TranscodingInfo"] = {"Bitrate": bitrate, "IsVideoDirect": False}
+        session["NowPlayingItem"]["Bitrate"] = bitrate * 3
+    return session
+
+
+class FakeEmby:
+    """保存替身服务的状态：当前会话、收到的刷新请求和调用计数。"""
+
+    def __init__(self, *, api_key: str = "") -> None:
+        self.api_key = api_key
+        self.calls: Dict[str, int] = {}
+        self._sessions: List[Dict[str, Any]] = []
+        self.refreshed: List[str] = []
+        self._lock = threading.Lock()
+
+    def set_streams(self, streams: List[Dict[str, Any]]) -> None:
+        """用 ``{"method", "bitrate", "paused", "remote"}`` 描述的播放替换当前会话。"""
+        sessions = [
+            make_session(
+                index,
+                method=stream.get("method", "DirectPlay"),
+                bitrate=int(stream.get("bitrate", 8_000_000)),
+                paused=bool(stream.get("paused", False)),
+                remote_endpoint=stream.get("remote", "203.0.113.10"),
+            )
+            for index, stream in enumerate(streams, 1)
+        ]
+        # 空闲的会话（没有播放内容）也会出现在 /Sessions 中
+        sessions.append({"Id": "idle", "UserName": "idle", "Client": "Emby Theater", "PlayState": {}})
+        with self._lock:
+            self._sessions = sessions
+
+    def handle(self, method: str, path: str, token: str, body: Any) -> Tuple[int, Any]:
+        route = path.lower().removeprefix("/emby")
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+        if method == "POST" and route == "/fake/sessions":
+            if not isinstance(body, dict) or not isinstance(body.get("streams"), list):
+                return 400, {"error": "expected {\"streams\": [...]}"}
+            self.set_streams(body["streams"])
+            return 200, {"sessions": len(body["streams"])}
+        if self.api_key and token != self.api_key:
+            return 401, {"error": "Access token is invalid or expired."}
+        if method == "GET" and route == "/sessions":
+            with self._lock:
+                return 200, list(self._sessions)
+        if method == "POST" and route == "/library/media/updated":
+            updates = body.get("Updates") if isinstance(body, dict) else None
+            if not isinstance(updates, list) or not all(isinstance(update, dict) for update in updates):
+                return 400, {"error": "expected {\"Updates\": [...]}"}
+            paths = [str(update.get("Path", "")) for update in updates]
+            with self._lock:
+                self.refreshed.extend(paths)
+            print(f"/Library/Media/Updated: {', '.join(paths)}", flush=True)
+            return 204, None
+        return 404, {"error": f"not found: {path}"}
+
+
+def _make_handler(state: FakeEmby) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, method: str) -> None:
+            url = urlsplit(self.path)
+            token = self.headers.get("X-Emby-Token") or parse_qs(url.query).get("api_key", [""])[0]
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else None
+            except json.JSONDecodeError:
+                body = None
+            status, payload = state.handle(method, url.path, token, body)
+            self.send_response(status)
+            if payload is None:
+                # 与 Emby 一致，204 响应不带响应体
+                self.end_headers()
+                return
+            data = json.dumps(payload).encode("utf-8")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server 约定的方法名
+            self._respond("GET")
+
+        def do_POST(self) -> None:  # noqa: N802
+            self._respond("POST")
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    return Handler
+
+
+def parse_stream(raw_value: str) -> Dict[str, Any]:
+    """解析 ``Transcode:8000000`` 或 ``DirectPlay:20000000:paused`` 形式的播放描述。"""
+    parts = raw_value.split(":")
+    stream: Dict[str, Any] = {"method": parts[0] or "DirectPlay"}
+    if len(parts) > 1 and parts[1]:
+        stream["bitrate"] = int(parts[1])
+    if "paused" in parts[2:]:
+        stream["paused"] = True
+    if "lan" in parts[2:]:
+        stream["remote"] = "192.168.1.20"
+    return stream
+
+
+def start_server(
+    *, host: str = "127.0.0.1", port: int = 0, api_key: str = "", streams: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[ThreadingHTTPServer, FakeEmby, str]:
+    """在后台线程启动替身服务，返回 (server, state, url)；调用 ``server.shutdown()`` 停止。"""
+    state = FakeEmby(api_key=api_key)
+    state.set_streams(streams or [])
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, state, f"http://{bound_host}:{bound_port}"
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地 Emby API 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8096)
+    parser.add_argument("--api-key", default="", help="要求的 API 密钥；为空时不校验")
+    parser.add_argument(
+        "--stream",
+        action="append",
+        default=[],
+        help="初始播放，格式 方式:码率[:paused][:lan]，如 Transcode:8000000，可重复",
+    )
+    args = parser.parse_args(argv)
+
+    state = FakeEmby(api_key=args.api_key)
+    state.set_streams([parse_stream(value) for value in args.stream])
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(state))
+    print(f"fake emby 正在监听 http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
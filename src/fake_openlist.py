@@ -0,0 +1,184 @@
+"""
+本地 Openlist API 替身：提供上传脚本用到的登录、``fs/put``、``fs/get`` 与 ``fs/list`` 接口，
+便于在没有 Openlist 服务器时调试秒传、上传校验与带宽限制。
+
+文件内容保存在内存中。``fs/put`` 带 ``X-File-Md5`` 且服务端已有相同内容时按秒传处理：
+不读取请求体直接返回成功并关闭连接。``truncate`` 模拟只读取部分请求体仍返回 200 的服务端，
+``corrupt`` 中的路径在 ``fs/get`` 中报告错误的摘要。
+用法: ``python -m src.fake_openlist --port 5244``，然后设置 ``OPENLIST_API_BASE_URL=http://127.0.0.1:5244``。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import PurePosixPath
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import unquote
+
+TOKEN = "fake-openlist-token"
+
+
+def _hash_info(data: bytes) -> Dict[str, str]:
+    return {"md5": hashlib.md5(data).hexdigest(), "sha1": hashlib.sha1(data).hexdigest()}
+
+
+class FakeOpenlist:
+    """保存替身服务的状态：文件内容、秒传与异常行为开关和调用计数。"""
+
+    def __init__(self, *, username: str = "admin", password: str = "admin") -> None:
+        self.username = username
+        self.password = password
+        self.files: Dict[str, bytes] = {}
+        self.calls: Dict[str, int] = {}
+        self.rapid_hits = 0
+        # 大于 0 时 fs/put 最多读取这么多字节的请求体，之后照常返回成功
+        self.truncate = 0
+        self.corrupt: Set[str] = set()
+        self.hashes = True
+        self._lock = threading.Lock()
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def known(self, md5: str) -> Optional[bytes]:
+        """返回服务端已有的、MD5 相同的内容。"""
+        with self._lock:
+            return next((data for data in self.files.values() if hashlib.md5(data).hexdigest() == md5), None)
+
+    def store(self, path: str, data: bytes, *, rapid: bool = False) -> None:
+        with self._lock:
+            self.files[path] = data
+            self.rapid_hits += rapid
+
+    def login(self, body: Any) -> Tuple[int, Dict[str, Any]]:
+        if isinstance(body, dict) and (body.get("username"), body.get("password")) == (self.username, self.password):
+            return 200, {"code": 200, "message": "success", "data": {"token": TOKEN}}
+        return 200, {"code": 400, "message": "password is incorrect", "data": None}
+
+    def get(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        path = str(body.get("path", ""))
+        with self._lock:
+            data = self.files.get(path)
+        if data is None:
+            return 200, {"code": 500, "message": "object not found", "data": None}
+        hash_info = _hash_info(data) if self.hashes else {}
+        if path in self.corrupt:
+            hash_info = {name: "0" * len(value) for name, value in hash_info.items()}
+        info = {"name": PurePosixPath(path).name, "size": len(data), "is_dir": False, "hash_info": hash_info}
+        return 200, {"code": 200, "message": "success", "data": info}
+
+    def list(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        directory = str(PurePosixPath("/", str(body.get("path", "/"))))
+        with self._lock:
+            content = [
+                {"name": PurePosixPath(path).name, "size": len(data), "is_dir": False}
+                for path, data in sorted(self.files.items())
+                if str(PurePosixPath(path).parent) == directory
+            ]
+        return 200, {"code": 200, "message": "success", "data": {"content": content, "total": len(content)}}
+
+
+def _make_handler(state: FakeOpenlist) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: Dict[str, Any], *, close: bool = False) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if close:
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            self.end_headers()
+            self.wfile.write(data)
+            self.wfile.flush()
+
+        def _json_body(self) -> Any:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                return json.loads(raw) if raw else {}
+            except json.JSONDecodeError:
+                return None
+
+        def do_POST(self) -> None:  # noqa: N802 - http.server 约定的方法名
+            route = self.path.split("?", 1)[0]
+            state.count(route)
+            body = self._json_body()
+            if route == "/api/auth/login":
+                self._send(*state.login(body))
+                return
+            if self.headers.get("Authorization") != TOKEN:
+                self._send(200, {"code": 401, "message": "token is invalidated", "data": None})
+                return
+            if not isinstance(body, dict):
+                self._send(200, {"code": 400, "message": "invalid JSON body", "data": None})
+            elif route == "/api/fs/get":
+                self._send(*state.get(body))
+            elif route == "/api/fs/list":
+                self._send(*state.list(body))
+            else:
+                self._send(404, {"code": 404, "message": f"not found: {route}", "data": None})
+
+        def do_PUT(self) -> None:  # noqa: N802
+            route = self.path.split("?", 1)[0]
+            state.count(route)
+            length = int(self.headers.get("Content-Length") or 0)
+            if route != "/api/fs/put" or self.headers.get("Authorization") != TOKEN:
+                self.rfile.read(length)
+                self._send(200, {"code": 401, "message": "token is invalidated", "data": None})
+                return
+            path = unquote(self.headers.get("File-Path", ""))
+            known = state.known(str(self.headers.get("X-File-Md5", "")).lower())
+            if known is not None:
+                # 秒传：不读取请求体，返回后关闭连接
+                state.store(path, known, rapid=True)
+                self._send(200, {"code": 200, "message": "success", "data": None}, close=True)
+                return
+            limit = min(length, state.truncate) if state.truncate else length
+            data = self.rfile.read(limit)
+            state.store(path, data)
+            self._send(200, {"code": 200, "message": "success", "data": None}, close=limit < length)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    return Handler
+
+
+def start_server(*, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, FakeOpenlist, str]:
+    """在后台线程启动替身服务，返回 (server, state, url)；调用 ``server.shutdown()`` 停止。"""
+    state = FakeOpenlist()
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, state, f"http://{bound_host}:{bound_port}"
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地 Openlist API 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5244)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    args = parser.parse_args(argv)
+
+    state = FakeOpenlist(username=args.username, password=args.password)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(state))
+    print(f"fake openlist 正在监听 http://{args.host}:{args.port}（账号 {args.username}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+本地 ``rclone rcd`` 替身：用纯 Python 实现上传脚本用到的 RC 接口，便于在没有 rclone 和网络时调试。
+
+远端 ``name:path`` 会映射到 ``<root>/name/path``，不带远端名的 fs 视为本机路径。
+用法: ``python -m src.fake_rcd --root /tmp/fake-remote --port 5572``，
+然后设置 ``RCLONE_BACKEND=rcd`` 与 ``RCLONE_RC_URL=http://127.0.0.1:5572``。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class FakeRcd:
+    """保存替身服务的状态：远端根目录、异步任务表和调用计数。"""
+
+    def __init__(self, root: str | Path, *, copy_delay: float = 0.0) -> None:
+        self.root = Path(root)
+        self.copy_delay = copy_delay
+        self.calls: Dict[str, int] = {}
+        self.bwlimit = "off"
+        # 大于 0 时接下来这么多次 job/status 返回 500，模拟 rcd 暂时无法响应
+        self.status_failures = 0
+        # vfs/refresh 刷新过的目录（相对挂载根目录，根目录为空字符串）；vfs_down 为 True 时返回 500
+        self.refreshed: List[str] = []
+        self.vfs_down = False
+        self._jobs: Dict[int, Dict[str, Any]] = {}
+        self._next_job = 1
+        self._lock = threading.Lock()
+        self._methods: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            "rc/noop": lambda params: params,
+            "core/version": lambda params: {"version": "fake-rcd"},
+            "operations/copyfile": self._copyfile,
+            "operations/list": self._list,
+            "job/status": self._job_status,
+            "core/bwlimit": self._bwlimit,
+            "vfs/refresh": self._vfs_refresh,
+        }
+
+    def resolve(self, fs: str, remote: str = "") -> Path:
+        """把 rclone 的 ``fs`` + ``remote`` 映射为本地路径。"""
+        name, sep, base = fs.partition(":")
+        if sep and "/" not in name:
+            path = self.root / name / base.lstrip("/")
+        else:
+            path = Path(fs)
+        return path / remote.lstrip("/") if remote else path
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        handler = self._methods.get(method)
+        if handler is None:
+            return 404, {"error": f"couldn't find method {method!r}", "path": method, "status": 404}
+        try:
+            return 200, handler(params)
+        except (OSError, KeyError, ValueError) as exc:
+            return 500, {"error": str(exc), "input": params, "path": method, "status": 500}
+
+    def _do_copy(self, params: Dict[str, Any]) -> None:
+        source = self.resolve(params["srcFs"], params["srcRemote"])
+        target = self.resolve(params["dstFs"], params["dstRemote"])
+        if self.copy_delay:
+            time.sleep(self.copy_delay)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, target)
+
+    def _copyfile(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if not params.get("_async"):
+            self._do_copy(params)
+            return {}
+        with self._lock:
+            job_id = self._next_job
+            self._next_job += 1
+            self._jobs[job_id] = {"id": job_id, "finished": False, "success": False, "error": ""}
+        threading.Thread(target=self._run_job, args=(job_id, params), daemon=True).start()
+        return {"jobid": job_id}
+
+    def _run_job(self, job_id: int, params: Dict[str, Any]) -> None:
+        error = ""
+        try:
+            self._do_copy(params)
+        except (OSError, KeyError) as exc:
+            error = str(exc)
+        with self._lock:
+            self._jobs[job_id].update(finished=True, success=not error, error=error)
+
+    def _job_status(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if self.status_failures > 0:
+                self.status_failures -= 1
+                raise OSError("job status temporarily unavailable")
+            job = self._jobs.get(int(params["jobid"]))
+        if job is None:
+            raise ValueError("job not found")
+        return dict(job)
+
+    def _bwlimit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        # 只记录限速，不实际限制复制速度
+        if "rate" in params:
+            self.bwlimit = str(params["rate"])
+            print(f"core/bwlimit -> {self.bwlimit}")
+        return {"rate": self.bwlimit}
+
+    def _vfs_refresh(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.vfs_down:
+            raise OSError("vfs is not available")
+        directories = [str(value) for key, value in params.items() if key.startswith("dir")] or [""]
+        with self._lock:
+            self.refreshed.extend(directories)
+        return {"result": {directory: "OK" for directory in directories}}
+
+    def _list(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        directory = self.resolve(params["fs"], params.get("remote", ""))
+        if not directory.is_dir():
+            raise FileNotFoundError("directory not found")
+        opt = params.get("opt") or {}
+        files_only = bool(opt.get("filesOnly"))
+        entries = []
+        for child in sorted(directory.iterdir()):
+            if files_only and child.is_dir():
+                continue
+            entry = {
+                "Path": child.name,
+                "Name": child.name,
+                "Size": -1 if child.is_dir() else child.stat().st_size,
+                "IsDir": child.is_dir(),
+            }
+            if opt.get("showHash") and not child.is_dir():
+                entry["Hashes"] = {"md5": hashlib.md5(child.read_bytes()).hexdigest()}
+            entries.append(entry)
+        return {"list": entries}
+
+
+def _make_handler(state: FakeRcd) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:  # noqa: N802 - http.server 约定的方法名
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                params = json.loads(raw) if raw else {}
+            except json.JSONDecodeError:
+                params = None
+            if not isinstance(params, dict):
+                status, body = 400, {"error": "invalid JSON body", "status": 400}
+            else:
+                status, body = state.handle(self.path.strip("/"), params)
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    return Handler
+
+
+def start_server(
+    root: str | Path, *, host: str = "127.0.0.1", port: int = 0, copy_delay: float = 0.0
+) -> Tuple[ThreadingHTTPServer, FakeRcd, str]:
+    """在后台线程启动替身服务，返回 (server, state, url)；调用 ``server.shutdown()`` 停止。"""
+    state = FakeRcd(root, copy_delay=copy_delay)
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, state, f"http://{bound_host}:{bound_port}"
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地 rclone rcd 替身服务")
+    parser.add_argument("--root", required=True, help="模拟远端的本地根目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5572)
+    parser.add_argument("--copy-delay", type=float, default=0.0, help="每次复制前的人为延迟（秒）")
+    args = parser.parse_args(argv)
+
+    state = FakeRcd(args.root, copy_delay=args.copy_delay)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(state))
+    print(f"fake rcd 正在监听 http://{args.host}:{args.port}，远端根目录 {args.root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
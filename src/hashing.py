@@ -0,0 +1,215 @@
+"""预先计算摘要：在上传之前用进程池读取文件计算摘要并写入摘要缓存，上传与校验时直接取用。"""
+
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.localfile import HashCache
+from src.uploader import UploadTask
+
+# 工作进程中的摘要缓存，由 _init_worker 打开
+_worker_cache: Optional[HashCache] = None
+
+
+def _init_worker(db_path: Optional[str], use_xattr: bool) -> None:
+    global _worker_cache
+    _worker_cache = HashCache(db_path, use_xattr=use_xattr)
+
+
+def _hash_file(path: str, algorithms: Sequence[str]) -> Tuple[Dict[str, str], bool]:
+    """在工作进程中取得摘要，返回 (摘要, 是否实际读取了文件)。"""
+    assert _worker_cache is not None
+    computed = _worker_cache.computed
+    digests = _worker_cache.digests(path, algorithms)
+    return digests, _worker_cache.computed > computed
+
+
+@lru_cache(maxsize=None)
+def physical_device(dev: int) -> str:
+    """把文件系统的设备号归到所在的物理磁盘（分区归到整盘）；无法判断时（如网络文件系统）按设备号区分。"""
+    try:
+        block = Path(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}").resolve(strict=True)
+    except OSError:
+        return f"dev-{dev}"
+    if (block / "partition").exists():
+        block = block.parent
+    return block.name
+
+
+@dataclass
+class _Pending:
+    task: UploadTask
+    device: str = ""
+    future: Optional[Future] = None
+    pool: Optional[ProcessPoolExecutor] = None
+    released: bool = False
+
+
+class HashAhead:
+    """
+    流水线阶段：在上传之前预先计算文件摘要。
+
+    文件在 ``workers`` 个进程中读取（绕开 GIL，大块顺序读取），同一物理磁盘上同时读取的文件
+    不超过 ``per_device`` 个，避免机械硬盘来回寻道。摘要写入 :class:`HashCache` 并附在任务上，
+    输出顺序与输入一致；最多向前处理 ``lookahead`` 个文件。续跑的任务不需要上传，直接放行。
+    """
+
+    def __init__(
+        self,
+        algorithms: Sequence[str],
+        *,
+        cache: HashCache,
+        workers: int = 2,
+        per_device: int = 1,
+        lookahead: int = 0,
+    ) -> None:
+        self.algorithms = list(dict.fromkeys(algorithms))
+        unknown = [name for name in self.algorithms if name not in hashlib.algorithms_available]
+        if unknown or not self.algorithms:
+            raise ValueError(f"不支持的摘要算法: {', '.join(unknown) or '（空）'}")
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.per_device = max(1, per_device)
+        self.lookahead = max(lookahead, self.workers * 4)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.computed = 0
+        self.cached = 0
+        self.failed = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # 守护模式下多次运行流水线，进程池只启动一次；主进程有多个线程，不使用 fork
+        if self._executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.cache.db_path, self.cache.use_xattr),
+            )
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _discard_pool(self, executor: Optional[ProcessPoolExecutor]) -> None:
+        """工作进程意外退出后进程池不能再用：丢弃它，下次提交时重建。"""
+        if executor is not None and executor is self._executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _skip(self, entry: _Pending, exc: BaseException) -> None:
+        """摘要算不出来时文件照常上传，只是不带预先计算的摘要。"""
+        self.failed += 1
+        print(f"计算摘要失败 {entry.task.local_path}: {exc}")
+
+    def _prepare(self, task: UploadTask) -> _Pending:
+        """已在缓存中的文件直接取用，不占用工作进程。"""
+        entry = _Pending(task)
+        if task.resumed:
+            return entry
+        try:
+            stat = task.local_path.stat()
+            digests = self.cache.lookup(task.local_path, self.algorithms, stat)
+        except (OSError, sqlite3.Error):
+            # 交给上传阶段报告
+            return entry
+        if len(digests) == len(self.algorithms):
+            self.cached += 1
+            entry.task = replace(task, digests=digests)
+        else:
+            entry.device = physical_device(stat.st_dev)
+        return entry
+
+    def _submit_ready(self, pending: Deque[_Pending], running: Counter) -> None:
+        for entry in pending:
+            if entry.device and entry.future is None and running[entry.device] < self.per_device:
+                executor = self._pool()
+                try:
+                    entry.future = executor.submit(_hash_file, str(entry.task.local_path), self.algorithms)
+                except BrokenProcessPool as exc:
+                    self._discard_pool(executor)
+                    self._skip(entry, exc)
+                    entry.device = ""
+                    continue
+                entry.pool = executor
+                running[entry.device] += 1
+
+    def _release_done(self, pending: Deque[_Pending], running: Counter) -> None:
+        for entry in pending:
+            if entry.future is not None and not entry.released and entry.future.done():
+                entry.released = True
+                running[entry.device] -= 1
+
+    @staticmethod
+    def _head_ready(entry: _Pending) -> bool:
+        if entry.future is None:
+            return not entry.device
+        return entry.future.done()
+
+    def _finish(self, pending: Deque[_Pending], running: Counter) -> UploadTask:
+        """等待队首的文件算完并出队；它所在的磁盘忙时先等其他文件让出位置。"""
+        head = pending[0]
+        while head.device and head.future is None:
+            busy = [entry.future for entry in pending if entry.future is not None and not entry.released]
+            wait(busy, return_when=FIRST_COMPLETED)
+            self._release_done(pending, running)
+            self._submit_ready(pending, running)
+        pending.popleft()
+        if head.future is None:
+            return head.task
+        try:
+            digests, computed = head.future.result()
+        except Exception as exc:  # noqa: BLE001 - 包括读取失败、缓存库出错和工作进程意外退出
+            if isinstance(exc, BrokenProcessPool):
+                self._discard_pool(head.pool)
+            self._skip(head, exc)
+            return head.task
+        finally:
+            if not head.released:
+                head.released = True
+                running[head.device] -= 1
+            self._submit_ready(pending, running)
+        if computed:
+            self.computed += 1
+        else:
+            self.cached += 1
+        return replace(head.task, digests=digests)
+
+    def transform(self, tasks: Iterator[UploadTask]) -> Iterator[UploadTask]:
+        pending: Deque[_Pending] = deque()
+        running: Counter = Counter()
+        try:
+            for task in tasks:
+                pending.append(self._prepare(task))
+                self._release_done(pending, running)
+                self._submit_ready(pending, running)
+                while pending and (len(pending) >= self.lookahead or self._head_ready(pending[0])):
+                    yield self._finish(pending, running)
+            while pending:
+                yield self._finish(pending, running)
+        finally:
+            for entry in pending:
+                if entry.future is not None:
+                    entry.future.cancel()
+
+    def report(self) -> List[str]:
+        if not (self.computed or self.cached or self.failed):
+            return []
+        line = f"预先计算摘要: 读取 {self.computed} 个文件，缓存命中 {self.cached} 个"
+        return [line + (f"，失败 {self.failed} 个" if self.failed else "")]
+
+    def reset_stats(self) -> None:
+        self.computed = self.cached = self.failed = 0
@@ -0,0 +1,184 @@
+"""基于 ctypes 的 Linux inotify 封装，递归监视目录树中新建、写完、移入和删除的文件。"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")
+
+# 变化类型
+READY = "ready"  # 文件被创建、写完或移入，是否写完由调用方的稳定性检查决定
+REMOVED = "removed"  # 文件或目录被删除、移出
+OVERFLOW = "overflow"  # 事件队列溢出或监视失败，需要全量扫描
+
+
+@dataclass(frozen=True)
+class Change:
+    kind: str
+    path: Path
+
+
+def _load_libc() -> ctypes.CDLL:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class TreeWatcher:
+    """
+    递归监视若干根目录。
+
+    新建或移入的子目录会自动加入监视，并把其中已有的文件当作就绪文件上报，
+    以覆盖“目录创建后、监视加上前”写入的文件。监视数达到系统上限时上报 ``OVERFLOW``，
+    由调用方退回全量扫描。
+    """
+
+    def __init__(self, roots: Iterable[Path]) -> None:
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 失败: {os.strerror(err)}")
+        self._paths: Dict[int, Path] = {}
+        self._watches: Dict[Path, int] = {}
+        self._pending: List[Change] = []
+        for root in roots:
+            self._add_tree(Path(root), report_files=False)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> "TreeWatcher":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._watches)
+
+    def _add_watch(self, directory: Path) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return False
+            # ENOSPC: 超出 fs.inotify.max_user_watches
+            print(f"无法监视目录 {directory}: {os.strerror(err)}")
+            self._pending.append(Change(OVERFLOW, directory))
+            return False
+        self._paths[wd] = directory
+        self._watches[directory] = wd
+        return True
+
+    def _add_tree(self, root: Path, *, report_files: bool) -> None:
+        for current, dirnames, filenames in os.walk(root):
+            current_path = Path(current)
+            if not self._add_watch(current_path):
+                dirnames[:] = []
+                continue
+            if report_files:
+                self._pending.extend(Change(READY, current_path / name) for name in filenames)
+
+    def _drop_tree(self, root: Path) -> None:
+        prefix = f"{root}{os.sep}"
+        for directory in [path for path in self._watches if path == root or str(path).startswith(prefix)]:
+            wd = self._watches.pop(directory)
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def poll(self, timeout: float) -> List[Change]:
+        """等待最多 ``timeout`` 秒，返回这段时间内的变化。"""
+        if not self._pending:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if readable:
+                self._read_events()
+        else:
+            self._read_events()
+        changes, self._pending = self._pending, []
+        return changes
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            self._pending.append(Change(OVERFLOW, Path("/")))
+            return
+        directory = self._paths.get(wd)
+        if mask & IN_IGNORED:
+            if directory is not None:
+                self._paths.pop(wd, None)
+                self._watches.pop(directory, None)
+            return
+        if directory is None:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self._drop_tree(directory)
+            self._pending.append(Change(REMOVED, directory))
+            return
+
+        path = directory / name
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path, report_files=True)
+            elif mask & (IN_MOVED_FROM | IN_DELETE):
+                self._drop_tree(path)
+                self._pending.append(Change(REMOVED, path))
+            return
+        # 硬链接、ln 与 cp --reflink 只产生 IN_CREATE，没有 IN_CLOSE_WRITE；
+        # 普通写入的文件在 IN_CREATE 之后还会有 IN_CLOSE_WRITE，重复上报由调用方合并
+        if mask & (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._pending.append(Change(READY, path))
+        elif mask & (IN_MOVED_FROM | IN_DELETE):
+            self._pending.append(Change(REMOVED, path))
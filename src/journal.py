@@ -0,0 +1,145 @@
+"""持久化的上传日志（SQLite），记录每个文件的状态变迁，便于中断后续跑。"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.uploader import UploadTask
+
+STATE_UPLOADED = "uploaded"
+STATE_VERIFIED = "verified"
+STATE_DELETED = "deleted"
+STATE_FAILED = "failed"
+
+# 这些状态表示远端已有完整副本，续跑时只需删除本地文件
+REMOTE_CONFIRMED_STATES = (STATE_UPLOADED, STATE_VERIFIED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    remote TEXT NOT NULL,
+    remote_path TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    uploaded_at REAL,
+    deleted_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_state ON files (state, updated_at);
+"""
+
+_UPSERT = """
+INSERT INTO files (path, size, mtime_ns, state, remote, remote_path, error,
+                   created_at, updated_at, uploaded_at, deleted_at)
+VALUES (:path, :size, :mtime_ns, :state, :remote, :remote_path, :error,
+        :now, :now, :uploaded_at, :deleted_at)
+ON CONFLICT (path) DO UPDATE SET
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    state = excluded.state,
+    remote = excluded.remote,
+    remote_path = excluded.remote_path,
+    error = excluded.error,
+    updated_at = excluded.updated_at,
+    uploaded_at = COALESCE(excluded.uploaded_at, files.uploaded_at),
+    deleted_at = excluded.deleted_at
+"""
+
+
+@dataclass(frozen=True)
+class JournalEntry:
+    """日志中的一条文件记录。"""
+
+    path: str
+    size: int
+    mtime_ns: int
+    state: str
+    remote: str
+    remote_path: str
+    error: Optional[str]
+    created_at: float
+    updated_at: float
+    uploaded_at: Optional[float]
+    deleted_at: Optional[float]
+
+
+class UploadJournal:
+    """
+    以本地路径为主键的 SQLite 上传日志。
+
+    使用 WAL 模式，每次状态变迁立即提交，进程被杀后已确认上传的文件不会被重复上传。
+    连接在各阶段线程之间共享，写入由锁串行化。
+    """
+
+    def __init__(self, db_path: str | Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, path: str | Path) -> Optional[JournalEntry]:
+        """按本地路径查询记录（主键索引）。"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE path = ?", (str(path),)).fetchone()
+        return JournalEntry(**dict(row)) if row else None
+
+    def is_uploaded(self, task: UploadTask) -> bool:
+        """文件未变化且此前已确认上传到同一远端路径时返回 True。"""
+        entry = self.lookup(task.local_path)
+        return (
+            entry is not None
+            and entry.state in REMOTE_CONFIRMED_STATES
+            and entry.size == task.size
+            and entry.mtime_ns == task.mtime_ns
+            and entry.remote == task.remote
+            and entry.remote_path == task.remote_path
+        )
+
+    def record(self, task: UploadTask, state: str, *, error: Optional[str] = None) -> None:
+        """记录一次状态变迁并立即提交。"""
+        now = time.time()
+        params = {
+            "path": str(task.local_path),
+            "size": task.size,
+            "mtime_ns": task.mtime_ns,
+            "state": state,
+            "remote": task.remote,
+            "remote_path": task.remote_path,
+            "error": error,
+            "now": now,
+            "uploaded_at": now if state == STATE_UPLOADED else None,
+            "deleted_at": now if state == STATE_DELETED else None,
+        }
+        with self._lock:
+            self._conn.execute(_UPSERT, params)
+
+    def counts(self) -> Dict[str, int]:
+        """按状态统计记录数。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def prune(self, max_age_seconds: float) -> int:
+        """删除早于指定时长的已删除记录，返回清理条数。"""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM files WHERE state = ? AND updated_at < ?", (STATE_DELETED, cutoff)
+            )
+        return cursor.rowcount
@@ -2,9 +2,45 @@
 
 from __future__ import annotations
 
+import errno
+import hashlib
+import heapq
 import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Generator, List, Tuple
+from typing import Dict, Generator, Iterable, List, Optional, Set, Tuple
+
+from src.scan_cache import DirectoryCache
+
+
+# 计算摘要时每次读取的字节数；大块顺序读取对机械硬盘更友好
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 摘要缓存写在文件的扩展属性 user.uploader.<算法> 中，值为 "大小:mtime_ns:摘要"
+_HASH_XATTR_PREFIX = "user.uploader."
+_HASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (dev, inode, algorithm)
+) WITHOUT ROWID;
+"""
+# SQLite 中超过这么久未使用的摘要（文件多半已删除）在打开时清理
+_HASH_RETENTION_SECONDS = 90 * 86400
+# 命中时最多每隔这么久更新一次使用时间，避免每次查询都写库
+_HASH_TOUCH_INTERVAL = 86400
+# 修改时间距计算时刻太近的文件不缓存摘要，避免同一时间粒度内的后续写入被漏掉
+_HASH_RACY_WINDOW_NS = 2_000_000_000
+# 表示文件系统不支持 user.* 扩展属性的错误码
+_XATTR_UNSUPPORTED = {errno.ENOTSUP, errno.EOPNOTSUPP, errno.EROFS}
 
 
 def ensure_directory(path: str | Path) -> Path:
@@ -37,6 +73,102 @@ def iter_files_sorted(root_dir: str | Path) -> Generator[Path, None, None]:
             yield current_path / filename
 
 
+@dataclass(frozen=True, slots=True)
+class FileRecord:
+    """扫描得到的文件记录：绝对路径、相对映射根目录的 POSIX 路径以及扫描时的 stat 信息。"""
+
+    path: Path
+    relative: str
+    size: int
+    mtime_ns: int
+    inode: int
+    dev: int
+
+
+def _make_record(path: Path, relative: str, stat: os.stat_result) -> FileRecord:
+    return FileRecord(path, relative, stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+
+
+def file_record(path: str | Path, root_dir: Path) -> FileRecord:
+    """为 ``root_dir`` 下的单个文件生成记录；``root_dir`` 须为已解析的目录。"""
+    file_path = Path(path)
+    return _make_record(file_path, file_path.relative_to(root_dir).as_posix(), file_path.stat())
+
+
+def _read_directory(path: Path) -> Tuple[List[os.DirEntry], List[str]]:
+    """读取目录项，按 os.walk 的规则区分文件和（不跟随符号链接的）子目录。"""
+    files: List[os.DirEntry] = []
+    subdirs: List[str] = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                files.append(entry)
+            elif not entry.is_symlink():
+                subdirs.append(entry.name)
+    files.sort(key=lambda entry: entry.name)
+    subdirs.sort()
+    return files, subdirs
+
+
+def iter_file_records(
+    root_dir: str | Path, cache: Optional[DirectoryCache] = None
+) -> Generator[FileRecord, None, None]:
+    """
+    基于 os.scandir 按 :func:`iter_files_sorted` 的顺序遍历文件，直接产出带 stat 信息的记录。
+
+    相对路径在遍历时逐级拼接，无需对每个文件再做 resolve/exists；每个文件只 stat 一次。
+    提供 ``cache`` 时，mtime 未变化的目录直接使用缓存的目录项，不再读取目录。
+    扫描期间消失的文件会被跳过。
+    """
+    base_path = ensure_directory(root_dir)
+    stack: List[Tuple[Path, str]] = [(base_path, "")]
+    while stack:
+        current, prefix = stack.pop()
+        cached = None
+        if cache is not None:
+            try:
+                dir_stat = current.stat()
+            except OSError:
+                cache.forget_tree(current)
+                continue
+            cached = cache.lookup(current, dir_stat.st_mtime_ns, dir_stat.st_ino)
+
+        if cached is not None:
+            names, subdirs = cached
+            cache.skipped += 1
+            for name in names:
+                file_path = current / name
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                yield _make_record(file_path, prefix + name, stat)
+        else:
+            try:
+                entries, subdirs = _read_directory(current)
+            except OSError:
+                continue
+            if cache is not None:
+                for removed in set(cache.lookup_subdirs(current)) - set(subdirs):
+                    cache.forget_tree(current / removed)
+                names = [entry.name for entry in entries]
+                cache.store(current, dir_stat.st_mtime_ns, dir_stat.st_ino, names, subdirs)
+                cache.read += 1
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield _make_record(current / entry.name, prefix + entry.name, stat)
+        stack.extend((current / name, f"{prefix}{name}/") for name in reversed(subdirs))
+    if cache is not None:
+        cache.commit()
+
+
 def relative_path(file_path: str | Path, root_dir: str | Path) -> Path:
     """返回文件相对于根目录的 Path 对象。"""
     base_path = ensure_directory(root_dir)
@@ -95,3 +227,209 @@ def remove_empty_directories(root_dir: str | Path, *, preserve_root: bool = True
         except OSError:
             continue
     return removed
+
+
+def prune_empty_parents(directories: Iterable[str | Path], root_dir: str | Path) -> int:
+    """
+    从给定目录开始逐级向上删除空目录，遇到非空目录即停止，根目录本身保留；返回删除的目录数量。
+
+    只访问传入目录及其祖先，代价与删除的文件数成正比，与目录树大小无关。
+    总是先处理更深的目录，保证兄弟目录都删掉之后才尝试删除它们的父目录。
+    """
+    base_path = ensure_directory(root_dir)
+    heap: List[Tuple[int, str]] = []
+    queued: Set[Path] = set()
+
+    def push(directory: Path) -> None:
+        if directory != base_path and directory not in queued and directory.is_relative_to(base_path):
+            queued.add(directory)
+            heapq.heappush(heap, (-len(directory.parts), str(directory)))
+
+    for directory in directories:
+        push(Path(directory))
+
+    removed = 0
+    while heap:
+        _, directory = heapq.heappop(heap)
+        try:
+            os.rmdir(directory)
+        except FileNotFoundError:
+            # 已被其他进程删除，父目录仍可能变空
+            pass
+        except OSError:
+            # 目录非空或无权限
+            continue
+        else:
+            removed += 1
+        push(Path(directory).parent)
+    return removed
+
+
+def file_digests(path: str | Path, algorithms: Iterable[str]) -> Dict[str, str]:
+    """顺序读取一遍文件，同时计算多种摘要（hashlib 算法名），返回 算法 -> 十六进制摘要。"""
+    hashers = {name: hashlib.new(name) for name in algorithms}
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as stream:
+        if hasattr(os, "posix_fadvise"):
+            # 提示内核整文件顺序读取，加大预读
+            os.posix_fadvise(stream.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            count = stream.readinto(buffer)
+            if not count:
+                break
+            for hasher in hashers.values():
+                hasher.update(view[:count])
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+
+class HashCache:
+    """
+    持久化的文件内容摘要缓存，以 (dev, inode, size, mtime_ns) 识别文件内容。
+
+    文件系统支持时把摘要写入文件自身的 ``user.uploader.<算法>`` 扩展属性（重命名、移动后仍然有效），
+    不支持或无权写入时记录到本地 SQLite。文件大小或 mtime 变化后旧摘要不再匹配，下次计算时覆盖；
+    缺少的多个算法在一次读取中一并计算。连接允许跨线程使用，访问由锁串行化。
+    """
+
+    def __init__(self, db_path: str | Path | None = None, *, use_xattr: bool = True) -> None:
+        self.db_path = str(db_path) if db_path else None
+        self.use_xattr = use_xattr and hasattr(os, "getxattr")
+        # 按设备记录扩展属性是否可用，不支持的文件系统只探测一次
+        self._xattr_devices: Dict[int, bool] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.computed = 0
+        if db_path:
+            path = Path(db_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_HASH_SCHEMA)
+            self._conn.execute("DELETE FROM file_hashes WHERE used_at < ?", (time.time() - _HASH_RETENTION_SECONDS,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _xattr_usable(self, dev: int) -> bool:
+        return self.use_xattr and self._xattr_devices.get(dev, True)
+
+    def _read_xattrs(self, path: Path, stat: os.stat_result, algorithms: Iterable[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for name in algorithms:
+            try:
+                raw = os.getxattr(path, _HASH_XATTR_PREFIX + name).decode("ascii")
+            except OSError as exc:
+                if exc.errno in _XATTR_UNSUPPORTED:
+                    self._xattr_devices[stat.st_dev] = False
+                    break
+                continue
+            except UnicodeDecodeError:
+                continue
+            size, _, rest = raw.partition(":")
+            mtime_ns, _, digest = rest.partition(":")
+            if digest and size == str(stat.st_size) and mtime_ns == str(stat.st_mtime_ns):
+                found[name] = digest
+        return found
+
+    def _write_xattrs(self, path: Path, stat: os.stat_result, digests: Dict[str, str]) -> bool:
+        """写入扩展属性，全部成功时返回 True。"""
+        try:
+            for name, digest in digests.items():
+                value = f"{stat.st_size}:{stat.st_mtime_ns}:{digest}".encode("ascii")
+                os.setxattr(path, _HASH_XATTR_PREFIX + name, value)
+        except OSError as exc:
+            if exc.errno in _XATTR_UNSUPPORTED:
+                self._xattr_devices[stat.st_dev] = False
+            return False
+        self._xattr_devices[stat.st_dev] = True
+        return True
+
+    def _read_rows(self, stat: os.stat_result, algorithms: Iterable[str]) -> Dict[str, str]:
+        names = list(algorithms)
+        if self._conn is None or not names:
+            return {}
+        placeholders = ", ".join("?" for _ in names)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT algorithm, size, mtime_ns, digest, used_at FROM file_hashes "
+                f"WHERE dev = ? AND inode = ? AND algorithm IN ({placeholders})",
+                (stat.st_dev, stat.st_ino, *names),
+            ).fetchall()
+            found = {row[0]: row[3] for row in rows if row[1] == stat.st_size and row[2] == stat.st_mtime_ns}
+            now = time.time()
+            if any(row[0] in found and now - row[4] > _HASH_TOUCH_INTERVAL for row in rows):
+                self._conn.execute(
+                    "UPDATE file_hashes SET used_at = ? WHERE dev = ? AND inode = ?", (now, stat.st_dev, stat.st_ino)
+                )
+                self._conn.commit()
+        return found
+
+    def _write_rows(self, stat: os.stat_result, digests: Dict[str, str]) -> None:
+        if self._conn is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_hashes (dev, inode, algorithm, size, mtime_ns, digest, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (stat.st_dev, stat.st_ino, name, stat.st_size, stat.st_mtime_ns, digest, now)
+                    for name, digest in digests.items()
+                ],
+            )
+            self._conn.commit()
+
+    def lookup(self, path: str | Path, algorithms: Iterable[str], stat: os.stat_result | None = None) -> Dict[str, str]:
+        """返回缓存中仍然有效的摘要（算法 -> 十六进制摘要），可能只包含部分算法。"""
+        path = Path(path)
+        stat = stat or path.stat()
+        wanted = list(algorithms)
+        found = self._read_xattrs(path, stat, wanted) if self._xattr_usable(stat.st_dev) else {}
+        missing = [name for name in wanted if name not in found]
+        if missing:
+            found.update(self._read_rows(stat, missing))
+        return found
+
+    def store(self, path: str | Path, stat: os.stat_result, digests: Dict[str, str]) -> None:
+        """记录 ``stat`` 对应内容的摘要；刚修改过的文件不记录。"""
+        if not digests or time.time_ns() - stat.st_mtime_ns < _HASH_RACY_WINDOW_NS:
+            return
+        if self._xattr_usable(stat.st_dev) and self._write_xattrs(Path(path), stat, digests):
+            return
+        self._write_rows(stat, digests)
+
+    def digests(self, path: str | Path, algorithms: Iterable[str]) -> Dict[str, str]:
+        """
+        返回文件的摘要，缓存中缺少的算法一次读取全部算出并写回缓存。
+
+        计算期间文件被修改（大小或 mtime 变化）时结果不写入缓存。
+        """
+        path = Path(path)
+        wanted = list(dict.fromkeys(algorithms))
+        stat = path.stat()
+        found = self.lookup(path, wanted, stat)
+        missing = [name for name in wanted if name not in found]
+        if not missing:
+            self.hits += 1
+            return found
+        computed = file_digests(path, missing)
+        self.computed += 1
+        after = path.stat()
+        if (after.st_size, after.st_mtime_ns, after.st_ino) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            self.store(path, stat, computed)
+        found.update(computed)
+        return found
+
+
+def open_hash_cache() -> HashCache:
+    """按 HASH_CACHE_DB / HASH_CACHE_XATTR 打开摘要缓存；路径为空时只使用扩展属性。"""
+    db_path = os.getenv("HASH_CACHE_DB", "state/hash_cache.db").strip()
+    use_xattr = os.getenv("HASH_CACHE_XATTR", "1").strip() not in ("", "0")
+    return HashCache(db_path or None, use_xattr=use_xattr)
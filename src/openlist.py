@@ -1,26 +1,131 @@
+import hashlib
 import os
+import threading
+from contextlib import nullcontext
 from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterable, Iterator, Tuple
 from urllib.parse import quote
 
 import requests
 from dotenv import load_dotenv
 
+from src.bandwidth import (
+    BandwidthScheduler,
+    DailyQuota,
+    ThrottledReader,
+    format_size,
+    open_bandwidth_scheduler,
+    open_daily_quota,
+)
+from src.localfile import open_hash_cache
+from src.remote_cache import Listing, ListingCache, open_listing_store
+from src.retry import AUTH, TRANSIENT, UploadError, classify_http
+
+# 目录缓存和每日配额中 Openlist 使用的远端名
+_CACHE_REMOTE = "openlist"
+# 秒传时随请求发送的摘要（hashlib 算法名 -> Openlist 请求头）
+_RAPID_HEADERS = {"md5": "X-File-Md5", "sha1": "X-File-Sha1"}
+# 上传时边发送边计算、用于与 fs/get 返回的摘要核对的算法
+_VERIFY_HASHES = ("md5", "sha1")
+
+
+def _request_error_kind(exc: requests.exceptions.RequestException) -> str:
+    """按 HTTP 状态码对请求异常分类；连接失败、超时等没有响应的错误视为临时错误。"""
+    response = exc.response
+    if response is None:
+        return TRANSIENT
+    return classify_http(response.status_code, response.text[:200])
+
+
+class _TeeReader:
+    """
+    记录 requests 实际从请求体中读走的字节数，并顺带计算这些字节的摘要。
+
+    服务端秒传成功时不再读取请求体就返回响应，读走的字节数可能少于文件大小（小文件可能已整个写入
+    套接字缓冲区）；这只说明服务端提前结束了请求，是否秒传还要用 fs/get 确认。
+    完整发送时 :meth:`digests` 就是文件的摘要，校验无需再读一遍文件。
+    """
+
+    def __init__(self, stream: BinaryIO | ThrottledReader, size: int, algorithms: Iterable[str] = ()) -> None:
+        self._stream = stream
+        self._size = size
+        self._hashers = {name: hashlib.new(name) for name in algorithms}
+        self.sent = 0
+
+    def __len__(self) -> int:
+        return self._size - self.sent
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self.sent += len(chunk)
+        for hasher in self._hashers.values():
+            hasher.update(chunk)
+        return chunk
+
+    def digests(self) -> Dict[str, str]:
+        return {name: hasher.hexdigest() for name, hasher in self._hashers.items()}
+
+
 class OpenlistClient:
     """
     一个用于与 Openlist API 交互的客户端。
     """
-    def __init__(self):
+    def __init__(self, *, bandwidth: BandwidthScheduler | None = None, quota: DailyQuota | None = None):
         """
         初始化客户端，并从 .env 文件加载配置。
+
+        上传同样受 BANDWIDTH_SCHEDULE 的带宽时间表和 DAILY_QUOTA 的每日配额（远端名 openlist）限制。
+        与 rclone 上传在同一进程中时传入共享的 ``bandwidth`` 与 ``quota``，让两者分同一份带宽和配额；
+        未传入时按同样的环境变量自行创建，并在 :meth:`close` 时释放。
         """
         load_dotenv()
         self.base_url = os.getenv("OPENLIST_API_BASE_URL")
         self.username = os.getenv("OPENLIST_USERNAME")
         self.password = os.getenv("OPENLIST_PASSWORD")
-        self.token = None
-
+        # 先检查配置再打开目录缓存、摘要缓存与配额数据库，配置不全时不留下未关闭的句柄
         if not all([self.base_url, self.username, self.password]):
             raise ValueError("请确保 .env 文件中已正确设置 OPENLIST_API_BASE_URL, OPENLIST_USERNAME, 和 OPENLIST_PASSWORD")
+        self.token = None
+        self.listing_cache = ListingCache(self._fetch_listing, open_listing_store())
+        self._owns_bandwidth = bandwidth is None
+        self._owns_quota = quota is None
+        self.bandwidth: BandwidthScheduler | None = bandwidth if bandwidth is not None else open_bandwidth_scheduler()
+        self.quota: DailyQuota | None = quota if quota is not None else open_daily_quota()
+        if self._owns_bandwidth:
+            self.bandwidth.start()
+        # OPENLIST_RAPID_UPLOAD=1 时上传前计算 MD5/SHA1 并随请求发送，服务端已有相同内容时无需上传文件内容
+        self.rapid_upload = os.getenv("OPENLIST_RAPID_UPLOAD", "0").strip() not in ("", "0")
+        self.rapid_files = 0
+        self.rapid_bytes_saved = 0
+        # OPENLIST_VERIFY_UPLOAD=1 时上传后用 fs/get 返回的大小与摘要核对，摘要在发送时顺带计算
+        self.verify_upload = os.getenv("OPENLIST_VERIFY_UPLOAD", "0").strip() not in ("", "0")
+        self.verified_files = 0
+        self.size_only_files = 0
+        self._rapid_lock = threading.Lock()
+        self.hash_cache = open_hash_cache()
+
+    def close(self) -> None:
+        """关闭持久化的目录缓存与摘要缓存；报告本次运行秒传节省的上传量与校验情况。"""
+        if self.rapid_upload or self.rapid_files:
+            print(f"秒传: {self.rapid_files} 个文件，节省上传 {format_size(self.rapid_bytes_saved)}")
+        if self.verified_files or self.size_only_files:
+            print(
+                f"上传校验: {self.verified_files} 个文件摘要一致，"
+                f"{self.size_only_files} 个文件远端未提供摘要，仅核对大小"
+            )
+        self.listing_cache.close()
+        self.hash_cache.close()
+        if self._owns_bandwidth and self.bandwidth is not None:
+            self.bandwidth.stop()
+        if self._owns_quota and self.quota is not None:
+            self.quota.close()
 
     def authenticate(self):
         """
@@ -68,6 +173,8 @@ class OpenlistClient:
         *,
         as_task: bool = True,
         reauthenticate: bool = True,
+        rapid: bool | None = None,
+        verify: bool | None = None,
     ) -> dict:
         """
         使用 Openlist 的流式上传接口上传单个文件。
@@ -77,9 +184,14 @@ class OpenlistClient:
             remote_path: 上传到 Openlist 的目标绝对路径。
             as_task: 是否以任务的方式提交 (对应 `As-Task` 头)。
             reauthenticate: 如果为 True，则在上传前强制重新获取 token。
+            rapid: 是否尝试秒传（发送 `X-File-Md5` / `X-File-Sha1` 头），默认取 OPENLIST_RAPID_UPLOAD。
+                秒传时不以任务方式提交：任务模式下 Openlist 会先把请求体完整缓存到临时文件。
+                服务端未读完请求体就返回成功时，用 `fs/get` 确认远端大小与摘要一致才记为秒传，否则抛出 UploadError。
+            verify: 是否在上传后用 `fs/get` 核对远端大小与摘要，默认取 OPENLIST_VERIFY_UPLOAD。
+                摘要在发送时顺带计算并写入摘要缓存；核对需要同步上传，同样不以任务方式提交。
 
         Returns:
-            Openlist 返回的数据字典。如果响应体不是 JSON，将抛出异常。
+            Openlist 返回的数据字典。如果响应体不是 JSON，将抛出异常；校验不一致时抛出 UploadError。
         """
         file_path = Path(local_path)
         if not file_path.is_file():
@@ -87,37 +199,164 @@ class OpenlistClient:
 
         if reauthenticate or not self.token:
             if not self.authenticate():
-                raise RuntimeError("重新认证失败，无法上传文件。")
+                raise UploadError("重新认证失败，无法上传文件。", AUTH)
 
         target_path = self._normalize_remote_path(remote_path)
         if target_path.endswith("/"):
             raise ValueError("远程路径必须包含文件名，不能以 '/' 结尾。")
+        stat = file_path.stat()
+        size = stat.st_size
         headers = {
             "Authorization": self.token,
             "File-Path": quote(target_path, safe="/%"),
             "Content-Type": "application/octet-stream",
-            "Content-Length": str(file_path.stat().st_size),
+            "Content-Length": str(size),
         }
-        if as_task:
+        rapid = self.rapid_upload if rapid is None else rapid
+        verify = self.verify_upload if verify is None else verify
+        digests: Dict[str, str] = {}
+        if rapid:
+            digests = self.hash_cache.digests(file_path, _RAPID_HEADERS)
+            headers.update((header, digests[name]) for name, header in _RAPID_HEADERS.items())
+        if as_task and not (rapid or verify):
             headers["As-Task"] = "true"
+        # 秒传时摘要已经算好，不必在发送时再算
+        tee_hashes = _VERIFY_HASHES if verify and not rapid else ()
+
+        if self.quota is not None:
+            self.quota.reserve(_CACHE_REMOTE, size)
+        payload = None
+        instant = False
+        try:
+            payload, body = self._put(file_path, size, headers, tee_hashes)
+            sent = body.sent
+            if sent < size:
+                # 请求体没有发完服务端就返回了成功：连接提前关闭或只读取了一部分都会这样，
+                # 只有 fs/get 确认远端已有大小与摘要都一致的文件时才算秒传
+                if not rapid:
+                    raise UploadError(f"上传不完整: {target_path} 只发送了 {sent}/{size} 字节", TRANSIENT)
+                self._confirm_rapid(target_path, size, digests)
+                instant = True
+        finally:
+            if self.quota is not None:
+                # 秒传没有占用上传流量，不计入配额
+                self.quota.settle(_CACHE_REMOTE, size, uploaded=payload is not None and not instant)
+        if instant:
+            with self._rapid_lock:
+                self.rapid_files += 1
+                self.rapid_bytes_saved += size - sent
+                # 确认秒传时已经核对过大小与摘要
+                if verify:
+                    self.verified_files += 1
+            print(f"秒传成功: {target_path}（节省 {format_size(size - sent)}）")
+        if tee_hashes and sent == size:
+            digests = body.digests()
+            after = file_path.stat()
+            if (after.st_size, after.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                self.hash_cache.store(file_path, stat, digests)
+        if verify and not instant:
+            self._verify_remote(target_path, size, digests)
 
+        pure_target = PurePosixPath(target_path)
+        self.listing_cache.add(_CACHE_REMOTE, str(pure_target.parent), pure_target.name, size)
+        return payload.get("data", {})
+
+    def _put(
+        self, file_path: Path, size: int, headers: dict, tee_hashes: Iterable[str] = ()
+    ) -> Tuple[dict, _TeeReader]:
+        """
+        发送 fs/put 请求，返回 (成功的响应体, 请求体读取器)；读取器记录实际发送的字节数及 ``tee_hashes`` 的摘要。
+        配置了带宽时间表时按分到的带宽限速读取文件。
+        """
         upload_url = f"{self.base_url}/api/fs/put"
+        bandwidth = self.bandwidth if self.bandwidth is not None and self.bandwidth.enabled else None
         try:
-            with file_path.open("rb") as stream:
-                response = requests.put(upload_url, headers=headers, data=stream)
+            with file_path.open("rb") as stream, (bandwidth.transfer() if bandwidth else nullcontext()) as share:
+                source = ThrottledReader(stream, size, share) if share is not None else stream
+                body = _TeeReader(source, size, tee_hashes)
+                # 服务端秒传后可能不读完请求体就返回并关闭连接，urllib3 会忽略随之而来的 EPIPE 并读取响应
+                response = requests.put(upload_url, headers=headers, data=body)
                 response.raise_for_status()
         except requests.exceptions.RequestException as exc:
-            raise RuntimeError(f"上传文件时发生请求错误: {exc}") from exc
+            raise UploadError(f"上传文件时发生请求错误: {exc}", _request_error_kind(exc)) from exc
 
         try:
             payload = response.json()
         except ValueError as exc:
-            raise RuntimeError("上传成功，但响应不是有效的 JSON。") from exc
+            raise UploadError("上传成功，但响应不是有效的 JSON。", TRANSIENT) from exc
 
         if payload.get("code") != 200:
-            raise RuntimeError(f"上传失败: {payload.get('message', '未知错误')}")
+            message = str(payload.get("message", "未知错误"))
+            raise UploadError(f"上传失败: {message}", classify_http(payload.get("code"), message))
+        return payload, body
 
-        return payload.get("data", {})
+    def _confirm_rapid(self, target_path: str, size: int, digests: Dict[str, str]) -> None:
+        """确认秒传：远端文件的大小和至少一种摘要都与本地一致，否则抛出 UploadError。"""
+        if not self._compare_remote(target_path, size, digests):
+            raise UploadError(
+                f"无法确认秒传: {target_path} 远端未提供可比较的摘要，请求体也没有完整发送"
+                "（可关闭 OPENLIST_RAPID_UPLOAD）",
+                TRANSIENT,
+            )
+
+    def _verify_remote(self, target_path: str, size: int, digests: Dict[str, str]) -> None:
+        """用 fs/get 返回的大小与摘要核对刚上传的文件，不一致时抛出 UploadError。"""
+        compared = self._compare_remote(target_path, size, digests)
+        with self._rapid_lock:
+            if compared:
+                self.verified_files += 1
+            else:
+                self.size_only_files += 1
+
+    def _compare_remote(self, target_path: str, size: int, digests: Dict[str, str]) -> bool:
+        """
+        用 fs/get 返回的大小与摘要核对远端文件，不一致时抛出 UploadError。
+
+        返回是否比较了摘要；远端不提供 ``digests`` 中的任何一种摘要时只核对了大小。
+        """
+        info = self.get_file(target_path, reauthenticate=False)
+        remote_size = int(info.get("size", -1))
+        if remote_size != size:
+            raise UploadError(f"上传后校验失败: {target_path} 远端大小 {remote_size}，本地 {size}", TRANSIENT)
+        hash_info = info.get("hash_info") if isinstance(info.get("hash_info"), dict) else {}
+        remote_digests = {str(name).lower(): str(value).lower() for name, value in hash_info.items() if value}
+        compared = [name for name in digests if name in remote_digests]
+        for name in compared:
+            if remote_digests[name] != digests[name].lower():
+                raise UploadError(
+                    f"上传后校验失败: {target_path} 远端 {name} {remote_digests[name]}，本地 {digests[name]}",
+                    TRANSIENT,
+                )
+        return bool(compared)
+
+    def get_file(self, path: str, *, reauthenticate: bool = True) -> dict:
+        """调用 Openlist 的 fs/get 接口获取单个文件的信息（大小、摘要等）。"""
+        normalized_path = self._normalize_remote_path(path)
+
+        if reauthenticate or not self.token:
+            if not self.authenticate():
+                raise UploadError("重新认证失败，无法获取远程文件信息。", AUTH)
+
+        url = f"{self.base_url}/api/fs/get"
+        headers = {
+            "Authorization": self.token,
+            "Content-Type": "application/json",
+        }
+        try:
+            response = requests.post(url, headers=headers, json={"path": normalized_path})
+            response.raise_for_status()
+        except requests.exceptions.RequestException as exc:
+            raise UploadError(f"获取文件信息时发生请求错误: {exc}", _request_error_kind(exc)) from exc
+
+        try:
+            body = response.json()
+        except ValueError as exc:
+            raise UploadError("获取文件信息成功，但响应不是有效的 JSON。", TRANSIENT) from exc
+
+        if body.get("code") != 200:
+            message = str(body.get("message", "未知错误"))
+            raise UploadError(f"获取文件信息失败: {message}", classify_http(body.get("code"), message))
+        return body.get("data") or {}
 
     def list_directory(
         self,
@@ -133,7 +372,7 @@ class OpenlistClient:
 
         if reauthenticate or not self.token:
             if not self.authenticate():
-                raise RuntimeError("重新认证失败，无法列出远程目录。")
+                raise UploadError("重新认证失败，无法列出远程目录。", AUTH)
 
         url = f"{self.base_url}/api/fs/list"
         headers = {
@@ -151,20 +390,31 @@ class OpenlistClient:
             response = requests.post(url, headers=headers, json=payload)
             response.raise_for_status()
         except requests.exceptions.RequestException as exc:
-            raise RuntimeError(f"列出目录时发生请求错误: {exc}") from exc
+            raise UploadError(f"列出目录时发生请求错误: {exc}", _request_error_kind(exc)) from exc
 
         try:
             body = response.json()
         except ValueError as exc:
-            raise RuntimeError("目录列出成功，但响应不是有效的 JSON。") from exc
+            raise UploadError("目录列出成功，但响应不是有效的 JSON。", TRANSIENT) from exc
 
         if body.get("code") != 200:
-            raise RuntimeError(f"列出目录失败: {body.get('message', '未知错误')}")
+            message = str(body.get("message", "未知错误"))
+            raise UploadError(f"列出目录失败: {message}", classify_http(body.get("code"), message))
 
         return body.get("data", {})
 
+    def _fetch_listing(self, remote: str, directory: str) -> Listing:
+        """列出目录并转换为缓存使用的 文件名 -> 大小 映射。"""
+        directory_data = self.list_directory(directory, reauthenticate=False)
+        listing: Listing = {}
+        for item in directory_data.get("content") or []:
+            if not isinstance(item, dict) or item.get("is_dir"):
+                continue
+            listing[item.get("name", "")] = int(item.get("size", -1))
+        return listing
+
     def remote_file_exists(self, remote_path: str, *, reauthenticate: bool = True) -> bool:
-        """检查远程路径下的文件是否存在。"""
+        """检查远程路径下的文件是否存在，同一目录在本进程内只列出一次。"""
         normalized_path = self._normalize_remote_path(remote_path)
         pure_path = PurePosixPath(normalized_path)
         if pure_path.name == "":
@@ -173,13 +423,8 @@ class OpenlistClient:
         parent = str(pure_path.parent)
         directory = parent if parent != "." else "/"
 
-        directory_data = self.list_directory(directory, reauthenticate=reauthenticate)
-        contents = directory_data.get("content", [])
-        for item in contents:
-            if not isinstance(item, dict):
-                continue
-            if item.get("is_dir"):
-                continue
-            if item.get("name") == pure_path.name:
-                return True
-        return False
+        # 只有真正需要列出目录时才重新认证
+        if reauthenticate and self.listing_cache.peek(_CACHE_REMOTE, directory) is None:
+            if not self.authenticate():
+                raise UploadError("重新认证失败，无法列出远程目录。", AUTH)
+        return pure_path.name in self.listing_cache.get(_CACHE_REMOTE, directory)
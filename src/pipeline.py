@@ -0,0 +1,195 @@
+"""分阶段流式处理：每个阶段运行在独立线程中，阶段之间用有界队列衔接并统计耗时。"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional
+
+_END = object()
+_POLL_INTERVAL = 0.1
+
+
+class _Stopped(Exception):
+    """流水线被中止时用于打断阻塞中的阶段。"""
+
+
+@dataclass
+class StageStats:
+    """单个阶段的计数与耗时（秒）。"""
+
+    name: str
+    items_in: int = 0
+    items_out: int = 0
+    starved: float = 0.0
+    blocked: float = 0.0
+    wall: float = 0.0
+
+    @property
+    def busy(self) -> float:
+        """扣除等待上游和等待下游之后的处理时间。"""
+        return max(0.0, self.wall - self.starved - self.blocked)
+
+
+@dataclass
+class Stage:
+    """
+    一个流水线阶段。
+
+    ``transform`` 接收上游条目的迭代器并产出下游条目；第一个阶段收到的是空迭代器，
+    自行产生数据（例如扫描目录）。阶段内部的并发由 ``transform`` 自己决定，见 :func:`parallel_map`。
+    """
+
+    name: str
+    transform: Callable[[Iterator[Any]], Iterable[Any]]
+
+
+def parallel_map(func: Callable[[Any], Any], workers: int = 1) -> Callable[[Iterator[Any]], Iterator[Any]]:
+    """
+    构造一个用 ``workers`` 个线程执行 ``func`` 的阶段转换函数。
+
+    输出顺序与输入顺序一致；``func`` 返回 ``None`` 表示丢弃该条目。
+    """
+
+    def transform(items: Iterator[Any]) -> Iterator[Any]:
+        if workers <= 1:
+            for item in items:
+                result = func(item)
+                if result is not None:
+                    yield result
+            return
+
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                while len(pending) >= workers * 2:
+                    result = pending.popleft().result()
+                    if result is not None:
+                        yield result
+            while pending:
+                result = pending.popleft().result()
+                if result is not None:
+                    yield result
+
+    return transform
+
+
+class Pipeline:
+    """
+    把若干 :class:`Stage` 串成流水线。
+
+    每两个阶段之间是容量为 ``queue_size`` 的队列：下游处理不过来时上游会阻塞，
+    因此内存占用与源目录的规模无关。:meth:`run` 在调用线程中产出最后一个阶段的输出。
+    """
+
+    def __init__(self, stages: List[Stage], *, queue_size: int = 64) -> None:
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段。")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.stats: List[StageStats] = [StageStats(stage.name) for stage in stages]
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def _get(self, inbox: "queue.Queue[Any]") -> Any:
+        while True:
+            try:
+                return inbox.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise _Stopped() from None
+
+    def _put(self, outbox: "queue.Queue[Any]", item: Any) -> None:
+        while True:
+            try:
+                outbox.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Stopped() from None
+
+    def _inbox_items(self, inbox: Optional["queue.Queue[Any]"], stats: StageStats) -> Iterator[Any]:
+        if inbox is None:
+            return
+        while True:
+            start = time.monotonic()
+            item = self._get(inbox)
+            stats.starved += time.monotonic() - start
+            if item is _END:
+                return
+            stats.items_in += 1
+            yield item
+
+    def _run_stage(
+        self,
+        stage: Stage,
+        stats: StageStats,
+        inbox: Optional["queue.Queue[Any]"],
+        outbox: "queue.Queue[Any]",
+    ) -> None:
+        start = time.monotonic()
+        try:
+            for item in stage.transform(self._inbox_items(inbox, stats)):
+                put_start = time.monotonic()
+                self._put(outbox, item)
+                stats.blocked += time.monotonic() - put_start
+                stats.items_out += 1
+            self._put(outbox, _END)
+        except _Stopped:
+            pass
+        except BaseException as exc:  # 交给 run() 在主线程重新抛出
+            with self._error_lock:
+                if self._error is None:
+                    self._error = exc
+            self._stop.set()
+        finally:
+            stats.wall = time.monotonic() - start
+
+    def run(self) -> Iterator[Any]:
+        """启动全部阶段，并逐个产出最后一个阶段的输出。"""
+        queues: List["queue.Queue[Any]"] = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads: List[threading.Thread] = []
+        for index, (stage, stats) in enumerate(zip(self.stages, self.stats)):
+            inbox = queues[index - 1] if index else None
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(stage, stats, inbox, queues[index]),
+                name=f"stage-{stage.name}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        try:
+            while True:
+                try:
+                    item = self._get(queues[-1])
+                except _Stopped:
+                    break
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def report(self) -> List[str]:
+        """返回各阶段耗时摘要，最后一行指出忙碌时间最长的阶段。"""
+        lines = [
+            f"阶段 {stats.name}: 输入 {stats.items_in} 输出 {stats.items_out}，"
+            f"处理 {stats.busy:.1f}s，等待上游 {stats.starved:.1f}s，等待下游 {stats.blocked:.1f}s"
+            for stats in self.stats
+        ]
+        bottleneck = max(self.stats, key=lambda stats: stats.busy)
+        if bottleneck.busy > 0:
+            lines.append(f"瓶颈阶段: {bottleneck.name}")
+        return lines
@@ -4,13 +4,39 @@ from __future__ import annotations
 
 import json
 import os
+import secrets
 import shlex
+import socket
 import subprocess
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path, PurePosixPath
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import requests
 from dotenv import load_dotenv
 
+from src.bandwidth import BandwidthScheduler, format_rate
+from src.remote_cache import Listing, ListingCache, open_listing_store
+from src.remote_index import RemotePathIndex
+from src.retry import UploadError, classify_rclone
+
+# _free_port 选出的端口在 rclone 绑定前可能被占用，此时换一个端口重新启动
+_RC_PORT_ATTEMPTS = 3
+
+
+def private_rc_auth(user: str = "", password: str = "") -> Tuple[Tuple[str, str], Dict[str, str]]:
+    """
+    Return ``(auth, env)`` for an rc server started by this process.
+
+    Without a configured user, a throwaway one with a random password is generated. The credentials
+    reach rclone through ``RCLONE_RC_USER``/``RCLONE_RC_PASS``, the environment form of ``--rc-user``/
+    ``--rc-pass``, so they do not show up in the process list for other local users.
+    """
+    if not user:
+        user, password = "uploader", secrets.token_urlsafe(24)
+    return (user, password), {**os.environ, "RCLONE_RC_USER": user, "RCLONE_RC_PASS": password}
+
 
 class RcloneClient:
     """Lightweight helper around rclone CLI."""
@@ -22,6 +48,101 @@ class RcloneClient:
         self.global_args: List[str] = shlex.split(extra_args) if extra_args else []
         if not self.remote:
             raise ValueError("请在 .env 中配置 RCLONE_REMOTE（如 123）。")
+        raw_transfers = os.getenv("RCLONE_BATCH_TRANSFERS", "4").strip() or "4"
+        try:
+            self.batch_transfers = max(1, int(raw_transfers))
+        except ValueError as exc:
+            raise ValueError(f"RCLONE_BATCH_TRANSFERS 必须是整数: {raw_transfers}") from exc
+        self.listing_cache = ListingCache(self._fetch_listing, open_listing_store())
+        self.index_dir = Path(os.getenv("REMOTE_INDEX_DIR", "state/remote_index").strip() or "state/remote_index")
+        raw_max_age = os.getenv("REMOTE_INDEX_MAX_AGE_HOURS", "24").strip() or "24"
+        try:
+            self.index_max_age = float(raw_max_age) * 3600
+        except ValueError as exc:
+            raise ValueError(f"REMOTE_INDEX_MAX_AGE_HOURS 必须是数字: {raw_max_age}") from exc
+        self._path_indexes: Dict[str, Optional[RemotePathIndex]] = {}
+        # 由调用方设置；所有上传共享一个随时间段变化的总带宽
+        self.bandwidth: Optional[BandwidthScheduler] = None
+
+    def __enter__(self) -> "RcloneClient":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release backend resources such as opened remote path indexes."""
+        self.listing_cache.close()
+        for index in self._path_indexes.values():
+            if index is not None:
+                index.close()
+        self._path_indexes.clear()
+
+    def index_path(self, remote: str | None = None) -> Path:
+        """Location of the compact path index for a remote."""
+        return self.index_dir / f"{remote or self.remote}.idx"
+
+    def path_index(self, remote: str | None = None) -> Optional[RemotePathIndex]:
+        """Open (once) the remote's path index, ignoring missing or expired ones."""
+        name = remote or self.remote
+        if name not in self._path_indexes:
+            index: Optional[RemotePathIndex] = None
+            index_path = self.index_path(name)
+            if index_path.is_file():
+                try:
+                    index = RemotePathIndex(index_path)
+                except ValueError as exc:
+                    print(f"忽略远端索引 {index_path}: {exc}")
+                if index is not None and self.index_max_age and index.age > self.index_max_age:
+                    print(f"远端索引 {index_path} 已过期（{index.age / 3600:.1f} 小时），改为实时列出目录。")
+                    index.close()
+                    index = None
+            self._path_indexes[name] = index
+        return self._path_indexes[name]
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    @contextmanager
+    def _bandwidth_args(self, weight: int = 1) -> Iterator[Tuple[List[str], Optional[Dict[str, str]]]]:
+        """
+        Yield extra rclone flags and environment that apply this transfer's share of the bandwidth budget.
+
+        Each process gets its initial share via ``--bwlimit`` and a private ``--rc`` server,
+        through which ``core/bwlimit`` retunes it whenever the shares or the time window change.
+        The rc server requires throwaway credentials, so other local users cannot call methods
+        such as ``config/dump`` or ``operations/deletefile`` on it.
+        """
+        if self.bandwidth is None or not self.bandwidth.enabled:
+            yield [], None
+            return
+        address = f"127.0.0.1:{self._free_port()}"
+        auth, env = private_rc_auth()
+
+        def retune(rate: Optional[float]) -> None:
+            try:
+                requests.post(
+                    f"http://{address}/core/bwlimit", json={"rate": format_rate(rate)}, auth=auth, timeout=2
+                )
+            except requests.exceptions.RequestException:
+                pass  # 进程尚未启动 rc 或已经结束
+
+        with self.bandwidth.transfer(weight, retune) as share:
+            yield ["--bwlimit", format_rate(share.rate), "--rc", "--rc-addr", address], env
+
+    def _run_transfer(self, cmd: List[str], weight: int = 1) -> subprocess.CompletedProcess[str]:
+        """Run an rclone transfer with its bandwidth flags, retrying when the rc port was taken meanwhile."""
+        for _ in range(_RC_PORT_ATTEMPTS):
+            with self._bandwidth_args(weight) as (bandwidth_args, env):
+                process = subprocess.run(
+                    [*cmd, *bandwidth_args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env
+                )
+            if not bandwidth_args or process.returncode == 0 or "address already in use" not in process.stderr:
+                break
+        return process
 
     @staticmethod
     def _normalize_remote_path(remote_path: str) -> str:
@@ -35,14 +156,14 @@ class RcloneClient:
         cmd = ["rclone", *self.global_args, *args]
         return subprocess.run(cmd, check=True, capture_output=True, text=True)
 
-    def upload_file(self, local_path: str, remote_path: str) -> None:
-        """Copy a single file to remote path."""
+    def upload_file(self, local_path: str, remote_path: str, *, remote: str | None = None) -> None:
+        """Copy a single file to remote path (optionally on another configured remote)."""
         file_path = Path(local_path)
         if not file_path.is_file():
             raise FileNotFoundError(f"未找到文件: {local_path}")
 
         target = self._normalize_remote_path(remote_path)
-        dest = f"{self.remote}:{target}"
+        dest = f"{remote or self.remote}:{target}"
 
         cmd: List[str] = [
             "rclone",
@@ -53,44 +174,239 @@ class RcloneClient:
             "--progress=false",
             "--stats=0",
         ]
-
-        process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        process = self._run_transfer(cmd)
         if process.returncode != 0:
             message = process.stderr.strip() or f"退出码 {process.returncode}"
-            raise RuntimeError(f"上传失败: {message}")
+            raise UploadError(f"上传失败: {message}", classify_rclone(process.returncode, process.stderr))
+        self._remember_upload(remote, target, file_path.stat().st_size)
 
-    def remote_file_exists(self, remote_path: str) -> bool:
-        """Check whether a file exists on the remote."""
-        normalized = self._normalize_remote_path(remote_path)
-        pure = PurePosixPath(normalized)
-        if pure.name == "":
-            raise ValueError("远程路径必须包含文件名。")
+    def upload_many(
+        self,
+        pairs: Iterable[Tuple[str, str]],
+        *,
+        remote: str | None = None,
+        transfers: int | None = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        Upload many files with one ``rclone copy --files-from-raw`` per directory pair.
 
-        parent = str(pure.parent)
-        parent_path = "/" if parent == "." else parent
+        Returns a mapping of local path to ``None`` on success or an error message,
+        so callers can delete exactly the files that landed.
+        """
+        pairs = list(pairs)
+        results: Dict[str, Optional[str]] = {}
+        groups: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for local_path, remote_path in pairs:
+            file_path = Path(local_path)
+            if not file_path.is_file():
+                results[local_path] = f"未找到文件: {local_path}"
+                continue
+            target = PurePosixPath(self._normalize_remote_path(remote_path))
+            if target.name != file_path.name:
+                # copy + files-from 无法重命名，退回单文件上传
+                try:
+                    self.upload_file(local_path, remote_path, remote=remote)
+                    results[local_path] = None
+                except (FileNotFoundError, RuntimeError) as exc:
+                    results[local_path] = str(exc)
+                continue
+            key = (str(file_path.parent), str(target.parent))
+            groups.setdefault(key, []).append((local_path, file_path.name))
 
-        try:
-            result = self._run(
-                [
-                    "lsjson",
-                    f"{self.remote}:{parent_path}",
-                    "--files-only",
-                    "--no-modtime",
-                    "--no-mimetype",
-                ]
+        for (source_dir, dest_dir), members in groups.items():
+            results.update(
+                self._copy_files_from(
+                    source_dir, dest_dir, members, remote or self.remote, transfers or self.batch_transfers
+                )
             )
+        for local_path, remote_path in pairs:
+            if local_path in results and results[local_path] is None:
+                self._remember_upload(remote, remote_path, Path(local_path).stat().st_size)
+        return results
+
+    def _copy_files_from(
+        self,
+        source_dir: str,
+        dest_dir: str,
+        members: List[Tuple[str, str]],
+        remote: str,
+        transfers: int,
+    ) -> Dict[str, Optional[str]]:
+        """Run a single ``rclone copy`` for files in one directory and map JSON log lines back to them."""
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".files", delete=False) as listing:
+            for _, name in members:
+                listing.write(f"{name}\n")
+            listing_path = listing.name
+
+        cmd: List[str] = [
+            "rclone",
+            *self.global_args,
+            "copy",
+            source_dir,
+            f"{remote}:{dest_dir}",
+            "--files-from-raw",
+            listing_path,
+            "--no-traverse",
+            "--transfers",
+            str(transfers),
+            "--use-json-log",
+            "--log-level",
+            "INFO",
+            "--progress=false",
+            "--stats=0",
+        ]
+        try:
+            # 权重取实际并行的传输数，一个进程内的多个传输共用它的那份带宽
+            process = self._run_transfer(cmd, min(transfers, len(members)))
+        finally:
+            os.unlink(listing_path)
+
+        copied, errors, other = self._parse_json_log(process.stderr)
+        fallback = None
+        if process.returncode != 0:
+            fallback = "上传失败: " + ("; ".join(other[-3:]) or f"退出码 {process.returncode}")
+
+        results: Dict[str, Optional[str]] = {}
+        for local_path, name in members:
+            # rclone 的 --retries 可能在报错后重试成功，以最终的 Copied 记录为准
+            if name in copied:
+                results[local_path] = None
+            elif name in errors:
+                results[local_path] = f"上传失败: {errors[name]}"
+            elif process.returncode == 0:
+                results[local_path] = None
+            else:
+                results[local_path] = fallback
+        return results
+
+    @staticmethod
+    def _parse_json_log(stderr: str) -> Tuple[Set[str], Dict[str, str], List[str]]:
+        """Split ``--use-json-log`` output into copied objects, per-object errors and other messages."""
+        copied: Set[str] = set()
+        errors: Dict[str, str] = {}
+        other: List[str] = []
+        for line in stderr.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                other.append(line)
+                continue
+            if not isinstance(entry, dict):
+                continue
+            obj = entry.get("object")
+            message = str(entry.get("msg", "")).strip()
+            level = entry.get("level")
+            if obj and level in ("error", "critical"):
+                errors[obj] = message
+            elif obj and message.startswith("Copied"):
+                copied.add(obj)
+            elif level in ("error", "critical") and message:
+                other.append(message)
+        return copied, errors, other
+
+    def list_directory(
+        self, remote_dir: str, *, remote: str | None = None, hashes: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Return ``lsjson`` entries for the files in a remote directory, with ``Hashes`` when requested."""
+        normalized = self._normalize_remote_path(remote_dir)
+        args = [
+            "lsjson",
+            f"{remote or self.remote}:{normalized}",
+            "--files-only",
+            "--no-modtime",
+            "--no-mimetype",
+        ]
+        if hashes:
+            args.append("--hash")
+        try:
+            result = self._run(args)
         except subprocess.CalledProcessError as exc:
             message = exc.stderr.strip() or exc.stdout.strip() or str(exc)
             raise RuntimeError(f"远程检查失败: {message}") from exc
 
         try:
-            entries = json.loads(result.stdout)
+            return json.loads(result.stdout)
         except json.JSONDecodeError as exc:
             raise RuntimeError("远程检查返回的 JSON 无法解析。") from exc
 
-        for entry in entries:
+    def _fetch_listing(self, remote: str, directory: str) -> Listing:
+        listing: Listing = {}
+        for entry in self.list_directory(directory, remote=remote):
             if entry.get("IsDir"):
                 continue
-            if entry.get("Name") == pure.name:
+            listing[entry.get("Name", "")] = int(entry.get("Size", -1))
+        return listing
+
+    def _split_remote_path(self, remote_path: str) -> Tuple[str, str]:
+        """Split a remote file path into (parent directory, file name)."""
+        pure = PurePosixPath(self._normalize_remote_path(remote_path))
+        if pure.name == "":
+            raise ValueError("远程路径必须包含文件名。")
+        parent = str(pure.parent)
+        return ("/" if parent == "." else parent), pure.name
+
+    def _remember_upload(self, remote: str | None, remote_path: str, size: int) -> None:
+        """Write a freshly uploaded file through to the listing cache."""
+        parent, name = self._split_remote_path(remote_path)
+        self.listing_cache.add(remote or self.remote, parent, name, size)
+
+    def iter_remote_files(self, root: str, *, remote: str | None = None) -> Iterator[Tuple[str, int]]:
+        """Stream (absolute path, size) for every file under root via one ``lsjson -R --fast-list``."""
+        base = self._normalize_remote_path(root).rstrip("/")
+        cmd = [
+            "rclone",
+            *self.global_args,
+            "lsjson",
+            f"{remote or self.remote}:{base or '/'}",
+            "-R",
+            "--fast-list",
+            "--files-only",
+            "--no-modtime",
+            "--no-mimetype",
+        ]
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as stderr:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+            assert process.stdout is not None
+            # lsjson 每行输出一个对象，逐行解析避免把上百万条目一次性读入内存
+            for line in process.stdout:
+                line = line.strip().rstrip(",")
+                if not line.startswith("{"):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    process.kill()
+                    raise RuntimeError("远程列表返回的 JSON 无法解析。") from exc
+                if entry.get("IsDir"):
+                    continue
+                yield f"{base}/{entry['Path']}", int(entry.get("Size", -1))
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"远程递归列出失败: {stderr.read().strip() or process.returncode}")
+
+    def remote_file_exists(
+        self, remote_path: str, *, remote: str | None = None, size: int | None = None
+    ) -> bool:
+        """
+        Check whether a file exists on the remote (and has ``size`` when given).
+
+        When ``size`` is given, a file whose remote size is unknown (-1) does not match.
+
+        A fresh path index answers hits without any remote call; misses fall back to
+        the per-run directory listing cache, since the index may predate recent uploads.
+        """
+        parent, name = self._split_remote_path(remote_path)
+        index = self.path_index(remote)
+        target = f"{parent.rstrip('/')}/{name}"
+        if index is not None and index.covers(target):
+            indexed_size = index.lookup(remote or self.remote, target)
+            if indexed_size is not None and (size is None or indexed_size == size):
                 return True
-        return False
+        listing = self.listing_cache.get(remote or self.remote, parent)
+        if name not in listing:
+            return False
+        # 远端没有报告大小（-1）时只能确认存在，无法确认大小一致
+        return size is None or listing[name] == size
@@ -0,0 +1,271 @@
+"""rclone remote control (``rclone rcd``) backend reusing one long-lived rclone process."""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from itertools import chain
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+
+from src.bandwidth import BandwidthShare, format_rate
+from src.rclone_client import RcloneClient, private_rc_auth
+from src.retry import TRANSIENT, UploadError, classify_http, classify_message, rclone_error_text
+
+
+# upload_many 中同一任务连续这么多次查询状态失败时放弃整批，未完成的文件各自返回错误
+_JOB_POLL_ATTEMPTS = 5
+
+
+class RcloneRcClient(RcloneClient):
+    """
+    Drive rclone through its HTTP RC API instead of forking a process per operation.
+
+    Attaches to ``RCLONE_RC_URL`` when set, otherwise starts a private ``rclone rcd``
+    on a free localhost port. The rcd process keeps its backend cache alive, so remote
+    authentication and HTTP connections are reused across all calls.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rc_url = os.getenv("RCLONE_RC_URL", "").strip().rstrip("/")
+        rc_user = os.getenv("RCLONE_RC_USER", "").strip()
+        rc_pass = os.getenv("RCLONE_RC_PASS", "").strip()
+        self.poll_interval = float(os.getenv("RCLONE_RC_POLL_INTERVAL", "0.5") or 0.5)
+        self._process: Optional[subprocess.Popen] = None
+        self._rcd_log: Optional[IO[str]] = None
+        self._job_shares: Set[BandwidthShare] = set()
+        self._bwlimit_lock = threading.Lock()
+        self._applied_rate: Optional[str] = None
+        self._session = requests.Session()
+        if rc_user:
+            self._session.auth = (rc_user, rc_pass)
+        if not self.rc_url:
+            # 自己启动的 rcd 总是要求认证；未配置账号时使用随机生成的一次性账号
+            auth, env = private_rc_auth(rc_user, rc_pass)
+            self._session.auth = auth
+            self.rc_url = self._start_rcd(env)
+
+    def close(self) -> None:
+        """Close pooled connections and stop the rcd process we started."""
+        super().close()
+        self._session.close()
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+        if self._rcd_log is not None:
+            self._rcd_log.close()
+            self._rcd_log = None
+
+    def _start_rcd(self, env: Dict[str, str]) -> str:
+        address = f"127.0.0.1:{self._free_port()}"
+        cmd: List[str] = ["rclone", *self.global_args, "rcd", "--rc-addr", address]
+        # rcd 长期运行，日志写入临时文件而不是管道：没人读取的管道写满后 rcd 会阻塞
+        self._rcd_log = tempfile.TemporaryFile(mode="w+", prefix="rclone-rcd-")
+        try:
+            self._process = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=self._rcd_log, text=True, env=env
+            )
+        except OSError as exc:
+            self.close()
+            raise RuntimeError(f"无法启动 rclone rcd: {exc}") from exc
+
+        url = f"http://{address}"
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                self._rcd_log.seek(0)
+                message = self._rcd_log.read().strip() or str(self._process.returncode)
+                self.close()
+                raise RuntimeError(f"rclone rcd 启动失败: {message}")
+            try:
+                self._session.post(f"{url}/rc/noop", json={}, timeout=2).raise_for_status()
+                return url
+            except requests.exceptions.RequestException:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError("等待 rclone rcd 启动超时。")
+
+    def call(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """POST one RC method and return its JSON body, raising a classified ``UploadError`` on errors."""
+        try:
+            response = self._session.post(f"{self.rc_url}/{method}", json=params or {}, timeout=60)
+        except requests.exceptions.RequestException as exc:
+            raise UploadError(f"调用 rclone rc {method} 失败: {exc}", TRANSIENT) from exc
+        try:
+            body = response.json()
+        except ValueError as exc:
+            raise UploadError(f"rclone rc {method} 返回的 JSON 无法解析。", TRANSIENT) from exc
+        if response.status_code != 200:
+            error = str(body.get("error", response.status_code))
+            raise UploadError(f"rclone rc {method} 失败: {error}", classify_http(response.status_code, error))
+        return body
+
+    def _apply_bwlimit(self) -> None:
+        """Set the rcd-wide ``core/bwlimit`` to the sum of the shares of its running jobs."""
+        with self._bwlimit_lock:
+            if not self._job_shares:
+                return
+            rates = [share.rate for share in self._job_shares]
+            rate = format_rate(None if None in rates else sum(rates))  # type: ignore[arg-type]
+            if rate == self._applied_rate:
+                return
+            try:
+                self.call("core/bwlimit", {"rate": rate})
+            except UploadError as exc:
+                print(f"设置 rclone rcd 限速失败: {exc}")
+                return
+            self._applied_rate = rate
+
+    @contextmanager
+    def _job_bandwidth(self) -> Iterator[None]:
+        """Count one copy job against the bandwidth budget for as long as it runs."""
+        if self.bandwidth is None or not self.bandwidth.enabled:
+            yield
+            return
+        with self.bandwidth.transfer(1, lambda _rate: self._apply_bwlimit()) as share:
+            with self._bwlimit_lock:
+                self._job_shares.add(share)
+            self._apply_bwlimit()
+            try:
+                yield
+            finally:
+                with self._bwlimit_lock:
+                    self._job_shares.discard(share)
+
+    def _copyfile_params(self, local_path: str, remote_path: str, remote: str | None) -> Dict[str, Any]:
+        file_path = Path(local_path)
+        if not file_path.is_file():
+            raise FileNotFoundError(f"未找到文件: {local_path}")
+        target = self._normalize_remote_path(remote_path)
+        # 统一以远端根作为 dstFs，rcd 只为每个远端缓存一个后端实例
+        return {
+            "srcFs": str(file_path.parent),
+            "srcRemote": file_path.name,
+            "dstFs": f"{remote or self.remote}:",
+            "dstRemote": target.lstrip("/"),
+            "_async": True,
+        }
+
+    def _job_error(self, job_id: int) -> Optional[str]:
+        """Return ``None`` while running, ``""`` on success or the error message."""
+        status = self.call("job/status", {"jobid": job_id})
+        if not status.get("finished"):
+            return None
+        if status.get("success"):
+            return ""
+        return status.get("error") or "未知错误"
+
+    def upload_file(self, local_path: str, remote_path: str, *, remote: str | None = None) -> None:
+        """Copy a single file via ``operations/copyfile`` and wait for the job."""
+        params = self._copyfile_params(local_path, remote_path, remote)
+        with self._job_bandwidth():
+            job_id = self.call("operations/copyfile", params)["jobid"]
+            while True:
+                error = self._job_error(job_id)
+                if error is not None:
+                    break
+                time.sleep(self.poll_interval)
+        if error:
+            raise UploadError(f"上传失败: {error}", classify_message(rclone_error_text(error)))
+        self._remember_upload(remote, remote_path, Path(local_path).stat().st_size)
+
+    def upload_many(
+        self,
+        pairs: Iterable[Tuple[str, str]],
+        *,
+        remote: str | None = None,
+        transfers: int | None = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        Run up to ``transfers`` copyfile jobs at once and collect per-file results.
+
+        A failed ``job/status`` poll is retried on the next pass. After
+        ``_JOB_POLL_ATTEMPTS`` consecutive failures for one job the batch stops,
+        and every file that has not finished gets that error as its result.
+        """
+        limit = transfers or self.batch_transfers
+        pending = list(pairs)
+        pending.reverse()
+        remote_paths = dict(pending)
+        running: Dict[int, str] = {}
+        bandwidth: Dict[int, ExitStack] = {}
+        poll_failures: Dict[int, int] = {}
+        results: Dict[str, Optional[str]] = {}
+        try:
+            while pending or running:
+                while pending and len(running) < limit:
+                    local_path, remote_path = pending.pop()
+                    stack = ExitStack()
+                    try:
+                        params = self._copyfile_params(local_path, remote_path, remote)
+                        stack.enter_context(self._job_bandwidth())
+                        job_id = self.call("operations/copyfile", params)["jobid"]
+                    except (FileNotFoundError, RuntimeError) as exc:
+                        stack.close()
+                        results[local_path] = str(exc)
+                        continue
+                    running[job_id] = local_path
+                    bandwidth[job_id] = stack
+                for job_id in list(running):
+                    try:
+                        error = self._job_error(job_id)
+                    except UploadError as exc:
+                        poll_failures[job_id] = poll_failures.get(job_id, 0) + 1
+                        if poll_failures[job_id] < _JOB_POLL_ATTEMPTS:
+                            continue
+                        message = f"无法获取上传任务状态: {exc}"
+                        for unfinished in chain(running.values(), (local for local, _ in pending)):
+                            results[unfinished] = message
+                        return results
+                    poll_failures.pop(job_id, None)
+                    if error is None:
+                        continue
+                    local_path = running.pop(job_id)
+                    bandwidth.pop(job_id).close()
+                    if error:
+                        results[local_path] = f"上传失败: {error}"
+                        continue
+                    results[local_path] = None
+                    self._remember_upload(remote, remote_paths[local_path], Path(local_path).stat().st_size)
+                if running:
+                    time.sleep(self.poll_interval)
+        finally:
+            for stack in bandwidth.values():
+                stack.close()
+        return results
+
+    def list_directory(
+        self, remote_dir: str, *, remote: str | None = None, hashes: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Return ``operations/list`` entries (lsjson format) for a remote directory."""
+        normalized = self._normalize_remote_path(remote_dir)
+        body = self.call(
+            "operations/list",
+            {
+                "fs": f"{remote or self.remote}:",
+                "remote": normalized.strip("/"),
+                "opt": {"filesOnly": True, "noModTime": True, "noMimeType": True, "showHash": hashes},
+            },
+        )
+        return body.get("list") or []
+
+
+def create_client() -> RcloneClient:
+    """Return the rclone backend selected by ``RCLONE_BACKEND`` (``cli`` or ``rcd``)."""
+    backend = os.getenv("RCLONE_BACKEND", "cli").strip().lower() or "cli"
+    if backend == "cli":
+        return RcloneClient()
+    if backend == "rcd":
+        return RcloneRcClient()
+    raise ValueError(f"不支持的 RCLONE_BACKEND: {backend}（可选 cli 或 rcd）")
@@ -0,0 +1,248 @@
+"""远端目录列表缓存：同一目录在进程内只列出一次，并发请求合并为一次调用，可选跨进程持久化。"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+# 目录内的文件名 -> 文件大小（未知时为 -1）
+Listing = Dict[str, int]
+CacheKey = Tuple[str, str]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    remote TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (remote, directory)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    remote TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (remote, directory, name)
+) WITHOUT ROWID;
+"""
+
+
+class PersistentListingStore:
+    """
+    SQLite 中的目录列表缓存，run.py 与 remove_local.py 共用。
+
+    每个目录记录列出时间，超过 ``ttl`` 秒的列表视为过期；上传成功后写穿，
+    其他进程在有效期内可直接使用。
+    """
+
+    def __init__(self, db_path: str | Path, ttl: float) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _fresh(self, remote: str, directory: str) -> bool:
+        row = self._conn.execute(
+            "SELECT fetched_at FROM directories WHERE remote = ? AND directory = ?", (remote, directory)
+        ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def load(self, remote: str, directory: str) -> Optional[Listing]:
+        """返回未过期的目录列表，没有或已过期时返回 None。"""
+        with self._lock:
+            if not self._fresh(remote, directory):
+                return None
+            rows = self._conn.execute(
+                "SELECT name, size FROM entries WHERE remote = ? AND directory = ?", (remote, directory)
+            ).fetchall()
+        return {name: size for name, size in rows}
+
+    def save(self, remote: str, directory: str, listing: Listing) -> None:
+        """用新列出的结果整体替换目录记录。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE remote = ? AND directory = ?", (remote, directory)
+                )
+                self._conn.executemany(
+                    "INSERT INTO entries (remote, directory, name, size) VALUES (?, ?, ?, ?)",
+                    [(remote, directory, name, size) for name, size in listing.items()],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO directories (remote, directory, fetched_at) VALUES (?, ?, ?)",
+                    (remote, directory, time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add(self, remote: str, directory: str, name: str, size: int) -> None:
+        """写穿：目录记录仍有效时追加新文件，不延长有效期。"""
+        with self._lock:
+            if self._fresh(remote, directory):
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (remote, directory, name, size) VALUES (?, ?, ?, ?)",
+                    (remote, directory, name, size),
+                )
+
+    def invalidate(self, remote: str, directory: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM directories WHERE remote = ? AND directory = ?", (remote, directory))
+            self._conn.execute("DELETE FROM entries WHERE remote = ? AND directory = ?", (remote, directory))
+
+    def purge_expired(self) -> int:
+        """删除所有过期目录的记录，返回清理的目录数。"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE (remote, directory) IN "
+                    "(SELECT remote, directory FROM directories WHERE fetched_at < ?)",
+                    (cutoff,),
+                )
+                removed = self._conn.execute(
+                    "DELETE FROM directories WHERE fetched_at < ?", (cutoff,)
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+
+def open_listing_store() -> Optional[PersistentListingStore]:
+    """按 LISTING_CACHE_DB / LISTING_CACHE_TTL 打开持久化缓存；TTL 为 0 或路径为空时禁用。"""
+    db_path = os.getenv("LISTING_CACHE_DB", "state/listing_cache.db").strip()
+    raw_ttl = os.getenv("LISTING_CACHE_TTL", "600").strip() or "600"
+    try:
+        ttl = float(raw_ttl)
+    except ValueError as exc:
+        raise ValueError(f"LISTING_CACHE_TTL 必须是数字: {raw_ttl}") from exc
+    if not db_path or ttl <= 0:
+        return None
+    store = PersistentListingStore(db_path, ttl)
+    store.purge_expired()
+    return store
+
+
+class ListingCache:
+    """
+    以 (远端名, 目录) 为键的目录列表缓存。
+
+    第一次访问某目录时调用 ``fetch`` 列出目录，之后直接返回缓存；同一目录的并发访问
+    会等待同一次进行中的列出。上传成功后调用 :meth:`add` 写穿缓存，使后续检查无需重新列出；
+    目录正在列出时的写入先记下，列出完成后合并，以免被列出开始前的远端状态覆盖。
+    提供 ``store`` 时，未过期的持久化列表也可直接使用；``refresh`` 为 True 时忽略持久化列表。
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, str], Listing],
+        store: Optional[PersistentListingStore] = None,
+        *,
+        refresh: bool = False,
+    ) -> None:
+        self._fetch = fetch
+        self.store = store
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._listings: Dict[CacheKey, Listing] = {}
+        self._inflight: Dict[CacheKey, Future] = {}
+        # 列出进行中时 add 的文件，列出完成后合并进结果
+        self._pending_adds: Dict[CacheKey, Dict[str, int]] = {}
+        self.fetches = 0
+
+    def get(self, remote: str, directory: str) -> Listing:
+        """返回目录列表，必要时列出远端；列出失败的异常会传给所有等待者。"""
+        key = (remote, directory)
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None:
+                return listing
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        assert future is not None
+        if not owner:
+            return future.result()
+
+        try:
+            listing = self._load_or_fetch(remote, directory)
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[key]
+                self._pending_adds.pop(key, None)
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            added = self._pending_adds.pop(key, {})
+            listing.update(added)
+            self._listings[key] = listing
+            del self._inflight[key]
+        if added and self.store is not None:
+            # 列出结果保存时可能覆盖了期间写入持久化缓存的文件
+            for name, size in added.items():
+                self.store.add(remote, directory, name, size)
+        future.set_result(listing)
+        return listing
+
+    def _load_or_fetch(self, remote: str, directory: str) -> Listing:
+        if self.store is not None and not self.refresh:
+            listing = self.store.load(remote, directory)
+            if listing is not None:
+                return listing
+        with self._lock:
+            self.fetches += 1
+        listing = self._fetch(remote, directory)
+        if self.store is not None:
+            self.store.save(remote, directory, listing)
+        return listing
+
+    def peek(self, remote: str, directory: str) -> Optional[Listing]:
+        """只读缓存，不触发远端列出。"""
+        with self._lock:
+            return self._listings.get((remote, directory))
+
+    def add(self, remote: str, directory: str, name: str, size: int = -1) -> None:
+        """写穿：仅当目录已缓存时记录新文件，避免把不完整的列表当成完整目录。"""
+        with self._lock:
+            key = (remote, directory)
+            listing = self._listings.get(key)
+            if listing is not None:
+                listing[name] = size
+            elif key in self._inflight:
+                self._pending_adds.setdefault(key, {})[name] = size
+        if self.store is not None:
+            self.store.add(remote, directory, name, size)
+
+    def invalidate(self, remote: str, directory: str) -> None:
+        """丢弃某个目录的缓存。"""
+        with self._lock:
+            self._listings.pop((remote, directory), None)
+        if self.store is not None:
+            self.store.invalidate(remote, directory)
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+            self.store = None
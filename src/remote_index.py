@@ -0,0 +1,158 @@
+"""
+紧凑的远端路径索引：一次递归列出远端后写成可 mmap 的有序数组，前置 Bloom 过滤器。
+
+文件布局（小端）::
+
+    头部    magic(8) version(u32) k(u32) count(u64) bloom_bits(u64) created_at(f64) root_len(u32) root(utf-8)
+    填充    对齐到 8 字节
+    bloom   bloom_bits / 8 字节
+    记录    count 条 (path_hash u64, size i64)，按 path_hash 升序
+
+路径以 ``remote:/abs/path`` 的 blake2b 64 位摘要存储，查询时不需要在内存里保存任何路径字符串。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+MAGIC = b"EMBYIDX1"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIQQdI")
+_RECORD = struct.Struct("<Qq")
+_SIZE_MASK = (1 << 64) - 1
+BITS_PER_ENTRY = 10  # 约 1% 误判率
+
+
+def path_key(remote: str, remote_path: str) -> int:
+    """返回远端路径的 64 位哈希键。"""
+    digest = hashlib.blake2b(f"{remote}:{remote_path}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _bloom_positions(key: int, bits: int, k: int) -> Iterable[int]:
+    # 双重哈希：由 64 位键的高低两半派生 k 个位置
+    h1 = key & 0xFFFFFFFF
+    h2 = (key >> 32) | 1
+    for i in range(k):
+        yield (h1 + i * h2) % bits
+
+
+def _pad(length: int) -> int:
+    return (8 - length % 8) % 8
+
+
+def write_index(output: str | Path, remote: str, root: str, entries: Iterable[Tuple[str, int]]) -> int:
+    """
+    把 (远端绝对路径, 大小) 序列写成索引文件，返回写入条数。
+
+    先写到临时文件再原子替换，正在读取旧索引的进程不受影响。
+    """
+    packed = sorted(
+        (path_key(remote, remote_path) << 64) | (size & _SIZE_MASK) for remote_path, size in entries
+    )
+    bloom_bits = max(64, len(packed) * BITS_PER_ENTRY)
+    bloom_bits = (bloom_bits + 63) // 64 * 64  # 保持记录区 8 字节对齐
+    k = max(1, round(BITS_PER_ENTRY * math.log(2)))
+    bloom = bytearray(bloom_bits // 8)
+    for value in packed:
+        for position in _bloom_positions(value >> 64, bloom_bits, k):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    root_bytes = root.encode("utf-8")
+    output_path = Path(output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    count = 0
+    with tmp_path.open("wb") as handle:
+        header_len = _HEADER.size + len(root_bytes)
+        handle.write(b"\0" * _HEADER.size + root_bytes + b"\0" * _pad(header_len))
+        handle.write(bloom)
+        previous = None
+        for value in packed:
+            key, size = value >> 64, value & _SIZE_MASK
+            if key == previous:
+                continue  # 重复路径（或极少见的哈希碰撞）只保留一条
+            previous = key
+            handle.write(_RECORD.pack(key, size - (1 << 64) if size >> 63 else size))
+            count += 1
+        handle.seek(0)
+        handle.write(_HEADER.pack(MAGIC, VERSION, k, count, bloom_bits, time.time(), len(root_bytes)))
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def _records_offset(root_len: int, bloom_bits: int) -> int:
+    header_len = _HEADER.size + root_len
+    return header_len + _pad(header_len) + bloom_bits // 8
+
+
+class RemotePathIndex:
+    """只读打开索引文件，通过 mmap 做 Bloom 过滤和二分查找。"""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        with self.path.open("rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, k, count, bloom_bits, created_at, root_len = _HEADER.unpack_from(self._mmap, 0)
+        except struct.error as exc:
+            self._mmap.close()
+            raise ValueError(f"远端索引文件已损坏: {path}") from exc
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"不支持的远端索引文件: {path}")
+        self.k = k
+        self.count = count
+        self.bloom_bits = bloom_bits
+        self.created_at = created_at
+        self.root = self._mmap[_HEADER.size:_HEADER.size + root_len].decode("utf-8")
+        header_len = _HEADER.size + root_len
+        self._bloom_offset = header_len + _pad(header_len)
+        self._records_offset = _records_offset(root_len, bloom_bits)
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    @property
+    def age(self) -> float:
+        """索引距今的秒数。"""
+        return time.time() - self.created_at
+
+    def covers(self, remote_path: str) -> bool:
+        """远端路径是否位于建立索引时的根目录之下。"""
+        root = self.root.rstrip("/")
+        return not root or remote_path == root or remote_path.startswith(root + "/")
+
+    def _maybe_contains(self, key: int) -> bool:
+        data = self._mmap
+        offset = self._bloom_offset
+        for position in _bloom_positions(key, self.bloom_bits, self.k):
+            if not data[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def lookup(self, remote: str, remote_path: str) -> Optional[int]:
+        """返回索引记录的文件大小；不在索引中时返回 None。"""
+        key = path_key(remote, remote_path)
+        if not self._maybe_contains(key):
+            return None
+        low, high = 0, self.count
+        data = self._mmap
+        base = self._records_offset
+        while low < high:
+            middle = (low + high) // 2
+            found, size = _RECORD.unpack_from(data, base + middle * _RECORD.size)
+            if found == key:
+                return size
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
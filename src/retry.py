@@ -0,0 +1,272 @@
+"""上传失败的分类、带抖动的指数退避重试，以及按远端的熔断器。"""
+
+from __future__ import annotations
+
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, TypeVar
+
+# 错误类别
+TRANSIENT = "transient"  # 网络抖动、超时、5xx，稍后重试可能成功
+RATE_LIMITED = "rate_limited"  # 429 / 请求过于频繁，需要更长的退避
+AUTH = "auth"  # 认证失效或无权限，整个远端都会失败
+PERMANENT = "permanent"  # 文件本身的问题，重试无用
+PARKED = "parked"  # 远端被熔断，未实际尝试
+
+KIND_LABELS = {
+    TRANSIENT: "临时",
+    RATE_LIMITED: "限流",
+    AUTH: "认证",
+    PERMANENT: "永久",
+    PARKED: "熔断",
+}
+
+# 需要降低并发的错误类别
+BACKPRESSURE_KINDS = (TRANSIENT, RATE_LIMITED)
+
+_PATTERNS = (
+    # --max-transfer 达到上限（rclone 退出码 8），批量上传时只能从文本识别
+    (PARKED, re.compile(r"max transfer limit reached", re.IGNORECASE)),
+    (RATE_LIMITED, re.compile(
+        r"\b429\b|too many requests|rate ?limit|ratelimit|quota|throttl|slow ?down|频繁|限流|过于频繁",
+        re.IGNORECASE,
+    )),
+    (AUTH, re.compile(
+        r"\b401\b|\b403\b|unauthori[sz]ed|forbidden|invalid[_ ]token|token (?:is )?(?:invalid|expired)|"
+        r"access[_ ]token|login required|认证|未登录|登录失效|令牌",
+        re.IGNORECASE,
+    )),
+    (PERMANENT, re.compile(
+        r"\b400\b|\b404\b|\b413\b|not found|no such file|file name too long|invalid (?:name|path|argument)|"
+        r"is a directory|permission denied|didn't find section in config|file too large|未找到文件|文件名",
+        re.IGNORECASE,
+    )),
+    (TRANSIENT, re.compile(
+        r"timeout|timed out|connection (?:reset|refused|closed)|broken pipe|\beof\b|temporar|"
+        r"\b50[0234]\b|bad gateway|service unavailable|network|tls handshake|超时|网络",
+        re.IGNORECASE,
+    )),
+)
+
+# rclone 日志行开头的时间、级别与出错对象（文件路径），如 "2024/01/01 12:00:00 ERROR : TV/a.mkv: "
+_RCLONE_LOG_PREFIX = re.compile(
+    r"^(?:\d{4}/\d\d/\d\d \d\d:\d\d:\d\d\s+)?(?:CRITICAL|ERROR|NOTICE|INFO|DEBUG)\s*:\s*(?:.+?: )?"
+)
+# "Failed to copy: " 之类的操作说明（及其前面的路径），之后才是真正的错误原因
+_RCLONE_FAILED_PREFIX = re.compile(r"^.*?\bFailed to .*?: ")
+
+# rclone 退出码：https://rclone.org/docs/#exit-code
+# 1（未分类错误）和 9（没有传输文件）不携带类别信息，按 stderr 文本判断
+_RCLONE_EXIT_KINDS = {
+    2: PERMANENT,  # 参数或用法错误
+    3: PERMANENT,  # 目录不存在
+    4: PERMANENT,  # 文件不存在
+    5: TRANSIENT,  # 可重试的临时错误
+    6: PERMANENT,  # 不可重试的错误（NoRetry）
+    7: AUTH,  # 致命错误（如账号被封、凭据失效）
+}
+# 达到 --max-transfer 等传输上限：重试只会再次触发上限，本次运行不再尝试该文件
+_RCLONE_TRANSFER_LIMIT = 8
+
+
+class UploadError(RuntimeError):
+    """带错误类别的上传失败；仍是 RuntimeError，旧的调用方照常捕获。"""
+
+    def __init__(self, message: str, kind: str = TRANSIENT) -> None:
+        super().__init__(message)
+        self.kind = kind
+
+
+class RemoteParkedError(UploadError):
+    """远端已被熔断，本次运行暂不再尝试。"""
+
+    def __init__(self, remote: str, retry_in: float) -> None:
+        super().__init__(f"远端 {remote} 连续失败已暂停，{retry_in:.0f}s 后再试", PARKED)
+        self.remote = remote
+
+
+def classify_message(message: str, default: str = TRANSIENT) -> str:
+    """按错误信息文本分类；无法识别时返回 ``default``。"""
+    for kind, pattern in _PATTERNS:
+        if pattern.search(message):
+            return kind
+    return default
+
+
+def rclone_error_text(text: str) -> str:
+    """
+    去掉 rclone 日志中的时间、级别、文件路径和 "Failed to ...:" 前缀，只留下错误原因。
+
+    路径中的字样（如片名里的 "Forbidden"、"Network"、"404"）不能参与分类。
+    """
+    lines = []
+    for line in text.splitlines():
+        line = _RCLONE_FAILED_PREFIX.sub("", _RCLONE_LOG_PREFIX.sub("", line.strip()))
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def classify_rclone(returncode: int, stderr: str) -> str:
+    """综合 rclone 的退出码与 stderr 中的错误原因分类；文本中的限流和认证信息优先于退出码。"""
+    if returncode == _RCLONE_TRANSFER_LIMIT:
+        return PARKED
+    kind = classify_message(rclone_error_text(stderr), default="")
+    if kind in (RATE_LIMITED, AUTH):
+        return kind
+    return _RCLONE_EXIT_KINDS.get(returncode) or kind or TRANSIENT
+
+
+def classify_http(status: Optional[int], message: str = "") -> str:
+    """按 HTTP 状态码（或 Openlist 响应体中的 code）分类，没有状态码时按文本分类。"""
+    if status == 429:
+        return RATE_LIMITED
+    if status in (401, 403):
+        return AUTH
+    if status is not None and status >= 500:
+        return classify_message(message, default=TRANSIENT)
+    if status is not None and 400 <= status < 500:
+        kind = classify_message(message, default=PERMANENT)
+        return PERMANENT if kind == TRANSIENT else kind
+    return classify_message(message)
+
+
+def error_kind(error: object) -> str:
+    """返回异常或错误信息的类别。"""
+    if isinstance(error, UploadError):
+        return error.kind
+    if isinstance(error, (FileNotFoundError, IsADirectoryError, ValueError)):
+        return PERMANENT
+    # 批量上传的逐文件错误是 rclone 的日志文本
+    return classify_message(rclone_error_text(str(error)))
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    指数退避：第 n 次重试前等待 ``0..min(max_delay, base_delay * 2**n)`` 之间的随机时长（full jitter）。
+
+    限流错误的基数放大 ``rate_limit_factor`` 倍；认证与永久错误不重试。
+    """
+
+    retries: int = 2
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+    rate_limit_factor: float = 4.0
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        return kind in BACKPRESSURE_KINDS and attempt < self.retries
+
+    def delay(self, kind: str, attempt: int) -> float:
+        base = self.base_delay * (self.rate_limit_factor if kind == RATE_LIMITED else 1.0)
+        return random.uniform(0, min(self.max_delay, base * 2 ** attempt))
+
+
+class _BreakerState:
+    def __init__(self) -> None:
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+
+class CircuitBreaker:
+    """
+    按远端统计连续失败（临时、限流、认证错误；永久错误只与单个文件有关，不计入）。
+
+    连续失败达到 ``threshold`` 次或出现认证错误时熔断，``cooldown`` 秒内该远端的上传直接失败，
+    其他远端不受影响；冷却结束后放行一个试探请求，成功则恢复，失败则重新计时。
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._states: Dict[str, _BreakerState] = {}
+
+    def check(self, remote: str) -> None:
+        """远端处于熔断状态时抛出 :class:`RemoteParkedError`。"""
+        with self._lock:
+            state = self._states.get(remote)
+            if state is None or state.opened_at is None:
+                return
+            remaining = state.opened_at + self.cooldown - self._clock()
+            if remaining > 0 or state.probing:
+                raise RemoteParkedError(remote, max(remaining, 0))
+            state.probing = True
+
+    def record_success(self, remote: str) -> None:
+        with self._lock:
+            state = self._states.get(remote)
+            if state is None:
+                return
+            if state.opened_at is not None:
+                print(f"远端 {remote} 已恢复，解除熔断。")
+            self._states.pop(remote)
+
+    def record_failure(self, remote: str, kind: str) -> None:
+        if kind == PARKED:
+            # 没有实际尝试（例如每日配额已用完），不说明远端状态
+            return
+        if kind == PERMANENT:
+            # 远端有正常响应，只是这个文件本身有问题
+            self.record_success(remote)
+            return
+        with self._lock:
+            state = self._states.setdefault(remote, _BreakerState())
+            state.failures += 1
+            if state.probing or kind == AUTH or state.failures >= self.threshold:
+                if state.opened_at is None or state.probing:
+                    print(
+                        f"远端 {remote} 连续失败 {state.failures} 次（最近为{KIND_LABELS[kind]}错误），"
+                        f"暂停 {self.cooldown:.0f}s，其他远端继续上传。"
+                    )
+                state.opened_at = self._clock()
+                state.probing = False
+
+
+T = TypeVar("T")
+
+
+def call_with_retry(
+    func: Callable[[], T],
+    *,
+    remote: str,
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    describe: str = "",
+    on_error: Optional[Callable[[str], None]] = None,
+) -> T:
+    """
+    执行一次上传，按错误类别重试；最终失败时抛出 :class:`UploadError`（保留类别）。
+
+    熔断器打开时直接抛出 :class:`RemoteParkedError`，不会调用 ``func``。
+    每次失败（包括随后重试成功的）都会以错误类别调用 ``on_error``，供并发控制参考。
+    """
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.check(remote)
+        try:
+            result = func()
+        except Exception as exc:
+            kind = error_kind(exc)
+            if breaker is not None:
+                breaker.record_failure(remote, kind)
+            if on_error is not None:
+                on_error(kind)
+            if not policy.should_retry(kind, attempt):
+                if isinstance(exc, UploadError):
+                    raise
+                raise UploadError(str(exc), kind) from exc
+            delay = policy.delay(kind, attempt)
+            attempt += 1
+            print(f"{describe or remote} 遇到{KIND_LABELS[kind]}错误，{delay:.1f}s 后第 {attempt} 次重试: {exc}")
+            time.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success(remote)
+        return result
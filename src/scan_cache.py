@@ -0,0 +1,112 @@
+"""本地扫描缓存（SQLite）：记录目录 mtime 与目录项，未变化的目录在下次扫描时无需重新读取。"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+_SCAN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    subdirs TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# 修改时间距扫描时刻太近的目录不写入缓存，避免同一时间粒度内的后续修改被漏掉
+_RACY_WINDOW_NS = 2_000_000_000
+# 扫描期间累计这么多次写入后提交一次，避免长时间持有写事务
+_COMMIT_EVERY = 1000
+
+
+class DirectoryCache:
+    """
+    持久化的目录快照：记录每个目录的 mtime、inode 以及其中的文件名和子目录名。
+
+    目录内新增、删除或重命名条目都会改变目录自身的 mtime，因此 mtime 与 inode 未变的目录
+    可以直接复用上次的列表，不必再次读取目录项。``skipped`` / ``read`` 统计本次复用与重新读取的目录数。
+    扫描在流水线线程中进行，连接允许跨线程使用，访问由锁串行化。
+    """
+
+    def __init__(self, db_path: str | Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCAN_SCHEMA)
+        self._writes = 0
+        self.skipped = 0
+        self.read = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def reset_stats(self) -> None:
+        self.skipped = 0
+        self.read = 0
+
+    def lookup(self, path: Path, mtime_ns: int, inode: int) -> Optional[Tuple[List[str], List[str]]]:
+        """目录未变化时返回缓存的 (文件名, 子目录名)。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, inode, files, subdirs FROM directories WHERE path = ?", (str(path),)
+            ).fetchone()
+        if row is None or row[0] != mtime_ns or row[1] != inode:
+            return None
+        return json.loads(row[2]), json.loads(row[3])
+
+    def lookup_subdirs(self, path: Path) -> List[str]:
+        """返回上次记录的子目录名（不校验是否过期），用于清理已删除子树的记录。"""
+        with self._lock:
+            row = self._conn.execute("SELECT subdirs FROM directories WHERE path = ?", (str(path),)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def store(self, path: Path, mtime_ns: int, inode: int, files: List[str], subdirs: List[str]) -> None:
+        """记录刚读取的目录；修改时间过近的目录只清除旧记录，下次仍重新读取。"""
+        if time.time_ns() - mtime_ns < _RACY_WINDOW_NS:
+            self._write("DELETE FROM directories WHERE path = ?", (str(path),))
+            return
+        self._write(
+            "INSERT OR REPLACE INTO directories (path, mtime_ns, inode, files, subdirs) VALUES (?, ?, ?, ?, ?)",
+            (str(path), mtime_ns, inode, json.dumps(files), json.dumps(subdirs)),
+        )
+
+    def forget_tree(self, path: Path) -> None:
+        """删除某个目录及其所有子目录的记录。"""
+        # '0' 是 '/' 的下一个字符，范围查询可以走主键索引
+        self._write(
+            "DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)",
+            (str(path), f"{path}/", f"{path}0"),
+        )
+
+    def _write(self, sql: str, params: Tuple) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._writes += 1
+            if self._writes >= _COMMIT_EVERY:
+                self._conn.commit()
+                self._writes = 0
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._writes = 0
+
+
+def open_scan_cache() -> Optional[DirectoryCache]:
+    """按 SCAN_CACHE_DB 打开扫描缓存；路径为空时禁用。"""
+    db_path = os.getenv("SCAN_CACHE_DB", "state/scan_cache.db").strip()
+    if not db_path:
+        return None
+    return DirectoryCache(db_path)
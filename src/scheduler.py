@@ -0,0 +1,89 @@
+"""上传顺序调度：在有限的前瞻窗口内按策略重新排列待上传任务。"""
+
+from __future__ import annotations
+
+import heapq
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.uploader import UploadTask
+
+# 剧集的元数据、封面和字幕：体积小，Emby 刮削和播放都依赖它们
+SIDECAR_SUFFIXES = frozenset(
+    {".nfo", ".jpg", ".jpeg", ".png", ".webp", ".srt", ".ass", ".ssa", ".sub", ".idx", ".sup", ".vtt"}
+)
+
+Priorities = Dict[Path, int]
+_SortKey = Callable[[UploadTask, Priorities], int]
+
+POLICIES: Dict[str, _SortKey] = {
+    # 映射优先级高的先上传
+    "mapping": lambda task, priorities: -priorities.get(task.base_path, 0) if task.base_path else 0,
+    # 元数据、封面、字幕先上传
+    "sidecars": lambda task, _: 0 if task.local_path.suffix.lower() in SIDECAR_SUFFIXES else 1,
+    # 小文件先上传
+    "small": lambda task, _: task.size,
+    # 修改时间早的先上传（FIFO）
+    "oldest": lambda task, _: task.mtime_ns,
+}
+
+
+def parse_policies(raw_value: str) -> List[str]:
+    """解析形如 ``mapping,sidecars,small`` 的策略列表，排在前面的策略优先。"""
+    policies: List[str] = []
+    for entry in raw_value.replace(";", ",").split(","):
+        name = entry.strip().lower()
+        if not name:
+            continue
+        if name not in POLICIES:
+            raise ValueError(f"未知的上传顺序策略 '{name}'，可选: {', '.join(POLICIES)}")
+        if name not in policies:
+            policies.append(name)
+    return policies
+
+
+def parse_priorities(raw_value: str) -> Priorities:
+    """解析形如 ``/data/tv=10;/data/movies=1`` 的按映射优先级配置，数值越大越先上传。"""
+    priorities: Priorities = {}
+    for entry in raw_value.replace("\n", ";").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" not in entry:
+            raise ValueError(f"映射优先级配置 '{entry}' 缺少 '='。")
+        raw_path, raw_priority = (part.strip() for part in entry.rsplit("=", 1))
+        try:
+            priority = int(raw_priority)
+        except ValueError as exc:
+            raise ValueError(f"映射优先级配置 '{entry}' 的优先级不是整数。") from exc
+        if not raw_path:
+            raise ValueError(f"映射优先级配置 '{entry}' 无效。")
+        priorities[Path(raw_path).expanduser().resolve()] = priority
+    return priorities
+
+
+class UploadScheduler:
+    """
+    按策略排列上传顺序。
+
+    扫描是流式的，调度器只在最多 ``window`` 个任务的前瞻窗口内排序：窗口满后每读入一个任务
+    就放出当前最优的一个。窗口不小于文件总数时等同于整体排序；键相同的任务保持扫描顺序。
+    """
+
+    def __init__(self, policies: Sequence[str], *, priorities: Optional[Priorities] = None, window: int = 10000):
+        self.policies = list(policies)
+        self.priorities = dict(priorities or {})
+        self.window = max(1, window)
+        self._keys = [POLICIES[name] for name in self.policies]
+
+    def sort_key(self, task: UploadTask) -> Tuple[int, ...]:
+        return tuple(key(task, self.priorities) for key in self._keys)
+
+    def order(self, tasks: Iterable[UploadTask]) -> Iterator[UploadTask]:
+        heap: List[Tuple[Tuple[int, ...], int, UploadTask]] = []
+        for sequence, task in enumerate(tasks):
+            heapq.heappush(heap, (self.sort_key(task), sequence, task))
+            if len(heap) > self.window:
+                yield heapq.heappop(heap)[2]
+        while heap:
+            yield heapq.heappop(heap)[2]
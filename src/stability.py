@@ -0,0 +1,109 @@
+"""上传前的文件稳定性检查：跳过最近仍在修改或正被其他进程写入的文件。"""
+
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.localfile import FileRecord
+
+PROC_ROOT = Path("/proc")
+
+FileKey = Tuple[int, int]
+
+
+def _open_for_write(fd_path: str) -> bool:
+    """读取 /proc/<pid>/fdinfo/<fd> 中的打开标志，判断是否以写方式打开。"""
+    fdinfo = fd_path.replace("/fd/", "/fdinfo/", 1)
+    try:
+        with open(fdinfo, "r", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("flags:"):
+                    return (int(line.split()[1], 8) & os.O_ACCMODE) in (os.O_WRONLY, os.O_RDWR)
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+class OpenFileTable:
+    """
+    一次性扫描 /proc/*/fd，记录所有进程打开的普通文件 (st_dev, st_ino)。
+
+    以 inode 而不是路径比较，容器内的下载器（挂载路径不同）同样能识别；
+    打开方式只在命中待上传文件时才去读 fdinfo。没有权限查看的进程会被忽略。
+    """
+
+    def __init__(self, proc_root: Path = PROC_ROOT) -> None:
+        self._open: Dict[FileKey, List[str]] = {}
+        self.processes = 0
+        own_pid = str(os.getpid())
+        try:
+            pids = [name for name in os.listdir(proc_root) if name.isdigit() and name != own_pid]
+        except OSError:
+            return
+        for pid in pids:
+            fd_dir = f"{proc_root}/{pid}/fd"
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            self.processes += 1
+            for fd in fds:
+                fd_path = f"{fd_dir}/{fd}"
+                try:
+                    stat = os.stat(fd_path)
+                except OSError:
+                    continue
+                if (stat.st_mode & 0o170000) == 0o100000:
+                    self._open.setdefault((stat.st_dev, stat.st_ino), []).append(fd_path)
+
+    def writer(self, dev: int, inode: int) -> Optional[int]:
+        """返回以写方式打开该文件的进程 PID，没有时返回 None。"""
+        for fd_path in self._open.get((dev, inode), ()):
+            if _open_for_write(fd_path):
+                return int(fd_path.split("/")[-3])
+        return None
+
+
+class StabilityGate:
+    """
+    判断扫描到的文件是否已经写完。
+
+    文件最后修改时间距今不足 ``window`` 秒视为仍在变化；``check_open`` 为 True 时
+    还会检查是否有进程以写方式打开该文件。/proc 扫描在每轮扫描中只做一次（首次需要时），
+    调用 :meth:`begin_cycle` 开始新一轮。
+    """
+
+    def __init__(self, window: float, *, check_open: bool = True) -> None:
+        self.window = window
+        self.check_open = check_open
+        self._open_files: Optional[OpenFileTable] = None
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 or self.check_open
+
+    def begin_cycle(self) -> None:
+        self._open_files = None
+        self.skipped = 0
+
+    def _open_table(self) -> OpenFileTable:
+        if self._open_files is None:
+            self._open_files = OpenFileTable()
+        return self._open_files
+
+    def unstable_reason(self, record: FileRecord) -> Optional[str]:
+        """文件尚未稳定时返回原因，否则返回 None。"""
+        age = time.time() - record.mtime_ns / 1e9
+        if age < self.window:
+            self.skipped += 1
+            return f"{age:.0f}s 前仍在修改（稳定窗口 {self.window:.0f}s）"
+        if self.check_open:
+            pid = self._open_table().writer(record.dev, record.inode)
+            if pid is not None:
+                self.skipped += 1
+                return f"正被进程 {pid} 以写方式打开"
+        return None
@@ -0,0 +1,311 @@
+"""并发上传调度：固定大小的工作线程池，并按远端限制同时进行的传输数。"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from src.concurrency import AimdController
+from src.retry import BACKPRESSURE_KINDS, error_kind
+
+
+@dataclass(frozen=True)
+class UploadTask:
+    """一次待执行的上传：本地文件、目标 rclone 远端及远端路径。"""
+
+    local_path: Path
+    remote: str
+    remote_path: str
+    base_path: Optional[Path] = None
+    size: int = -1
+    mtime_ns: int = -1
+    # 上传日志显示远端已有该文件，跳过上传只做后续校验与删除
+    resumed: bool = False
+    # 预先计算好的内容摘要（算法 -> 十六进制摘要），未计算时为 None
+    digests: Optional[Dict[str, str]] = field(default=None, compare=False)
+
+
+@dataclass(frozen=True)
+class UploadBatch:
+    """同一远端下、可由一次 rclone 进程完成的一组上传任务。"""
+
+    remote: str
+    tasks: Tuple[UploadTask, ...]
+
+
+UploadJob = Union[UploadTask, UploadBatch]
+
+# 通道编号
+MAIN_LANE = 0
+SMALL_LANE = 1
+
+
+def job_size(job: UploadJob) -> int:
+    """任务的文件大小；批次取其中最大的文件，未知时为 -1。"""
+    if isinstance(job, UploadBatch):
+        return max((task.size for task in job.tasks), default=-1)
+    return job.size
+
+
+def _transferred_size(job: UploadJob) -> int:
+    """计入吞吐的字节数：续跑的任务并未实际上传，按 0 计；批次与 :func:`job_size` 一样取最大的文件。"""
+    tasks = job.tasks if isinstance(job, UploadBatch) else (job,)
+    return max((task.size for task in tasks if not task.resumed and task.size > 0), default=0)
+
+
+@dataclass
+class UploadResult:
+    """上传结果；``error`` 为空表示成功，``value`` 为上传函数的返回值。"""
+
+    task: UploadJob
+    elapsed: float
+    error: Optional[BaseException] = None
+    value: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class UploadOutcome:
+    """单个文件在上传之后各阶段的状态；``error`` 为空表示可以删除本地文件。"""
+
+    task: UploadTask
+    elapsed: float
+    error: Optional[object] = None
+    deleted: bool = False
+    delete_error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def iter_outcomes(results: Iterable[UploadResult]) -> Iterator[UploadOutcome]:
+    """把单文件或批次的上传结果展开为逐个文件的 :class:`UploadOutcome`。"""
+    for result in results:
+        if isinstance(result.task, UploadBatch):
+            outcomes = result.value or {}
+            for task in result.task.tasks:
+                if result.error is not None:
+                    error: Optional[object] = result.error
+                else:
+                    error = outcomes.get(str(task.local_path), "rclone 未返回该文件的结果")
+                yield UploadOutcome(task, result.elapsed, error)
+        else:
+            yield UploadOutcome(result.task, result.elapsed, result.error)
+
+
+def iter_batches(tasks: Iterable[UploadTask], batch_size: int) -> Iterator[UploadBatch]:
+    """把相邻且位于同一对本地/远端目录下的任务合并为批次。"""
+    pending: List[UploadTask] = []
+    pending_key: Optional[Tuple[str, Path, str]] = None
+    for task in tasks:
+        key = (task.remote, task.local_path.parent, task.remote_path.rsplit("/", 1)[0])
+        if pending and (key != pending_key or len(pending) >= batch_size):
+            yield UploadBatch(pending[0].remote, tuple(pending))
+            pending = []
+        pending.append(task)
+        pending_key = key
+    if pending:
+        yield UploadBatch(pending[0].remote, tuple(pending))
+
+
+def parse_remote_limits(raw_value: str) -> Dict[str, int]:
+    """解析形如 ``123=2;456=1`` 的按远端并发上限配置。"""
+    limits: Dict[str, int] = {}
+    for separator in (",", "\n"):
+        raw_value = raw_value.replace(separator, ";")
+    for entry in raw_value.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" not in entry:
+            raise ValueError(f"远端并发配置 '{entry}' 缺少 '='。")
+        remote, raw_limit = (part.strip() for part in entry.split("=", 1))
+        try:
+            limit = int(raw_limit)
+        except ValueError as exc:
+            raise ValueError(f"远端并发配置 '{entry}' 的上限不是整数。") from exc
+        if not remote or limit < 1:
+            raise ValueError(f"远端并发配置 '{entry}' 无效。")
+        limits[remote] = limit
+    return limits
+
+
+class UploadPool:
+    """
+    带按远端并发上限的上传线程池。
+
+    任务按提交顺序排队，只有在总并发和所属远端的并发都未达上限时才会交给工作线程；
+    :meth:`run` 则严格按提交顺序产出结果，便于调用方输出有序日志并只删除上传成功的文件。
+
+    ``small_file_size`` 与 ``small_workers`` 都大于 0 时启用小文件通道：不超过该大小的任务
+    由另外 ``small_workers`` 个线程处理，不会排在大文件后面。两条通道各自计算并发和远端上限，
+    此时结果按完成顺序产出。
+
+    提供 ``adaptive`` 时，各远端（两条通道分开计算）的并发上限由 :class:`AimdController`
+    根据吞吐和失败情况动态调整，静态上限作为调整范围的最大值。
+
+    :meth:`set_throttle` 可以随时按比例收紧所有上限（例如 Emby 有人播放时），0 表示暂停派发新任务。
+    """
+
+    def __init__(
+        self,
+        upload: Callable[[Any], Any],
+        *,
+        workers: int = 1,
+        remote_limits: Optional[Dict[str, int]] = None,
+        max_pending: Optional[int] = None,
+        small_file_size: int = 0,
+        small_workers: int = 0,
+        adaptive: Optional[AimdController] = None,
+    ) -> None:
+        self._upload = upload
+        self.adaptive = adaptive
+        self.workers = max(1, workers)
+        self.small_file_size = max(0, small_file_size)
+        self.small_workers = max(0, small_workers) if self.small_file_size else 0
+        self._remote_limits = dict(remote_limits or {})
+        # 限制已提交但尚未被消费的任务数，避免把整棵目录树一次性读进内存
+        self._max_pending = max(self.workers, max_pending or self.workers * 4)
+        self._lane_workers = (self.workers, self.small_workers)
+        self._lane_pending = (self._max_pending, self.small_workers * 4)
+        self._lock = threading.Lock()
+        self._active_total = [0, 0]
+        self._active: Dict[Tuple[int, str], int] = {}
+        self._waiting: Dict[Tuple[int, str], Deque[Tuple[UploadJob, Future]]] = {}
+        self._throttle = 1.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _static_limit(self, remote: str, lane: int) -> int:
+        lane_workers = self._lane_workers[lane]
+        return min(lane_workers, self._remote_limits.get(remote, lane_workers))
+
+    @staticmethod
+    def _adaptive_key(remote: str, lane: int) -> str:
+        return remote if lane == MAIN_LANE else f"{remote}（小文件）"
+
+    def remote_limit(self, remote: str, lane: int = MAIN_LANE) -> int:
+        """返回指定远端在某条通道上当前允许的最大并发数。"""
+        ceiling = self._static_limit(remote, lane)
+        limit = ceiling if self.adaptive is None else self.adaptive.limit(self._adaptive_key(remote, lane), ceiling)
+        if self._throttle >= 1:
+            return limit
+        return max(1, round(limit * self._throttle)) if self._throttle > 0 else 0
+
+    def set_throttle(self, fraction: float) -> None:
+        """按比例收紧并发上限（1 为不限制，0 为暂停）；放宽后立即派发等待中的任务。"""
+        with self._lock:
+            self._throttle = max(0.0, min(1.0, fraction))
+            if self._executor is not None:
+                self._dispatch_locked(self._executor)
+
+    def _record_locked(self, lane: int, task: UploadJob, error: Optional[BaseException]) -> None:
+        if self.adaptive is None:
+            return
+        key = (lane, task.remote)
+        saturated = self._active.get(key, 0) >= self.remote_limit(task.remote, lane)
+        self.adaptive.record(
+            self._adaptive_key(task.remote, lane),
+            self._static_limit(task.remote, lane),
+            nbytes=_transferred_size(task) if error is None else 0,
+            failed=1 if error is not None and error_kind(error) in BACKPRESSURE_KINDS else 0,
+            saturated=saturated,
+        )
+
+    def note_error(self, job: UploadJob, kind: str) -> None:
+        """上传函数内部重试前报告的错误（重试成功时不会出现在最终结果里），同样计入自适应并发。"""
+        if self.adaptive is not None and kind in BACKPRESSURE_KINDS:
+            self.adaptive.penalize(self._adaptive_key(job.remote, self.lane_for(job)))
+
+    def lane_for(self, job: UploadJob) -> int:
+        """按文件大小选择通道。"""
+        if self.small_workers:
+            size = job_size(job)
+            if 0 <= size <= self.small_file_size:
+                return SMALL_LANE
+        return MAIN_LANE
+
+    def _dispatch_locked(self, executor: ThreadPoolExecutor) -> None:
+        for key, waiting in self._waiting.items():
+            lane, remote = key
+            limit = self.remote_limit(remote, lane)
+            while (
+                waiting
+                and self._active_total[lane] < self._lane_workers[lane]
+                and self._active.get(key, 0) < limit
+            ):
+                task, future = waiting.popleft()
+                self._active_total[lane] += 1
+                self._active[key] = self._active.get(key, 0) + 1
+                executor.submit(self._execute, executor, lane, task, future)
+
+    def _execute(self, executor: ThreadPoolExecutor, lane: int, task: UploadJob, future: Future) -> None:
+        start = time.monotonic()
+        error: Optional[BaseException] = None
+        value: Any = None
+        try:
+            value = self._upload(task)
+        except Exception as exc:  # 单个文件失败不应中断整个批次
+            error = exc
+        finally:
+            with self._lock:
+                self._record_locked(lane, task, error)
+                self._active_total[lane] -= 1
+                self._active[(lane, task.remote)] -= 1
+                self._dispatch_locked(executor)
+        future.set_result(UploadResult(task, time.monotonic() - start, error, value))
+
+    def _submit(self, executor: ThreadPoolExecutor, lane: int, task: UploadJob) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self._waiting.setdefault((lane, task.remote), deque()).append((task, future))
+            self._dispatch_locked(executor)
+        return future
+
+    def run(self, tasks: Iterable[UploadJob]) -> Iterator[UploadResult]:
+        """并发执行任务，并按提交顺序（启用小文件通道时按完成顺序）逐个产出 :class:`UploadResult`。"""
+        if self.small_workers:
+            yield from self._run_lanes(tasks)
+            return
+        ordered: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload") as executor:
+            self._executor = executor
+            for task in tasks:
+                ordered.append(self._submit(executor, MAIN_LANE, task))
+                while len(ordered) >= self._max_pending:
+                    yield ordered.popleft().result()
+            while ordered:
+                yield ordered.popleft().result()
+            self._executor = None
+
+    def _run_lanes(self, tasks: Iterable[UploadJob]) -> Iterator[UploadResult]:
+        completed: "queue.Queue[Tuple[int, UploadResult]]" = queue.Queue()
+        outstanding = [0, 0]
+        with ThreadPoolExecutor(
+            max_workers=self.workers + self.small_workers, thread_name_prefix="upload"
+        ) as executor:
+            self._executor = executor
+            for task in tasks:
+                lane = self.lane_for(task)
+                # 只有所属通道排满时才等待，另一条通道的任务照常进行
+                while outstanding[lane] >= self._lane_pending[lane]:
+                    done_lane, result = completed.get()
+                    outstanding[done_lane] -= 1
+                    yield result
+                future = self._submit(executor, lane, task)
+                future.add_done_callback(lambda done, lane=lane: completed.put((lane, done.result())))
+                outstanding[lane] += 1
+            while outstanding[MAIN_LANE] or outstanding[SMALL_LANE]:
+                done_lane, result = completed.get()
+                outstanding[done_lane] -= 1
+                yield result
+            self._executor = None
@@ -0,0 +1,161 @@
+"""删除本地文件前核对远端副本：按目录一次列出远端文件的大小与摘要，与本地（或缓存的）值比较。"""
+
+from __future__ import annotations
+
+import time
+from pathlib import PurePosixPath
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.journal import STATE_FAILED, UploadJournal
+from src.localfile import HashCache
+from src.rclone_client import RcloneClient
+from src.uploader import UploadOutcome, UploadTask
+
+# 核对方式：只比较大小，或大小加摘要
+VERIFY_MODES = ("off", "size", "hash")
+# 远端摘要的选用顺序（rclone 的摘要名与 hashlib 一致的部分）
+_HASH_PREFERENCE = ("md5", "sha1", "sha256", "sha512")
+
+Directory = Tuple[str, str]
+
+
+def _parent(remote_path: str) -> str:
+    return str(PurePosixPath("/", remote_path.lstrip("/")).parent)
+
+
+class RemoteVerifier:
+    """
+    核对刚上传（或日志显示已上传）的文件在远端的大小与摘要，一致才交给删除阶段。
+
+    同一远端目录下的文件合并为一次 ``lsjson --hash``（rcd 后端为 ``operations/list``）；
+    ``mode`` 为 ``hash`` 时还比较摘要，本地摘要优先取预先计算的结果或摘要缓存，缺少时读取文件计算。
+    远端不提供可比较的摘要时只核对大小。核对失败的文件保留在本地，上传日志记为失败，下次运行重新上传。
+    """
+
+    def __init__(
+        self,
+        client: RcloneClient,
+        cache: HashCache,
+        *,
+        mode: str = "size",
+        journal: UploadJournal | None = None,
+        window: int = 64,
+        max_wait: float = 30.0,
+    ) -> None:
+        if mode not in VERIFY_MODES:
+            raise ValueError(f"REMOTE_VERIFY 只能是 {' / '.join(VERIFY_MODES)}，而不是 {mode}。")
+        self.client = client
+        self.cache = cache
+        self.mode = mode
+        self.journal = journal
+        self.window = max(1, window)
+        self.max_wait = max_wait
+        self.listings = 0
+        self.hashed = 0
+        self.size_only = 0
+        self.mismatched = 0
+
+    def _fetch(self, remote: str, directory: str) -> Dict[str, Dict[str, Any]]:
+        """一次调用列出远端目录，返回 文件名 -> lsjson 条目。"""
+        self.listings += 1
+        entries = self.client.list_directory(directory, remote=remote, hashes=self.mode == "hash")
+        return {entry.get("Name", ""): entry for entry in entries if not entry.get("IsDir")}
+
+    def _local_digest(self, task: UploadTask, algorithm: str) -> str:
+        if task.digests and algorithm in task.digests:
+            return task.digests[algorithm]
+        return self.cache.digests(task.local_path, [algorithm])[algorithm]
+
+    def _compare(self, task: UploadTask, entry: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        返回不一致的原因，一致时返回 None。
+
+        大小必须能核对：远端不报告大小（``Size`` 为 -1）时按不一致处理，保留本地文件，
+        这样即使远端没有可比较的摘要，文件也至少通过了一项核对才会被删除。
+        """
+        if entry is None:
+            return "远端未找到文件"
+        remote_size = int(entry.get("Size", -1))
+        if remote_size < 0:
+            return "远端未提供文件大小，无法核对"
+        if remote_size != task.size:
+            return f"远端大小 {remote_size} 与本地 {task.size} 不一致"
+        if self.mode != "hash":
+            return None
+        remote_hashes = {str(name).lower(): str(value).lower() for name, value in (entry.get("Hashes") or {}).items()}
+        algorithm = next((name for name in _HASH_PREFERENCE if remote_hashes.get(name)), None)
+        if algorithm is None:
+            self.size_only += 1
+            return None
+        local = self._local_digest(task, algorithm)
+        self.hashed += 1
+        if local.lower() != remote_hashes[algorithm]:
+            return f"远端 {algorithm} {remote_hashes[algorithm]} 与本地 {local} 不一致"
+        return None
+
+    def check_directory(self, remote: str, directory: str, tasks: Sequence[UploadTask]) -> List[Optional[str]]:
+        """核对同一远端目录下的一组文件，返回与 ``tasks`` 对应的不一致原因（一致为 None）。"""
+        try:
+            listing = self._fetch(remote, directory)
+        except RuntimeError as exc:
+            return [f"远端校验失败: {exc}"] * len(tasks)
+        results: List[Optional[str]] = []
+        for task in tasks:
+            try:
+                error = self._compare(task, listing.get(PurePosixPath(task.remote_path).name))
+            except OSError as exc:
+                error = f"计算本地摘要失败: {exc}"
+            if error is not None:
+                self.mismatched += 1
+            results.append(error)
+        return results
+
+    def _flush(self, directory: Directory, outcomes: List[UploadOutcome]) -> Iterator[UploadOutcome]:
+        remote, path = directory
+        for outcome, error in zip(outcomes, self.check_directory(remote, path, [item.task for item in outcomes])):
+            if error is not None:
+                outcome.error = f"远端校验未通过: {error}"
+                if self.journal is not None:
+                    self.journal.record(outcome.task, STATE_FAILED, error=str(outcome.error))
+            yield outcome
+
+    def transform(self, outcomes: Iterator[UploadOutcome]) -> Iterator[UploadOutcome]:
+        """
+        流水线阶段：按远端目录收集成功的结果后一并核对，失败的结果直接放行。
+
+        攒满 ``window`` 个文件时先核对文件最多的目录；某个目录等待超过 ``max_wait`` 秒时，
+        下一个结果到达后立即核对，避免上传较慢时本地文件迟迟不能删除。输入结束时核对剩余的全部目录。
+        """
+        groups: Dict[Directory, List[UploadOutcome]] = {}
+        started: Dict[Directory, float] = {}
+        buffered = 0
+        for outcome in outcomes:
+            if not outcome.ok:
+                yield outcome
+                continue
+            directory = (outcome.task.remote, _parent(outcome.task.remote_path))
+            groups.setdefault(directory, []).append(outcome)
+            started.setdefault(directory, time.monotonic())
+            buffered += 1
+            now = time.monotonic()
+            due = [key for key, since in started.items() if now - since >= self.max_wait]
+            if buffered >= self.window and not due:
+                due = [max(groups, key=lambda key: len(groups[key]))]
+            for key in due:
+                batch = groups.pop(key)
+                del started[key]
+                buffered -= len(batch)
+                yield from self._flush(key, batch)
+        for key, batch in groups.items():
+            yield from self._flush(key, batch)
+
+    def report(self) -> List[str]:
+        if not self.listings:
+            return []
+        line = f"远端校验: 列出 {self.listings} 个目录"
+        if self.mode == "hash":
+            line += f"，比较摘要 {self.hashed} 个文件，远端无摘要仅核对大小 {self.size_only} 个"
+        return [line + (f"，不一致 {self.mismatched} 个" if self.mismatched else "")]
+
+    def reset_stats(self) -> None:
+        self.listings = self.hashed = self.size_only = self.mismatched = 0
@@ -0,0 +1,47 @@
+"""BandwidthScheduler 的测试。"""
+
+from __future__ import annotations
+
+import unittest
+from typing import List, Optional
+
+from src.bandwidth import BandwidthScheduler
+
+
+class SetCapTest(unittest.TestCase):
+    def test_cap_is_split_by_weight(self) -> None:
+        scheduler = BandwidthScheduler([], dynamic=True)
+        seen: List[Optional[float]] = []
+        with scheduler.transfer(1) as small, scheduler.transfer(3, seen.append) as large:
+            self.assertIsNone(small.rate)
+            scheduler.set_cap(400.0)
+            self.assertEqual((small.rate, large.rate), (100.0, 300.0))
+            scheduler.set_cap(0.0)
+            self.assertEqual((small.rate, large.rate), (0.0, 0.0))
+            scheduler.set_cap(None)
+            self.assertEqual((small.rate, large.rate), (None, None))
+        self.assertEqual(seen, [300.0, 0.0, None])
+
+    def test_cap_below_timetable(self) -> None:
+        scheduler = BandwidthScheduler([(0, 1000.0)], clock=lambda: 0.0)
+        with scheduler.transfer() as share:
+            self.assertEqual(share.rate, 1000.0)
+            scheduler.set_cap(2000.0)
+            self.assertEqual(share.rate, 1000.0)
+            scheduler.set_cap(250.0)
+            self.assertEqual(share.rate, 250.0)
+            scheduler.set_cap(None)
+            self.assertEqual(share.rate, 1000.0)
+
+    def test_new_transfer_starts_with_capped_share(self) -> None:
+        scheduler = BandwidthScheduler([], dynamic=True)
+        scheduler.set_cap(600.0)
+        with scheduler.transfer(1) as first:
+            self.assertEqual(first.rate, 600.0)
+            with scheduler.transfer(2) as second:
+                self.assertEqual((first.rate, second.rate), (200.0, 400.0))
+            self.assertEqual(first.rate, 600.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""DownstreamRefresh 与 MountRefresher 对接 src.fake_rcd 替身服务的测试。"""
+
+from __future__ import annotations
+
+import io
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from src.downstream import DownstreamRefresh, MountRefresher, parse_path_map
+from src.fake_rcd import start_server
+
+
+class MountRefreshTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="downstream-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.server, self.state, url = start_server(self.tmp / "remote")
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        # 远端 r:/up 挂载为 mount 的根目录
+        self.mount = MountRefresher(url, parse_path_map("r:/up=>/"))
+        self.downstream = DownstreamRefresh([self.mount], debounce=0)
+        self.addCleanup(self.downstream.close)
+
+    def flush(self) -> str:
+        with redirect_stdout(io.StringIO()) as output:
+            self.downstream.flush()
+        return output.getvalue()
+
+    def test_mount_root_is_a_target(self) -> None:
+        self.assertEqual(self.mount.target("r", "/up"), "")
+        self.assertEqual(self.mount.target("r", "/up/show"), "show")
+        self.assertIsNone(self.mount.target("r", "/other"))
+        self.downstream.note("r", "/up/a.mkv")
+        self.downstream.note("r", "/up/show/e01.mkv")
+        self.flush()
+        self.assertEqual(sorted(self.state.refreshed), ["", "show"])
+
+    def test_failed_refresh_is_retried(self) -> None:
+        self.state.vfs_down = True
+        self.downstream.note("r", "/up/show/e01.mkv")
+        self.assertIn("稍后重试", self.flush())
+        self.assertTrue(self.downstream.due())
+        self.state.vfs_down = False
+        self.flush()
+        self.assertEqual(self.state.refreshed, ["show"])
+        self.assertFalse(self.downstream.due())
+
+
+if __name__ == "__main__":
+    unittest.main()
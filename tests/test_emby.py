@@ -0,0 +1,128 @@
+"""Emby 播放统计与播放限速对接 src.fake_emby 替身服务的测试。"""
+
+from __future__ import annotations
+
+import io
+import time
+import unittest
+from contextlib import redirect_stderr
+from typing import List, Optional
+from unittest import mock
+
+from src.bandwidth import BandwidthScheduler
+from src.emby import EmbyClient, PlaybackLoad, PlaybackThrottle, _is_lan, measure_playback
+from src.fake_emby import make_session, start_server
+from src.uploader import UploadPool
+
+
+class IsLanTest(unittest.TestCase):
+    def test_endpoints(self) -> None:
+        lan = ("192.168.1.20", "10.1.2.3:50000", "127.0.0.1", "::1", "[::1]:1234", "[fd00::2]:8096", "::ffff:10.0.0.5")
+        for endpoint in lan:
+            self.assertTrue(_is_lan(endpoint), endpoint)
+        wan = (None, "", "203.0.113.10", "203.0.113.10:443", "2001:db8::1", "[2001:db8::1]:443", "emby.example")
+        for endpoint in wan:
+            self.assertFalse(_is_lan(endpoint), endpoint)
+
+
+class MeasurePlaybackTest(unittest.TestCase):
+    def test_transcode_and_direct(self) -> None:
+        sessions = [
+            make_session(1, method="Transcode", bitrate=4_000_000),
+            make_session(2, method="DirectPlay", bitrate=20_000_000),
+            make_session(3, method="DirectStream", bitrate=10_000_000),
+            {"Id": "idle", "PlayState": {}},
+        ]
+        # 转码按输出码率计，而不是源文件码率
+        self.assertEqual(measure_playback(sessions), PlaybackLoad(1, 2, 34_000_000))
+
+    def test_paused_sessions_are_ignored(self) -> None:
+        sessions = [make_session(1, paused=True), make_session(2, method="Transcode", bitrate=3_000_000, paused=True)]
+        self.assertEqual(measure_playback(sessions), PlaybackLoad())
+
+    def test_lan_filtering(self) -> None:
+        sessions = [
+            make_session(1, bitrate=20_000_000, remote_endpoint="192.168.1.20"),
+            make_session(2, bitrate=20_000_000, remote_endpoint="[::1]:51000"),
+            make_session(3, bitrate=5_000_000),
+        ]
+        self.assertEqual(measure_playback(sessions), PlaybackLoad(0, 1, 5_000_000))
+        self.assertEqual(measure_playback(sessions, include_lan=True), PlaybackLoad(0, 3, 45_000_000))
+
+
+class PlaybackThrottleTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server, self.state, url = start_server(api_key="test")
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = EmbyClient(url, "test")
+        self.addCleanup(self.client.close)
+        self.bandwidth = BandwidthScheduler([], dynamic=True)
+        self.pool = UploadPool(lambda task: None, workers=8)
+        self.throttle = PlaybackThrottle(
+            self.client, uplink_bps=100_000_000, bandwidth=self.bandwidth, pool=self.pool, ramp_step=0.25
+        )
+
+    def test_target_fraction(self) -> None:
+        self.assertEqual(self.throttle.target_fraction(PlaybackLoad()), 1.0)
+        self.assertAlmostEqual(self.throttle.target_fraction(PlaybackLoad(1, 0, 40_000_000)), 0.52)
+        # 剩余比例低于 pause_below 时暂停
+        self.assertEqual(self.throttle.target_fraction(PlaybackLoad(0, 1, 78_000_000)), 0.0)
+        self.assertEqual(self.throttle.target_fraction(PlaybackLoad(0, 2, 200_000_000)), 0.0)
+
+    def test_tightens_at_once_and_ramps_up(self) -> None:
+        rates: List[Optional[float]] = []
+        with self.bandwidth.transfer(1, rates.append) as share:
+            self.state.set_streams([{"method": "Transcode", "bitrate": 40_000_000}])
+            self.throttle.poll()
+            self.assertAlmostEqual(self.throttle.fraction, 0.52)
+            self.assertAlmostEqual(share.rate or 0, 100_000_000 / 8 * 0.52)
+            self.assertEqual(self.pool.remote_limit("r"), 4)
+
+            self.state.set_streams([])
+            fractions = []
+            for _ in range(3):
+                self.throttle.poll()
+                fractions.append(self.throttle.fraction)
+            self.assertEqual([round(value, 2) for value in fractions], [0.77, 1.0, 1.0])
+            self.assertIsNone(share.rate)
+            self.assertEqual(self.pool.remote_limit("r"), 8)
+        self.assertEqual(rates[-1], None)
+
+    def test_pauses_on_heavy_playback(self) -> None:
+        self.state.set_streams([{"method": "DirectPlay", "bitrate": 90_000_000}])
+        self.throttle.poll()
+        self.assertEqual(self.throttle.fraction, 0.0)
+        self.assertEqual(self.pool.remote_limit("r"), 0)
+        self.throttle.stop()
+        self.assertEqual(self.pool.remote_limit("r"), 8)
+
+    def test_unreachable_emby_keeps_limits(self) -> None:
+        self.state.set_streams([{"method": "Transcode", "bitrate": 40_000_000}])
+        self.throttle.poll()
+        self.server.shutdown()
+        self.server.server_close()
+        self.throttle.poll()
+        self.assertAlmostEqual(self.throttle.fraction, 0.52)
+
+    def test_unexpected_error_keeps_polling(self) -> None:
+        self.throttle.interval = 0.01
+        self.state.set_streams([{"method": "Transcode", "bitrate": 40_000_000}])
+        self.throttle.poll()
+        with mock.patch.object(self.client, "sessions", side_effect=TypeError("bad session")):
+            with redirect_stderr(io.StringIO()) as stderr:
+                self.throttle.start()
+                self.addCleanup(self.throttle.stop)
+                time.sleep(0.1)
+        self.assertIn("bad session", stderr.getvalue())
+        self.assertAlmostEqual(self.throttle.fraction, 0.52)
+        # 轮询线程仍在运行，播放结束后照常放宽
+        self.state.set_streams([])
+        deadline = time.monotonic() + 5
+        while self.throttle.fraction < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.throttle.fraction, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
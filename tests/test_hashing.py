@@ -0,0 +1,72 @@
+"""HashAhead 的测试。"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import List
+
+from src.hashing import HashAhead
+from src.localfile import HashCache
+from src.uploader import UploadTask
+
+
+class HashAheadTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="hashing-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.cache = HashCache(self.tmp / "hashes.db", use_xattr=False)
+        self.addCleanup(self.cache.close)
+        self.hasher = HashAhead(["md5"], cache=self.cache, workers=1)
+        self.addCleanup(self.hasher.close)
+
+    def task(self, name: str) -> UploadTask:
+        path = self.tmp / name
+        path.write_bytes(name.encode() * 1000)
+        # 避开 mtime 不可靠的窗口，让摘要写入缓存
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+        return UploadTask(path, "r", f"/media/{name}", size=path.stat().st_size)
+
+    def run_tasks(self, tasks: List[UploadTask]) -> List[UploadTask]:
+        with redirect_stdout(io.StringIO()):
+            return list(self.hasher.transform(iter(tasks)))
+
+    def expected(self, task: UploadTask) -> str:
+        return hashlib.md5(task.local_path.read_bytes()).hexdigest()
+
+    def test_computes_then_hits_cache(self) -> None:
+        tasks = [self.task(f"{index}.mkv") for index in range(3)]
+        results = self.run_tasks(tasks)
+        self.assertEqual([result.local_path for result in results], [task.local_path for task in tasks])
+        self.assertEqual([(result.digests or {}).get("md5") for result in results], [self.expected(t) for t in tasks])
+        self.assertEqual((self.hasher.computed, self.hasher.cached), (3, 0))
+        self.hasher.reset_stats()
+        self.run_tasks(tasks)
+        self.assertEqual((self.hasher.computed, self.hasher.cached), (0, 3))
+
+    def test_recovers_from_broken_pool(self) -> None:
+        self.run_tasks([self.task("a.mkv")])
+        executor = self.hasher._executor
+        assert executor is not None
+        # 模拟工作进程被 OOM killer 杀掉
+        for process in list(executor._processes.values()):  # type: ignore[attr-defined]
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        tasks = [self.task("b.mkv"), self.task("c.mkv")]
+        results = self.run_tasks(tasks)
+        # 摘要算不出来的文件照常放行
+        self.assertEqual([result.local_path for result in results], [task.local_path for task in tasks])
+        self.assertGreaterEqual(self.hasher.failed, 1)
+        later = self.task("d.mkv")
+        self.assertEqual(self.run_tasks([later])[0].digests, {"md5": self.expected(later)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""TreeWatcher 的测试。"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List, Set
+
+from src.inotify import IN_Q_OVERFLOW, OVERFLOW, READY, REMOVED, Change, TreeWatcher
+
+
+class TreeWatcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="inotify-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.root = self.tmp / "watched"
+        self.outside = self.tmp / "outside"
+        self.root.mkdir()
+        self.outside.mkdir()
+        self.watcher = TreeWatcher([self.root])
+        self.addCleanup(self.watcher.close)
+
+    def changes(self) -> List[Change]:
+        changes: List[Change] = []
+        while True:
+            batch = self.watcher.poll(0.2)
+            if not batch:
+                return changes
+            changes.extend(batch)
+
+    def ready(self) -> Set[Path]:
+        return {change.path for change in self.changes() if change.kind == READY}
+
+    def test_close_write(self) -> None:
+        (self.root / "a.mkv").write_bytes(b"data")
+        self.assertEqual(self.ready(), {self.root / "a.mkv"})
+
+    def test_create_via_link(self) -> None:
+        source = self.outside / "a.mkv"
+        source.write_bytes(b"data")
+        os.link(source, self.root / "hard.mkv")
+        os.symlink(source, self.root / "soft.mkv")
+        self.assertEqual(self.ready(), {self.root / "hard.mkv", self.root / "soft.mkv"})
+
+    def test_move_in_and_out(self) -> None:
+        source = self.outside / "a.mkv"
+        source.write_bytes(b"data")
+        source.rename(self.root / "a.mkv")
+        self.assertEqual(self.ready(), {self.root / "a.mkv"})
+        (self.root / "a.mkv").rename(self.outside / "b.mkv")
+        self.assertEqual(self.changes(), [Change(REMOVED, self.root / "a.mkv")])
+
+    def test_new_directory_reports_existing_files(self) -> None:
+        incoming = self.outside / "show"
+        incoming.mkdir()
+        (incoming / "e01.mkv").write_bytes(b"data")
+        incoming.rename(self.root / "show")
+        self.assertEqual(self.ready(), {self.root / "show" / "e01.mkv"})
+        (self.root / "show" / "e02.mkv").write_bytes(b"data")
+        self.assertEqual(self.ready(), {self.root / "show" / "e02.mkv"})
+
+    def test_overflow(self) -> None:
+        self.watcher._handle(-1, IN_Q_OVERFLOW, "")
+        self.assertEqual([change.kind for change in self.watcher.poll(0)], [OVERFLOW])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""UploadJournal 的测试。"""
+
+from __future__ import annotations
+
+import shutil
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from unittest import mock
+
+from src.journal import STATE_DELETED, STATE_FAILED, STATE_UPLOADED, STATE_VERIFIED, UploadJournal
+from src.uploader import UploadTask
+
+
+class UploadJournalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="journal-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.db_path = self.tmp / "state" / "journal.db"
+        self.journal = UploadJournal(self.db_path)
+        self.addCleanup(self.journal.close)
+        self.task = UploadTask(self.tmp / "a.mkv", "r", "/media/a.mkv", size=10, mtime_ns=123)
+
+    def test_survives_reopen(self) -> None:
+        self.journal.record(self.task, STATE_UPLOADED)
+        self.journal.close()
+        self.journal = UploadJournal(self.db_path)
+        self.assertTrue(self.journal.is_uploaded(self.task))
+        entry = self.journal.lookup(self.task.local_path)
+        assert entry is not None
+        self.assertEqual(entry.state, STATE_UPLOADED)
+        self.assertIsNotNone(entry.uploaded_at)
+
+    def test_changed_file_is_not_uploaded(self) -> None:
+        self.journal.record(self.task, STATE_VERIFIED)
+        self.assertTrue(self.journal.is_uploaded(self.task))
+        for changed in (
+            replace(self.task, size=11),
+            replace(self.task, mtime_ns=124),
+            replace(self.task, remote="other"),
+            replace(self.task, remote_path="/media/b.mkv"),
+        ):
+            self.assertFalse(self.journal.is_uploaded(changed), changed)
+
+    def test_failed_after_upload_keeps_upload_time(self) -> None:
+        self.journal.record(self.task, STATE_UPLOADED)
+        self.journal.record(self.task, STATE_FAILED, error="远端校验未通过")
+        self.assertFalse(self.journal.is_uploaded(self.task))
+        entry = self.journal.lookup(self.task.local_path)
+        assert entry is not None
+        self.assertEqual(entry.error, "远端校验未通过")
+        self.assertIsNotNone(entry.uploaded_at)
+
+    def test_counts_and_prune(self) -> None:
+        other = replace(self.task, local_path=self.tmp / "b.mkv")
+        with mock.patch("src.journal.time.time", return_value=1000.0):
+            self.journal.record(self.task, STATE_DELETED)
+        self.journal.record(other, STATE_DELETED)
+        self.assertEqual(self.journal.counts(), {STATE_DELETED: 2})
+        self.assertEqual(self.journal.prune(3600), 1)
+        self.assertIsNone(self.journal.lookup(self.task.local_path))
+        self.assertIsNotNone(self.journal.lookup(other.local_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
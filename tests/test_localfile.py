@@ -0,0 +1,140 @@
+"""本地文件扫描与清理的测试。"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.localfile import HashCache, file_record, iter_file_records, iter_files_sorted, prune_empty_parents
+
+
+class LocalFileTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="localfile-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.root = self.tmp / "data"
+        self.root.mkdir()
+
+    def make(self, relative: str, data: bytes = b"x") -> Path:
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+
+class IterFileRecordsTest(LocalFileTestCase):
+    def test_matches_os_walk_order(self) -> None:
+        for relative in ("b.mkv", "a.mkv", "show/e02.mkv", "show/e01.mkv", "show/s1/x.mkv", "Z/y.mkv", "名字/文件.mkv"):
+            self.make(relative, relative.encode())
+        records = list(iter_file_records(self.root))
+        self.assertEqual([record.path for record in records], list(iter_files_sorted(self.root)))
+        for record in records:
+            self.assertEqual(record.relative, record.path.relative_to(self.root).as_posix())
+            stat = record.path.stat()
+            self.assertEqual((record.size, record.mtime_ns, record.inode, record.dev),
+                             (stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev))
+        by_relative = {record.relative: record for record in records}
+        self.assertEqual(file_record(self.root / "show/e01.mkv", self.root), by_relative["show/e01.mkv"])
+
+    def test_symlinked_directories_are_not_followed(self) -> None:
+        self.make("real/a.mkv")
+        outside = self.tmp / "outside"
+        outside.mkdir()
+        (outside / "b.mkv").write_bytes(b"x")
+        (self.root / "link").symlink_to(outside, target_is_directory=True)
+        self.assertEqual([record.relative for record in iter_file_records(self.root)], ["real/a.mkv"])
+
+    def test_missing_root(self) -> None:
+        with self.assertRaises(NotADirectoryError):
+            list(iter_file_records(self.tmp / "missing"))
+
+
+class PruneEmptyParentsTest(LocalFileTestCase):
+    def test_prunes_only_along_touched_paths(self) -> None:
+        deleted = [self.make("show/s1/e01.mkv"), self.make("show/s2/e01.mkv"), self.make("movie/a.mkv")]
+        self.make("show/s3/e01.mkv")
+        (self.root / "untouched/empty").mkdir(parents=True)
+        for path in deleted:
+            path.unlink()
+        removed = prune_empty_parents({path.parent for path in deleted}, self.root)
+        # show 里还有 s3，停在 show；movie 整个删掉；不相关的空目录保留
+        self.assertEqual(removed, 3)
+        self.assertEqual(
+            sorted(path.relative_to(self.root).as_posix() for path in self.root.rglob("*")),
+            ["show", "show/s3", "show/s3/e01.mkv", "untouched", "untouched/empty"],
+        )
+
+    def test_siblings_before_parent_and_root_kept(self) -> None:
+        # 传入顺序先父后子，仍然要先删掉子目录再删父目录
+        (self.root / "a/b/c").mkdir(parents=True)
+        (self.root / "a/d").mkdir()
+        removed = prune_empty_parents([self.root / "a", self.root / "a/d", self.root / "a/b/c", self.root], self.root)
+        self.assertEqual(removed, 4)
+        self.assertTrue(self.root.is_dir())
+        self.assertEqual(list(self.root.iterdir()), [])
+
+    def test_ignores_missing_and_outside_directories(self) -> None:
+        (self.root / "a").mkdir()
+        outside = self.tmp / "outside"
+        outside.mkdir()
+        self.assertEqual(prune_empty_parents([self.root / "a/gone", outside], self.root), 1)
+        self.assertTrue(outside.is_dir())
+
+
+class HashCacheTest(LocalFileTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = HashCache(self.tmp / "hashes.db", use_xattr=False)
+        self.addCleanup(self.cache.close)
+
+    def old_file(self, relative: str, data: bytes) -> Path:
+        path = self.make(relative, data)
+        # 避开 mtime 不可靠的窗口
+        os.utime(path, (1_000_000_000, 1_000_000_000))
+        return path
+
+    def test_computes_once_and_survives_rename(self) -> None:
+        path = self.old_file("a.mkv", b"movie")
+        expected = {"md5": hashlib.md5(b"movie").hexdigest(), "sha1": hashlib.sha1(b"movie").hexdigest()}
+        self.assertEqual(self.cache.digests(path, ["md5", "sha1"]), expected)
+        moved = path.rename(self.root / "b.mkv")
+        self.cache.close()
+        self.cache = HashCache(self.tmp / "hashes.db", use_xattr=False)
+        self.assertEqual(self.cache.digests(moved, ["sha1", "md5"]), expected)
+        self.assertEqual((self.cache.computed, self.cache.hits), (0, 1))
+
+    def test_changed_file_is_recomputed(self) -> None:
+        path = self.old_file("a.mkv", b"movie")
+        self.cache.digests(path, ["md5"])
+        path.write_bytes(b"other")
+        os.utime(path, (1_000_000_100, 1_000_000_100))
+        self.assertEqual(self.cache.digests(path, ["md5"]), {"md5": hashlib.md5(b"other").hexdigest()})
+        self.assertEqual(self.cache.computed, 2)
+
+    def test_missing_algorithm_and_racy_window(self) -> None:
+        path = self.old_file("a.mkv", b"movie")
+        self.cache.digests(path, ["md5"])
+        self.assertEqual(self.cache.lookup(path, ["md5", "sha1"]), {"md5": hashlib.md5(b"movie").hexdigest()})
+        fresh = self.make("b.mkv", b"new")
+        self.cache.digests(fresh, ["md5"])
+        # 刚写入的文件不入缓存
+        self.assertEqual(self.cache.lookup(fresh, ["md5"]), {})
+
+    def test_xattr_storage(self) -> None:
+        path = self.old_file("a.mkv", b"movie")
+        cache = HashCache(None, use_xattr=True)
+        if not cache.use_xattr:
+            self.skipTest("平台不支持扩展属性")
+        cache.digests(path, ["md5"])
+        if not cache._xattr_usable(path.stat().st_dev):
+            self.skipTest("临时目录所在文件系统不支持 user.* 扩展属性")
+        reopened = HashCache(None, use_xattr=True)
+        self.assertEqual(reopened.lookup(path, ["md5"]), {"md5": hashlib.md5(b"movie").hexdigest()})
+
+
+if __name__ == "__main__":
+    unittest.main()
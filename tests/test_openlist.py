@@ -0,0 +1,160 @@
+"""OpenlistClient 对接 src.fake_openlist 替身服务的测试。"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.bandwidth import BandwidthScheduler, DailyQuota, QuotaExceededError
+from src.fake_openlist import start_server
+from src.openlist import OpenlistClient
+from src.retry import PARKED, UploadError
+
+
+class OpenlistTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="openlist-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.server, self.state, url = start_server()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        env = {
+            "OPENLIST_API_BASE_URL": url,
+            "OPENLIST_USERNAME": "admin",
+            "OPENLIST_PASSWORD": "admin",
+            "OPENLIST_RAPID_UPLOAD": "0",
+            "OPENLIST_VERIFY_UPLOAD": "0",
+            "LISTING_CACHE_DB": "",
+            "HASH_CACHE_DB": str(self.tmp / "hash_cache.db"),
+            "HASH_CACHE_XATTR": "0",
+            "BANDWIDTH_SCHEDULE": "",
+            "DAILY_QUOTA": "",
+            "BANDWIDTH_USAGE_DB": str(self.tmp / "usage.db"),
+        }
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self, **kwargs: object) -> OpenlistClient:
+        client = OpenlistClient(**kwargs)  # type: ignore[arg-type]
+        self.addCleanup(client.close)
+        return client
+
+    def local_file(self, name: str, size: int) -> str:
+        path = self.tmp / name
+        path.write_bytes(os.urandom(size))
+        return str(path)
+
+
+class OpenlistConfigTest(OpenlistTestCase):
+    def test_missing_config_opens_nothing(self) -> None:
+        opened = mock.Mock(side_effect=AssertionError("配置检查前不应打开任何句柄"))
+        with mock.patch.dict(os.environ, {"OPENLIST_PASSWORD": ""}), mock.patch.multiple(
+            "src.openlist",
+            load_dotenv=mock.DEFAULT,
+            open_listing_store=opened,
+            open_hash_cache=opened,
+            open_bandwidth_scheduler=opened,
+            open_daily_quota=opened,
+        ):
+            with self.assertRaises(ValueError):
+                OpenlistClient()
+        opened.assert_not_called()
+
+
+class OpenlistLimitsTest(OpenlistTestCase):
+    def test_limits_from_environment(self) -> None:
+        with mock.patch.dict(os.environ, {"BANDWIDTH_SCHEDULE": "00:00,1M", "DAILY_QUOTA": "openlist=1G"}):
+            client = self.client()
+        assert client.bandwidth is not None and client.quota is not None
+        self.assertEqual(client.bandwidth.rate_at(time.time()), 1024 ** 2)
+        self.assertEqual(client.quota.quotas, {"openlist": 1024 ** 3})
+
+    def test_put_is_throttled(self) -> None:
+        # 允许一秒的突发，其余 384 KiB 按 256 KiB/s 发送
+        client = self.client(bandwidth=BandwidthScheduler([(0, 256 * 1024.0)]))
+        local = self.local_file("a.mkv", 640 * 1024)
+        started = time.monotonic()
+        client.upload_file(local, "/media/a.mkv")
+        self.assertGreaterEqual(time.monotonic() - started, 1.3)
+        self.assertEqual(self.state.files["/media/a.mkv"], Path(local).read_bytes())
+
+    def test_put_is_parked_by_quota(self) -> None:
+        quota = DailyQuota({"openlist": 6000}, self.tmp / "usage.db")
+        self.addCleanup(quota.close)
+        client = self.client(quota=quota)
+        client.upload_file(self.local_file("a.mkv", 4000), "/media/a.mkv")
+        self.assertEqual(quota.used("openlist"), 4000)
+        with self.assertRaises(QuotaExceededError) as caught:
+            client.upload_file(self.local_file("b.mkv", 4000), "/media/b.mkv")
+        self.assertEqual(caught.exception.kind, PARKED)
+        self.assertEqual(self.state.calls["/api/fs/put"], 1)
+        self.assertNotIn("/media/b.mkv", self.state.files)
+
+
+class OpenlistRapidUploadTest(OpenlistTestCase):
+    # 足够大，服务端不读取请求体时客户端来不及把它全部写进套接字缓冲区
+    SIZE = 8 * 1024 * 1024
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.quota = DailyQuota({"openlist": 10 * self.SIZE}, self.tmp / "usage.db")
+        self.addCleanup(self.quota.close)
+        self.openlist = self.client(quota=self.quota)
+
+    def test_hit(self) -> None:
+        local = self.local_file("a.mkv", self.SIZE)
+        self.openlist.upload_file(local, "/first/a.mkv")
+        self.openlist.upload_file(local, "/second/a.mkv", rapid=True, verify=True)
+        self.assertEqual(self.state.rapid_hits, 1)
+        self.assertEqual(self.openlist.rapid_files, 1)
+        self.assertGreater(self.openlist.rapid_bytes_saved, 0)
+        self.assertEqual(self.openlist.verified_files, 1)
+        # 秒传不计入配额
+        self.assertEqual(self.quota.used("openlist"), self.SIZE)
+        self.assertEqual(self.state.files["/second/a.mkv"], Path(local).read_bytes())
+
+    def test_miss(self) -> None:
+        local = self.local_file("a.mkv", self.SIZE)
+        self.openlist.upload_file(local, "/media/a.mkv", rapid=True)
+        self.assertEqual(self.state.rapid_hits, 0)
+        self.assertEqual(self.openlist.rapid_files, 0)
+        self.assertEqual(self.quota.used("openlist"), self.SIZE)
+        self.assertEqual(self.state.files["/media/a.mkv"], Path(local).read_bytes())
+
+    def test_partial_read_is_not_counted_as_rapid(self) -> None:
+        # 服务端只读取前 1 MiB 就返回 200 并关闭连接
+        self.state.truncate = 1024 * 1024
+        with self.assertRaises(UploadError):
+            self.openlist.upload_file(self.local_file("a.mkv", self.SIZE), "/media/a.mkv", rapid=True)
+        self.assertEqual(self.openlist.rapid_files, 0)
+        # 发送过的数据按已上传计入配额
+        self.assertEqual(self.quota.used("openlist"), self.SIZE)
+        with self.assertRaises(UploadError):
+            self.openlist.upload_file(self.local_file("b.mkv", self.SIZE), "/media/b.mkv")
+
+    def test_verify_tee_hashes(self) -> None:
+        local = self.local_file("a.mkv", 100_000)
+        # 刚写入的文件处于 mtime 不可靠的窗口内，摘要不会入缓存
+        os.utime(local, (time.time() - 60, time.time() - 60))
+        self.openlist.upload_file(local, "/media/a.mkv", verify=True)
+        self.assertEqual(self.openlist.verified_files, 1)
+        digests = self.openlist.hash_cache.lookup(Path(local), ["md5"], Path(local).stat())
+        self.assertEqual(digests["md5"], hashlib.md5(Path(local).read_bytes()).hexdigest())
+
+    def test_verify_mismatch(self) -> None:
+        self.state.corrupt.add("/media/a.mkv")
+        with self.assertRaises(UploadError) as caught:
+            self.openlist.upload_file(self.local_file("a.mkv", 100_000), "/media/a.mkv", verify=True)
+        self.assertIn("上传后校验失败", str(caught.exception))
+        self.assertEqual(self.openlist.verified_files, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""分阶段流水线的测试。"""
+
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from typing import Any, Iterator, List
+
+from src.pipeline import Pipeline, Stage, parallel_map
+
+
+def _source(count: int, produced: List[int]):
+    def transform(_: Iterator[Any]) -> Iterator[int]:
+        for number in range(count):
+            produced.append(number)
+            yield number
+
+    return transform
+
+
+class PipelineTest(unittest.TestCase):
+    def test_stages_preserve_order_and_count(self) -> None:
+        produced: List[int] = []
+
+        def slow_square(number: int) -> Any:
+            time.sleep(0.001 * (number % 3))
+            return None if number % 5 == 0 else number * number
+
+        pipeline = Pipeline(
+            [
+                Stage("scan", _source(50, produced)),
+                Stage("square", parallel_map(slow_square, workers=4)),
+                Stage("plus", parallel_map(lambda number: number + 1)),
+            ],
+            queue_size=2,
+        )
+        self.assertEqual(list(pipeline.run()), [n * n + 1 for n in range(50) if n % 5])
+        self.assertEqual([(s.items_in, s.items_out) for s in pipeline.stats], [(0, 50), (50, 40), (40, 40)])
+        self.assertEqual(len(pipeline.report()), 4)
+
+    def test_bounded_queues_apply_backpressure(self) -> None:
+        produced: List[int] = []
+        pipeline = Pipeline([Stage("scan", _source(1000, produced)), Stage("pass", lambda items: items)], queue_size=2)
+        results = pipeline.run()
+        self.assertEqual(next(results), 0)
+        time.sleep(0.2)
+        # 两个队列加上各阶段手里的一项，上游不会跑到前面太远
+        self.assertLess(len(produced), 10)
+        results.close()
+        self.assertLess(len(produced), 10)
+
+    def test_error_stops_all_stages(self) -> None:
+        produced: List[int] = []
+
+        def fail_at_ten(number: int) -> int:
+            if number == 10:
+                raise OSError("disk gone")
+            return number
+
+        pipeline = Pipeline([Stage("scan", _source(10_000, produced)), Stage("fail", parallel_map(fail_at_ten))])
+        with self.assertRaises(OSError):
+            list(pipeline.run())
+        self.assertLess(len(produced), 10_000)
+        self.assertEqual([thread for thread in threading.enumerate() if thread.name.startswith("stage-")], [])
+
+    def test_requires_a_stage(self) -> None:
+        with self.assertRaises(ValueError):
+            Pipeline([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""RcloneClient 的测试。"""
+
+from __future__ import annotations
+
+import os
+import unittest
+from unittest import mock
+
+from src.bandwidth import BandwidthScheduler
+from src.rclone_client import RcloneClient
+
+
+class BandwidthArgsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch.dict(os.environ, {"RCLONE_REMOTE": "r", "LISTING_CACHE_DB": ""})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = RcloneClient()
+        self.addCleanup(self.client.close)
+
+    def test_disabled_without_scheduler(self) -> None:
+        with self.client._bandwidth_args() as (args, env):
+            self.assertEqual((args, env), ([], None))
+
+    def test_private_rc_requires_auth(self) -> None:
+        self.client.bandwidth = BandwidthScheduler([(0, 1024.0)])
+        with self.client._bandwidth_args() as (args, env):
+            self.assertEqual(args[:2], ["--bwlimit", "1K"])
+            self.assertIn("--rc", args)
+            self.assertNotIn("--rc-no-auth", args)
+            assert env is not None
+            self.assertTrue(env["RCLONE_RC_USER"])
+            self.assertGreaterEqual(len(env["RCLONE_RC_PASS"]), 24)
+            self.assertNotIn(env["RCLONE_RC_PASS"], args)
+        with self.client._bandwidth_args() as (_, other):
+            assert other is not None
+            self.assertNotEqual(other["RCLONE_RC_PASS"], env["RCLONE_RC_PASS"])
+
+
+if __name__ == "__main__":
+    unittest.main()
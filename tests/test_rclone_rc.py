@@ -0,0 +1,135 @@
+"""RcloneRcClient 对接 src.fake_rcd 替身服务的测试。"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.fake_rcd import start_server
+from src.rclone_rc import RcloneRcClient
+from src.retry import UploadError
+
+
+class RcloneRcClientTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="rclone-rc-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.local = self.tmp / "local"
+        self.local.mkdir()
+        self.server, self.state, url = start_server(self.tmp / "remote")
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        env = {
+            "RCLONE_REMOTE": "r",
+            "RCLONE_RC_URL": url,
+            "RCLONE_RC_POLL_INTERVAL": "0.01",
+            "LISTING_CACHE_DB": "",
+            "REMOTE_INDEX_DIR": str(self.tmp / "index"),
+        }
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = RcloneRcClient()
+        self.addCleanup(self.client.close)
+
+    def _local_file(self, name: str, data: bytes = b"data") -> str:
+        path = self.local / name
+        path.write_bytes(data)
+        return str(path)
+
+    def test_upload_file(self) -> None:
+        self.client.upload_file(self._local_file("a.mkv", b"movie"), "/media/a.mkv")
+        self.assertEqual((self.tmp / "remote/r/media/a.mkv").read_bytes(), b"movie")
+        self.assertEqual(self.state.calls["operations/copyfile"], 1)
+        self.assertEqual([entry["Name"] for entry in self.client.list_directory("/media")], ["a.mkv"])
+
+    def test_upload_many(self) -> None:
+        pairs = [(self._local_file(f"{index}.mkv", bytes([index])), f"/media/{index}.mkv") for index in range(5)]
+        pairs.append((str(self.local / "missing.mkv"), "/media/missing.mkv"))
+        results = self.client.upload_many(pairs, transfers=2)
+        for local_path, _ in pairs[:5]:
+            self.assertIsNone(results[local_path])
+        self.assertIn("未找到文件", results[pairs[5][0]] or "")
+        self.assertEqual(sorted(path.name for path in (self.tmp / "remote/r/media").iterdir()), [f"{i}.mkv" for i in range(5)])
+        self.assertEqual(self.state.calls["operations/copyfile"], 5)
+
+    def test_job_error(self) -> None:
+        # 目标目录的位置是一个普通文件，替身服务的复制任务会失败
+        (self.tmp / "remote/r").mkdir(parents=True)
+        (self.tmp / "remote/r/media").write_text("not a directory")
+        with self.assertRaises(UploadError) as caught:
+            self.client.upload_file(self._local_file("a.mkv"), "/media/a.mkv")
+        self.assertIn("上传失败", str(caught.exception))
+        results = self.client.upload_many([(self._local_file("b.mkv"), "/media/b.mkv")])
+        self.assertIn("上传失败", results[str(self.local / "b.mkv")] or "")
+
+    def test_upload_many_retries_status_errors(self) -> None:
+        self.state.status_failures = 3
+        pairs = [(self._local_file(f"{index}.mkv"), f"/media/{index}.mkv") for index in range(3)]
+        results = self.client.upload_many(pairs, transfers=2)
+        self.assertEqual(results, {local_path: None for local_path, _ in pairs})
+
+    def test_upload_many_gives_up_after_repeated_status_errors(self) -> None:
+        self.state.status_failures = 1000
+        pairs = [(self._local_file(f"{index}.mkv"), f"/media/{index}.mkv") for index in range(3)]
+        results = self.client.upload_many(pairs, transfers=2)
+        self.assertEqual(set(results), {local_path for local_path, _ in pairs})
+        for error in results.values():
+            self.assertIn("无法获取上传任务状态", error or "")
+        # 第三个文件没有开始上传
+        self.assertEqual(self.state.calls["operations/copyfile"], 2)
+
+
+class RcdStartupTest(unittest.TestCase):
+    def test_early_exit_reports_stderr(self) -> None:
+        tmp = Path(tempfile.mkdtemp(prefix="rclone-rcd-exit-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        rclone = tmp / "rclone"
+        rclone.write_text("#!/bin/sh\necho 'Failed to start remote control: bind: address already in use' >&2\nexit 1\n")
+        rclone.chmod(rclone.stat().st_mode | stat.S_IXUSR)
+        env = {
+            "PATH": f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}",
+            "RCLONE_REMOTE": "r",
+            "RCLONE_RC_URL": "",
+            "LISTING_CACHE_DB": "",
+            "REMOTE_INDEX_DIR": str(tmp / "index"),
+        }
+        with mock.patch.dict(os.environ, env):
+            with self.assertRaises(RuntimeError) as caught:
+                RcloneRcClient()
+        self.assertIn("rclone rcd 启动失败", str(caught.exception))
+        self.assertIn("address already in use", str(caught.exception))
+
+    def test_private_rcd_requires_auth(self) -> None:
+        tmp = Path(tempfile.mkdtemp(prefix="rclone-rcd-auth-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        rclone = tmp / "rclone"
+        # 记录启动参数与认证环境变量后退出
+        rclone.write_text(f'#!/bin/sh\necho "$@" > {tmp}/args\necho "$RCLONE_RC_USER:$RCLONE_RC_PASS" > {tmp}/auth\nexit 1\n')
+        rclone.chmod(rclone.stat().st_mode | stat.S_IXUSR)
+        env = {
+            "PATH": f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}",
+            "RCLONE_REMOTE": "r",
+            "RCLONE_RC_URL": "",
+            "RCLONE_RC_USER": "",
+            "RCLONE_RC_PASS": "",
+            "LISTING_CACHE_DB": "",
+            "REMOTE_INDEX_DIR": str(tmp / "index"),
+        }
+        with mock.patch.dict(os.environ, env):
+            with self.assertRaises(RuntimeError):
+                RcloneRcClient()
+        self.assertNotIn("--rc-no-auth", (tmp / "args").read_text())
+        user, _, password = (tmp / "auth").read_text().strip().partition(":")
+        self.assertEqual(user, "uploader")
+        self.assertGreaterEqual(len(password), 24)
+        self.assertNotIn(password, (tmp / "args").read_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
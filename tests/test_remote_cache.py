@@ -0,0 +1,58 @@
+"""ListingCache 的测试。"""
+
+from __future__ import annotations
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from src.remote_cache import Listing, ListingCache, PersistentListingStore
+
+
+class ListingCacheAddTest(unittest.TestCase):
+    def _slow_cache(self, store: PersistentListingStore | None = None) -> ListingCache:
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+        def fetch(remote: str, directory: str) -> Listing:
+            # 模拟列出开始时远端还没有刚上传的文件
+            self.started.set()
+            self.release.wait(5)
+            return {"old.mkv": 1}
+
+        return ListingCache(fetch, store)
+
+    def _add_during_fetch(self, cache: ListingCache) -> Listing:
+        result: list = []
+        reader = threading.Thread(target=lambda: result.append(cache.get("r", "/media")))
+        reader.start()
+        self.assertTrue(self.started.wait(5))
+        cache.add("r", "/media", "new.mkv", 2)
+        self.release.set()
+        reader.join(5)
+        return result[0]
+
+    def test_add_during_fetch_is_kept(self) -> None:
+        cache = self._slow_cache()
+        listing = self._add_during_fetch(cache)
+        self.assertEqual(listing, {"old.mkv": 1, "new.mkv": 2})
+        self.assertEqual(cache.get("r", "/media"), {"old.mkv": 1, "new.mkv": 2})
+
+    def test_add_during_fetch_reaches_store(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PersistentListingStore(Path(tmp) / "listing.db", 600)
+            cache = self._slow_cache(store)
+            self._add_during_fetch(cache)
+            self.assertEqual(store.load("r", "/media"), {"old.mkv": 1, "new.mkv": 2})
+            cache.close()
+
+    def test_add_to_unknown_directory_is_ignored(self) -> None:
+        cache = ListingCache(lambda remote, directory: {})
+        cache.add("r", "/media", "new.mkv", 2)
+        self.assertIsNone(cache.peek("r", "/media"))
+        self.assertEqual(cache.get("r", "/media"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""RemotePathIndex 的测试。"""
+
+from __future__ import annotations
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.remote_index import RemotePathIndex, write_index
+
+
+class RemotePathIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="remote-index-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = self.tmp / "index" / "r.idx"
+
+    def open_index(self) -> RemotePathIndex:
+        index = RemotePathIndex(self.path)
+        self.addCleanup(index.close)
+        return index
+
+    def test_lookup(self) -> None:
+        entries = [(f"/media/show/e{number:05d}.mkv", number) for number in range(5000)]
+        entries += [("/media/dir.mkv", -1), ("/media/show/e00001.mkv", 1)]
+        self.assertEqual(write_index(self.path, "r", "/media", entries), 5001)
+        index = self.open_index()
+        self.assertEqual(index.count, 5001)
+        self.assertEqual(index.lookup("r", "/media/show/e04321.mkv"), 4321)
+        # 远端不报告大小的条目原样保留 -1
+        self.assertEqual(index.lookup("r", "/media/dir.mkv"), -1)
+        self.assertIsNone(index.lookup("r", "/media/show/e99999.mkv"))
+        self.assertIsNone(index.lookup("other", "/media/show/e00001.mkv"))
+        # Bloom 过滤器约 1% 误判，误判后二分查找仍然找不到
+        misses = sum(index._maybe_contains(index_key) for index_key in range(1 << 40, (1 << 40) + 2000))
+        self.assertLess(misses, 100)
+
+    def test_empty_index_and_covers(self) -> None:
+        write_index(self.path, "r", "/media", [])
+        index = self.open_index()
+        self.assertIsNone(index.lookup("r", "/media/a.mkv"))
+        self.assertTrue(index.covers("/media/a.mkv"))
+        self.assertTrue(index.covers("/media"))
+        self.assertFalse(index.covers("/media2/a.mkv"))
+        self.assertLess(index.age, 60)
+
+    def test_rewrite_replaces_atomically(self) -> None:
+        write_index(self.path, "r", "/", [("/a.mkv", 1)])
+        old = self.open_index()
+        write_index(self.path, "r", "/", [("/b.mkv", 2)])
+        # 已经打开的旧索引不受影响
+        self.assertEqual(old.lookup("r", "/a.mkv"), 1)
+        new = self.open_index()
+        self.assertIsNone(new.lookup("r", "/a.mkv"))
+        self.assertEqual(new.lookup("r", "/b.mkv"), 2)
+        self.assertTrue(new.covers("/anything"))
+
+    def test_rejects_foreign_file(self) -> None:
+        self.path.parent.mkdir(parents=True)
+        self.path.write_bytes(b"not an index at all, just some bytes here")
+        with self.assertRaises(ValueError):
+            RemotePathIndex(self.path)
+        self.path.write_bytes(b"short")
+        with self.assertRaises(ValueError):
+            RemotePathIndex(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
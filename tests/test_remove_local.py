@@ -0,0 +1,60 @@
+"""remove_local 删除前核对远端文件的测试。"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest import mock
+
+from remove_local import _remove_uploaded
+from src.rclone_client import RcloneClient
+
+
+class RemoveUploadedTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="remove-local-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        env = {"RCLONE_REMOTE": "r", "LISTING_CACHE_DB": "", "REMOTE_INDEX_DIR": str(self.tmp / "index")}
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = RcloneClient()
+        self.addCleanup(self.client.close)
+        self.remote: Dict[str, List[Dict[str, Any]]] = {}
+        self.client.list_directory = lambda directory, **kwargs: self.remote.get(directory, [])  # type: ignore[method-assign]
+        self.local = self.tmp / "local"
+        (self.local / "show").mkdir(parents=True)
+
+    def local_file(self, relative: str, size: int) -> Path:
+        path = self.local / relative
+        path.write_bytes(b"x" * size)
+        return path
+
+    def test_removes_only_confirmed_files(self) -> None:
+        same = self.local_file("show/same.mkv", 10)
+        unknown = self.local_file("show/unknown.mkv", 10)
+        other = self.local_file("show/other.mkv", 10)
+        missing = self.local_file("show/missing.mkv", 10)
+        self.remote["/up/show"] = [
+            {"Name": "same.mkv", "Size": 10},
+            # 远端没有报告大小时不能当作大小一致
+            {"Name": "unknown.mkv", "Size": -1},
+            {"Name": "other.mkv", "Size": 9},
+        ]
+        self.assertEqual(_remove_uploaded(self.client, [(str(self.local), "/up")]), 0)
+        self.assertFalse(same.exists())
+        for path in (unknown, other, missing):
+            self.assertTrue(path.exists(), path)
+
+    def test_unknown_size_without_expected_size(self) -> None:
+        self.remote["/up"] = [{"Name": "a.mkv", "Size": -1}]
+        self.assertTrue(self.client.remote_file_exists("/up/a.mkv"))
+        self.assertFalse(self.client.remote_file_exists("/up/a.mkv", size=10))
+
+
+if __name__ == "__main__":
+    unittest.main()
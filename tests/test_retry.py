@@ -0,0 +1,128 @@
+"""错误分类、重试与熔断器的测试。"""
+
+from __future__ import annotations
+
+import io
+import unittest
+from contextlib import redirect_stdout
+from typing import List
+from unittest import mock
+
+from src.retry import (
+    AUTH,
+    PARKED,
+    PERMANENT,
+    RATE_LIMITED,
+    TRANSIENT,
+    CircuitBreaker,
+    RemoteParkedError,
+    RetryPolicy,
+    UploadError,
+    call_with_retry,
+    classify_http,
+    classify_rclone,
+    error_kind,
+    rclone_error_text,
+)
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_rclone_error_text_drops_paths(self) -> None:
+        stderr = (
+            "2024/01/01 12:00:00 ERROR : TV/Forbidden Network 404/a.mkv: "
+            "Failed to copy: failed to open source object: connection reset by peer\n"
+            "NOTICE: \n"
+        )
+        self.assertEqual(rclone_error_text(stderr), "failed to open source object: connection reset by peer")
+        self.assertEqual(error_kind(stderr), TRANSIENT)
+
+    def test_classify_rclone(self) -> None:
+        # 退出码 8：达到 --max-transfer 上限
+        self.assertEqual(classify_rclone(8, "ERROR : a.mkv: Failed to copy: something"), PARKED)
+        self.assertEqual(classify_rclone(7, "fatal error"), AUTH)
+        self.assertEqual(classify_rclone(4, "ERROR : Unauthorized/a.mkv: Failed to copy: object not found"), PERMANENT)
+        # 文本中的限流信息优先于退出码
+        self.assertEqual(classify_rclone(6, "ERROR : a.mkv: Failed to copy: 429 Too Many Requests"), RATE_LIMITED)
+        self.assertEqual(classify_rclone(1, "ERROR : a.mkv: Failed to copy: max transfer limit reached"), PARKED)
+        self.assertEqual(classify_rclone(1, ""), TRANSIENT)
+
+    def test_classify_http(self) -> None:
+        self.assertEqual(classify_http(429), RATE_LIMITED)
+        self.assertEqual(classify_http(403, "forbidden"), AUTH)
+        self.assertEqual(classify_http(502), TRANSIENT)
+        # 4xx 中的超时字样也不会重试
+        self.assertEqual(classify_http(400, "request timeout"), PERMANENT)
+        self.assertEqual(classify_http(None, "token is invalidated"), AUTH)
+
+    def test_error_kind(self) -> None:
+        self.assertEqual(error_kind(UploadError("x", AUTH)), AUTH)
+        self.assertEqual(error_kind(FileNotFoundError("a.mkv")), PERMANENT)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.breaker = CircuitBreaker(threshold=2, cooldown=60, clock=lambda: self.now)
+        self._stdout = redirect_stdout(io.StringIO())
+        self._stdout.__enter__()
+        self.addCleanup(self._stdout.__exit__, None, None, None)
+
+    def test_opens_after_threshold(self) -> None:
+        self.breaker.record_failure("r", TRANSIENT)
+        self.breaker.check("r")
+        self.breaker.record_failure("r", TRANSIENT)
+        with self.assertRaises(RemoteParkedError):
+            self.breaker.check("r")
+        # 其他远端不受影响
+        self.breaker.check("other")
+
+    def test_permanent_and_parked_do_not_count(self) -> None:
+        self.breaker.record_failure("r", TRANSIENT)
+        self.breaker.record_failure("r", PERMANENT)
+        self.breaker.record_failure("r", TRANSIENT)
+        self.breaker.record_failure("r", PARKED)
+        self.breaker.check("r")
+
+    def test_half_open_allows_one_probe(self) -> None:
+        self.breaker.record_failure("r", AUTH)
+        self.now = 61
+        self.breaker.check("r")
+        # 试探请求进行中，其他请求仍被拒绝
+        with self.assertRaises(RemoteParkedError):
+            self.breaker.check("r")
+        self.breaker.record_failure("r", TRANSIENT)
+        with self.assertRaises(RemoteParkedError):
+            self.breaker.check("r")
+        self.now = 122
+        self.breaker.check("r")
+        self.breaker.record_success("r")
+        self.breaker.check("r")
+        self.breaker.check("r")
+
+
+class CallWithRetryTest(unittest.TestCase):
+    def test_retries_transient_then_succeeds(self) -> None:
+        errors: List[str] = []
+        attempts = iter([UploadError("timeout"), UploadError("429", RATE_LIMITED), "ok"])
+
+        def upload() -> str:
+            result = next(attempts)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with mock.patch("src.retry.time.sleep"), redirect_stdout(io.StringIO()):
+            result = call_with_retry(upload, remote="r", policy=RetryPolicy(retries=2), on_error=errors.append)
+        self.assertEqual(result, "ok")
+        self.assertEqual(errors, [TRANSIENT, RATE_LIMITED])
+
+    def test_permanent_is_not_retried(self) -> None:
+        upload = mock.Mock(side_effect=FileNotFoundError("a.mkv"))
+        with self.assertRaises(UploadError) as caught:
+            call_with_retry(upload, remote="r", policy=RetryPolicy(retries=3))
+        self.assertEqual(caught.exception.kind, PERMANENT)
+        self.assertEqual(upload.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""run.py 守护模式辅助函数的测试。"""
+
+from __future__ import annotations
+
+import io
+import threading
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+from typing import List
+from unittest import mock
+
+import run
+from src.inotify import READY, Change
+
+
+class _FlakyWatcher:
+    """第一次 poll 抛出异常，之后上报一个就绪文件并让循环结束。"""
+
+    def __init__(self, stop: threading.Event) -> None:
+        self.stop = stop
+        self.calls = 0
+
+    def poll(self, timeout: float) -> List[Change]:
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError("read failed")
+        self.stop.set()
+        return [Change(READY, Path("/data/a/new.mkv"))]
+
+
+class WatchLoopTest(unittest.TestCase):
+    def test_error_keeps_watching_and_requests_rescan(self) -> None:
+        pending = run._PendingFiles([run._Mapping(Path("/data/a"), "r", "/up/a")])
+        stop = threading.Event()
+        watcher = _FlakyWatcher(stop)
+        with mock.patch.object(run, "_DAEMON_ERROR_PAUSE", 0), redirect_stderr(io.StringIO()) as stderr:
+            run._watch_loop(watcher, pending, stop)  # type: ignore[arg-type]
+        self.assertIn("read failed", stderr.getvalue())
+        self.assertEqual(watcher.calls, 2)
+        self.assertTrue(pending.take_rescan())
+        pending.apply([Change(READY, Path("/data/a/later.mkv"))])
+        self.assertEqual([path for path, _ in pending.take(0)], [Path("/data/a/later.mkv")])
+
+
+if __name__ == "__main__":
+    unittest.main()
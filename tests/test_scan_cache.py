@@ -0,0 +1,90 @@
+"""DirectoryCache 与带缓存扫描的测试。"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List
+
+from src.localfile import iter_file_records
+from src.scan_cache import DirectoryCache
+
+# 早于 mtime 不可靠窗口的时间戳
+_OLD = 1_000_000_000
+
+
+class DirectoryCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="scan-cache-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.root = self.tmp / "data"
+        self.db_path = self.tmp / "state" / "scan.db"
+        self.cache = DirectoryCache(self.db_path)
+        self.addCleanup(lambda: self.cache.close())
+
+    def make(self, relative: str) -> Path:
+        path = self.root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+        return path
+
+    def age_directories(self) -> None:
+        for current, _, _ in os.walk(self.root):
+            os.utime(current, (_OLD, _OLD))
+
+    def scan(self) -> List[str]:
+        self.cache.reset_stats()
+        return [record.relative for record in iter_file_records(self.root, self.cache)]
+
+    def test_unchanged_directories_are_skipped(self) -> None:
+        for relative in ("a.mkv", "show/e01.mkv", "show/s1/e02.mkv"):
+            self.make(relative)
+        self.age_directories()
+        expected = ["a.mkv", "show/e01.mkv", "show/s1/e02.mkv"]
+        self.assertEqual(self.scan(), expected)
+        self.assertEqual((self.cache.read, self.cache.skipped), (3, 0))
+        self.cache.close()
+        self.cache = DirectoryCache(self.db_path)
+        self.assertEqual(self.scan(), expected)
+        self.assertEqual((self.cache.read, self.cache.skipped), (0, 3))
+
+    def test_recent_directories_are_read_again(self) -> None:
+        self.make("show/e01.mkv")
+        self.age_directories()
+        self.scan()
+        # 目录刚刚变化，落在 mtime 不可靠的窗口内：不缓存，下次仍读取
+        self.make("show/e02.mkv")
+        self.assertEqual(self.scan(), ["show/e01.mkv", "show/e02.mkv"])
+        self.assertEqual((self.cache.read, self.cache.skipped), (1, 1))
+        self.make("show/e03.mkv")
+        self.assertEqual(self.scan(), ["show/e01.mkv", "show/e02.mkv", "show/e03.mkv"])
+        self.assertEqual(self.cache.read, 1)
+
+    def test_removed_subtree_is_forgotten(self) -> None:
+        for relative in ("show/s1/e01.mkv", "show-x/e01.mkv", "show0/e01.mkv"):
+            self.make(relative)
+        self.age_directories()
+        self.scan()
+        shutil.rmtree(self.root / "show")
+        self.assertEqual(self.scan(), ["show-x/e01.mkv", "show0/e01.mkv"])
+        self.assertEqual(self.cache.lookup_subdirs(self.root / "show"), [])
+        self.assertIsNone(self.cache.lookup(self.root / "show" / "s1", _OLD * 10**9, 0))
+        # 名字相近的兄弟目录不受影响
+        for sibling in ("show-x", "show0"):
+            stat = (self.root / sibling).stat()
+            self.assertIsNotNone(self.cache.lookup(self.root / sibling, stat.st_mtime_ns, stat.st_ino))
+
+    def test_forget_tree(self) -> None:
+        names = ("tv", "tv/a", "tv/a/b", "tv-old", "tv0")
+        for name in names:
+            self.cache.store(Path("/data") / name, _OLD, 1, [], [])
+        self.cache.forget_tree(Path("/data/tv"))
+        remaining = [name for name in names if self.cache.lookup(Path("/data") / name, _OLD, 1) is not None]
+        self.assertEqual(remaining, ["tv-old", "tv0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
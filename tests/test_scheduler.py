@@ -0,0 +1,73 @@
+"""上传顺序调度的测试。"""
+
+from __future__ import annotations
+
+import unittest
+from pathlib import Path
+from typing import List
+
+from src.scheduler import UploadScheduler, parse_policies, parse_priorities
+from src.uploader import UploadTask
+
+
+def _task(name: str, size: int, *, base: str = "/data/tv", mtime_ns: int = 0) -> UploadTask:
+    return UploadTask(Path(base) / name, "r", f"/up/{name}", base_path=Path(base), size=size, mtime_ns=mtime_ns)
+
+
+def _names(tasks: List[UploadTask]) -> List[str]:
+    return [task.local_path.name for task in tasks]
+
+
+class ParseTest(unittest.TestCase):
+    def test_policies(self) -> None:
+        self.assertEqual(parse_policies(" Mapping, sidecars;small,mapping "), ["mapping", "sidecars", "small"])
+        self.assertEqual(parse_policies(""), [])
+        with self.assertRaises(ValueError):
+            parse_policies("largest")
+
+    def test_priorities(self) -> None:
+        self.assertEqual(
+            parse_priorities("/data/tv=10;\n/data/a=b=1"),
+            {Path("/data/tv"): 10, Path("/data/a=b"): 1},
+        )
+        for raw in ("/data/tv", "/data/tv=high", "=3"):
+            with self.assertRaises(ValueError):
+                parse_priorities(raw)
+
+
+class UploadSchedulerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tasks = [
+            _task("movie.mkv", 5000, base="/data/movies", mtime_ns=1),
+            _task("e01.mkv", 3000, mtime_ns=3),
+            _task("e01.nfo", 10, mtime_ns=4),
+            _task("poster.JPG", 200, base="/data/movies", mtime_ns=2),
+            _task("e01.srt", 50, mtime_ns=5),
+        ]
+
+    def test_combined_policies(self) -> None:
+        scheduler = UploadScheduler(
+            parse_policies("mapping,sidecars,small"), priorities={Path("/data/tv"): 10, Path("/data/movies"): 1}
+        )
+        self.assertEqual(
+            _names(list(scheduler.order(self.tasks))),
+            ["e01.nfo", "e01.srt", "e01.mkv", "poster.JPG", "movie.mkv"],
+        )
+
+    def test_oldest_and_stable_ties(self) -> None:
+        self.assertEqual(
+            _names(list(UploadScheduler(["oldest"]).order(self.tasks))),
+            ["movie.mkv", "poster.JPG", "e01.mkv", "e01.nfo", "e01.srt"],
+        )
+        # 没有策略时保持扫描顺序
+        self.assertEqual(list(UploadScheduler([]).order(self.tasks)), self.tasks)
+
+    def test_window_limits_lookahead(self) -> None:
+        ordered = list(UploadScheduler(["small"], window=2).order(self.tasks))
+        # 窗口为 2：读入第三个任务后才放出当时最小的一个
+        self.assertEqual(_names(ordered), ["e01.nfo", "poster.JPG", "e01.srt", "e01.mkv", "movie.mkv"])
+        self.assertEqual(sorted(_names(ordered)), sorted(_names(self.tasks)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""文件稳定性检查的测试。"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from src.localfile import file_record
+from src.stability import OpenFileTable, StabilityGate
+
+# 打开文件后通知父进程并等待被终止
+_HOLD_OPEN = "import sys, time; handle = open(sys.argv[1], sys.argv[2]); print('ready', flush=True); time.sleep(60)"
+
+
+@unittest.skipUnless(Path("/proc/self/fdinfo").is_dir(), "需要 Linux /proc")
+class StabilityGateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="stability-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = self.tmp / "a.mkv"
+        self.path.write_bytes(b"data")
+        os.utime(self.path, (time.time() - 120, time.time() - 120))
+
+    def hold_open(self, mode: str) -> subprocess.Popen:
+        process = subprocess.Popen(
+            [sys.executable, "-c", _HOLD_OPEN, str(self.path), mode], stdout=subprocess.PIPE, text=True
+        )
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        assert process.stdout is not None
+        self.addCleanup(process.stdout.close)
+        self.assertEqual(process.stdout.readline().strip(), "ready")
+        return process
+
+    def test_writer_is_detected(self) -> None:
+        writer = self.hold_open("ab")
+        record = file_record(self.path, self.tmp)
+        self.assertEqual(OpenFileTable().writer(record.dev, record.inode), writer.pid)
+        gate = StabilityGate(60)
+        self.assertIn(str(writer.pid), gate.unstable_reason(record) or "")
+        self.assertEqual(gate.skipped, 1)
+
+    def test_readers_and_own_process_are_ignored(self) -> None:
+        self.hold_open("rb")
+        with open(self.path, "ab"):
+            record = file_record(self.path, self.tmp)
+            self.assertIsNone(OpenFileTable().writer(record.dev, record.inode))
+            self.assertIsNone(StabilityGate(60).unstable_reason(record))
+
+    def test_recent_mtime_and_disabled_gate(self) -> None:
+        os.utime(self.path)
+        record = file_record(self.path, self.tmp)
+        self.assertIn("稳定窗口", StabilityGate(60, check_open=False).unstable_reason(record) or "")
+        gate = StabilityGate(0, check_open=False)
+        self.assertFalse(gate.enabled)
+        self.assertIsNone(gate.unstable_reason(record))
+
+
+if __name__ == "__main__":
+    unittest.main()
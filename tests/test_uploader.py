@@ -0,0 +1,70 @@
+"""UploadPool 的测试。"""
+
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from pathlib import Path
+from typing import List
+
+from src.uploader import UploadPool, UploadResult, UploadTask
+
+
+def _task(index: int, remote: str = "r") -> UploadTask:
+    return UploadTask(Path(f"/local/{index}.mkv"), remote, f"/media/{index}.mkv", size=index)
+
+
+class SetThrottleTest(unittest.TestCase):
+    def test_zero_pauses_dispatch_until_released(self) -> None:
+        started: List[UploadTask] = []
+        pool = UploadPool(started.append, workers=2)
+        pool.set_throttle(0)
+        results: List[UploadResult] = []
+        runner = threading.Thread(target=lambda: results.extend(pool.run(_task(index) for index in range(4))))
+        runner.start()
+        time.sleep(0.2)
+        self.assertEqual(started, [])
+        pool.set_throttle(1.0)
+        runner.join(timeout=5)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual([result.task for result in results], [_task(index) for index in range(4)])
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_pause_lets_running_uploads_finish(self) -> None:
+        release = threading.Event()
+        started: List[UploadTask] = []
+
+        def upload(task: UploadTask) -> None:
+            started.append(task)
+            release.wait(5)
+
+        pool = UploadPool(upload, workers=2)
+        results: List[UploadResult] = []
+        runner = threading.Thread(target=lambda: results.extend(pool.run(_task(index) for index in range(4))))
+        runner.start()
+        deadline = time.monotonic() + 5
+        while len(started) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        pool.set_throttle(0)
+        release.set()
+        time.sleep(0.2)
+        # 暂停前已开始的两个完成，其余两个不再派发
+        self.assertEqual(len(started), 2)
+        pool.set_throttle(1.0)
+        runner.join(timeout=5)
+        self.assertEqual(len(started), 4)
+        self.assertEqual(len(results), 4)
+
+    def test_fraction_scales_remote_limits(self) -> None:
+        pool = UploadPool(lambda task: None, workers=8, remote_limits={"slow": 2})
+        pool.set_throttle(0.5)
+        self.assertEqual(pool.remote_limit("r"), 4)
+        self.assertEqual(pool.remote_limit("slow"), 1)
+        pool.set_throttle(0.01)
+        # 未暂停时每个远端至少保留 1 个并发
+        self.assertEqual(pool.remote_limit("r"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""RemoteVerifier 的测试。"""
+
+from __future__ import annotations
+
+import hashlib
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List
+
+from src.localfile import HashCache
+from src.uploader import UploadOutcome, UploadTask
+from src.verify import RemoteVerifier
+
+
+class _Listing:
+    """按目录返回固定 lsjson 条目的远端替身。"""
+
+    def __init__(self, entries: Dict[str, List[Dict[str, Any]]]) -> None:
+        self.entries = entries
+        self.calls: List[str] = []
+
+    def list_directory(self, directory: str, *, remote: str | None = None, hashes: bool = False) -> List[Dict[str, Any]]:
+        self.calls.append(directory)
+        return self.entries.get(directory, [])
+
+
+class RemoteVerifierTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = Path(tempfile.mkdtemp(prefix="verify-test-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.cache = HashCache(None, use_xattr=False)
+
+    def task(self, name: str, data: bytes) -> UploadTask:
+        path = self.tmp / name
+        path.write_bytes(data)
+        return UploadTask(path, "r", f"/media/{name}", size=len(data))
+
+    def verifier(self, entries: List[Dict[str, Any]], mode: str = "hash") -> RemoteVerifier:
+        self.remote = _Listing({"/media": entries})
+        return RemoteVerifier(self.remote, self.cache, mode=mode)  # type: ignore[arg-type]
+
+    def test_size_and_hash(self) -> None:
+        tasks = [self.task(name, name.encode()) for name in ("a.mkv", "b.mkv", "c.mkv", "d.mkv")]
+        verifier = self.verifier([
+            {"Name": "a.mkv", "Size": 5, "Hashes": {"MD5": hashlib.md5(b"a.mkv").hexdigest().upper()}},
+            {"Name": "b.mkv", "Size": 5, "Hashes": {"md5": "0" * 32}},
+            {"Name": "c.mkv", "Size": 4},
+        ])
+        errors = verifier.check_directory("r", "/media", tasks)
+        self.assertIsNone(errors[0])
+        self.assertIn("md5", errors[1] or "")
+        self.assertIn("大小", errors[2] or "")
+        self.assertIn("未找到", errors[3] or "")
+        self.assertEqual((verifier.listings, verifier.hashed, verifier.mismatched), (1, 2, 3))
+
+    def test_unknown_remote_size_is_a_mismatch(self) -> None:
+        task = self.task("a.mkv", b"data")
+        for mode in ("size", "hash"):
+            verifier = self.verifier([{"Name": "a.mkv", "Size": -1}], mode=mode)
+            self.assertIn("未提供文件大小", verifier.check_directory("r", "/media", [task])[0] or "")
+
+    def test_size_only_without_remote_hash(self) -> None:
+        verifier = self.verifier([{"Name": "a.mkv", "Size": 4, "Hashes": {}}])
+        self.assertEqual(verifier.check_directory("r", "/media", [self.task("a.mkv", b"data")]), [None])
+        self.assertEqual(verifier.size_only, 1)
+
+    def test_transform_groups_directories(self) -> None:
+        tasks = [self.task("a.mkv", b"data"), self.task("b.mkv", b"data")]
+        verifier = self.verifier([{"Name": "a.mkv", "Size": 4}], mode="size")
+        outcomes = list(verifier.transform(iter([UploadOutcome(task, 0.0) for task in tasks])))
+        self.assertEqual([outcome.ok for outcome in outcomes], [True, False])
+        self.assertEqual(self.remote.calls, ["/media"])
+
+
+if __name__ == "__main__":
+    unittest.main()